@@ -0,0 +1,370 @@
+"""
+字幕排版、分句、转录结果序列化与编码流程的基准测试
+
+    python bench/run_bench.py                       # 运行并与 bench/baseline.json 比较
+    python bench/run_bench.py --save-baseline       # 把本次结果保存为基线
+    python bench/run_bench.py --only split,ssa --sizes 10,1000
+
+每项输出吞吐量（条/秒）、峰值内存（tracemalloc，编码为该次编码子进程及其 ffmpeg 的最大 RSS）
+与编码速度（视频时长/耗时）；吞吐量下降或内存上升超过阈值时以非零状态退出。
+基线与机器相关，应在同一台机器上生成和比较。
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import subprocess
+import platform
+import tempfile
+import tracemalloc
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, "..", "src"))
+sys.path.insert(0, BENCH_DIR)
+
+import synthetic  # noqa: E402
+
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, "baseline.json")
+DEFAULT_SIZES = (10, 1000, 10000, 100000)
+LANGUAGES = ("latin", "cjk", "mixed")
+# 编码基准：(宽, 高, 时长秒)
+VIDEOS = ((640, 360, 10), (1280, 720, 10), (1920, 1080, 10), (1280, 720, 60))
+
+
+def measure(func, make_args, repeat):
+    """
+    func(*make_args()) 执行 repeat 次取最快耗时；
+    另执行一次统计 tracemalloc 峰值（tracemalloc 会拖慢执行，不与计时混在一起）。
+    make_args 在计时外调用，每次提供新的输入（被测函数可能修改输入）。
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        args = make_args()
+        start = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - start)
+
+    args = make_args()
+    tracemalloc.start()
+    try:
+        func(*args)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return best, peak
+
+
+def bench_split(sizes, repeat, work_dir):
+    from subtitle import split_text_with_punctuation_check
+
+    results = {}
+    for language in LANGUAGES:
+        for size in sizes:
+            texts = [u["text"] for u in synthetic.make_utterances(size, language)]
+
+            def run(items):
+                return [split_text_with_punctuation_check(text, 30) for text in items]
+
+            elapsed, peak = measure(run, lambda: (texts,), repeat)
+            results[f"split_text/{language}/{size}"] = _result(size, elapsed, peak)
+    return results
+
+
+def bench_oversize(sizes, repeat, work_dir):
+    from subtitle import handle_oversize_sentences
+
+    results = {}
+    for language in LANGUAGES:
+        for size in sizes:
+            data = synthetic.make_subtitle_data(synthetic.make_utterances(size, language))
+            elapsed, peak = measure(
+                handle_oversize_sentences,
+                lambda: ([dict(item) for item in data], 1280, 36),
+                repeat,
+            )
+            results[f"oversize/{language}/{size}"] = _result(size, elapsed, peak)
+    return results
+
+
+def bench_ssa(sizes, repeat, work_dir):
+    from subtitle import create_ssa_subtitles
+
+    output_file = os.path.join(work_dir, "bench.ssa")
+    results = {}
+    for language in LANGUAGES:
+        for size in sizes:
+            data = synthetic.make_subtitle_data(synthetic.make_utterances(size, language))
+            elapsed, peak = _quiet(
+                measure,
+                create_ssa_subtitles,
+                lambda: ([dict(item) for item in data], output_file, 1280, 720),
+                repeat,
+            )
+            results[f"ssa/{language}/{size}"] = _result(size, elapsed, peak)
+    return results
+
+
+def _json_response(utterances):
+    # 与 AssemblyAI 的 json_response 结构相同：顶层 words 为各段话单词的拼接
+    return {
+        "id": "bench",
+        "status": "completed",
+        "text": " ".join(u["text"] for u in utterances),
+        "utterances": utterances,
+        "words": [w for u in utterances for w in u["words"]],
+    }
+
+
+def bench_sentences(sizes, repeat, work_dir):
+    # 与服务相同的路径：构建列式单词表后按下标区间分句
+    from word_table import TranscriptTable
+
+    results = {}
+    for language in LANGUAGES:
+        for size in sizes:
+            json_response = _json_response(synthetic.make_utterances(size, language))
+
+            def run(response):
+                table = TranscriptTable.from_json_response(response)
+                return list(table.iter_sentences())
+
+            elapsed, peak = measure(run, lambda: (json_response,), repeat)
+            results[f"sentences/{language}/{size}"] = _result(size, elapsed, peak)
+    return results
+
+
+def bench_json(sizes, repeat, work_dir):
+    # /transcribe 的响应生成：构建单词表、分句并逐块输出 JSON
+    from word_table import TranscriptTable
+
+    results = {}
+    for language in LANGUAGES:
+        for size in sizes:
+            json_response = _json_response(synthetic.make_utterances(size, language))
+
+            def run(response):
+                return "".join(TranscriptTable.from_json_response(response).iter_json())
+
+            elapsed, peak = measure(run, lambda: (json_response,), repeat)
+            results[f"json/{language}/{size}"] = _result(size, elapsed, peak)
+    return results
+
+
+def bench_encode(sizes, repeat, work_dir):
+    if shutil.which("ffmpeg") is None:
+        print("未找到 ffmpeg，跳过编码基准")
+        return {}
+
+    video_dir = os.path.join(work_dir, "videos")
+    results = {}
+    for width, height, duration in VIDEOS:
+        video_path = synthetic.make_video(video_dir, width, height, duration)
+        utterances = synthetic.make_utterances(max(1, duration // 3), "mixed")
+        # 时间轴压缩到视频时长内
+        scale = duration * 1000 / max(u["end"] for u in utterances)
+        data = [
+            dict(item, start=int(item["start"] * scale), end=int(item["end"] * scale))
+            for item in synthetic.make_subtitle_data(utterances)
+        ]
+        data_path = os.path.join(video_dir, f"subtitles_{width}x{height}_{duration}s.json")
+        with open(data_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        best = float("inf")
+        max_rss = 0
+        for _ in range(repeat):
+            temp_dir = tempfile.mkdtemp(dir=work_dir)
+            try:
+                elapsed, peak = _run_encode(video_path, data_path, temp_dir)
+            finally:
+                shutil.rmtree(temp_dir, ignore_errors=True)
+            best = min(best, elapsed)
+            max_rss = max(max_rss, peak)
+        results[f"encode/{width}x{height}/{duration}s"] = {
+            "items": duration,
+            "seconds": round(best, 4),
+            "throughput": round(duration / best, 3),
+            "peak_bytes": max_rss,
+            "speed_ratio": round(duration / best, 3),
+        }
+    return results
+
+
+def _run_encode(video_path, data_path, temp_dir):
+    """
+    在独立的子进程中编码一次，返回 (耗时, 峰值 RSS 字节数)。
+    RUSAGE_CHILDREN 是此前所有子进程中的最大值，后面较小的视频会沿用最大视频的峰值；
+    os.wait4 返回的是该子进程（含其 ffmpeg 子进程）自身的峰值。
+    """
+    proc = subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), "--encode-once", video_path, data_path, temp_dir],
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    output = proc.stdout.read()
+    proc.stdout.close()
+    _, status, usage = os.wait4(proc.pid, 0)
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    if proc.returncode != 0:
+        raise RuntimeError(f"编码失败（退出码 {proc.returncode}）: {video_path}")
+    # ru_maxrss 在 Linux 上单位为 KB，macOS 上为字节
+    max_rss = usage.ru_maxrss
+    if platform.system() != "Darwin":
+        max_rss *= 1024
+    return float(output.strip().splitlines()[-1]), max_rss
+
+
+def encode_once(video_path, data_path, temp_dir):
+    """--encode-once 子进程入口：单进程编码一次，输出耗时（秒）"""
+    from embed import SubtitleEmbed
+
+    with open(data_path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    start = time.perf_counter()
+    _quiet(
+        SubtitleEmbed().embed,
+        video_path,
+        data,
+        segments=1,
+        encoding={"profile": "fast"},
+        temp_dir=temp_dir,
+    )
+    print(time.perf_counter() - start)
+
+
+BENCHMARKS = {
+    "split": bench_split,
+    "oversize": bench_oversize,
+    "ssa": bench_ssa,
+    "sentences": bench_sentences,
+    "json": bench_json,
+    "encode": bench_encode,
+}
+
+
+def _result(items, elapsed, peak):
+    return {
+        "items": items,
+        "seconds": round(elapsed, 6),
+        "throughput": round(items / elapsed, 1) if elapsed > 0 else None,
+        "peak_bytes": peak,
+    }
+
+
+def _quiet(func, *args, **kwargs):
+    # 被测函数会打印进度日志，基准输出中不需要
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, "w")
+    try:
+        return func(*args, **kwargs)
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+
+def compare(results, baseline, tolerance):
+    """返回退化项列表 [(名称, 指标, 基线值, 本次值), ...]"""
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        if base.get("throughput") and result.get("throughput") is not None:
+            if result["throughput"] < base["throughput"] * (1 - tolerance):
+                regressions.append((name, "throughput", base["throughput"], result["throughput"]))
+        # 内存差异小于 1 MiB 时视为噪声
+        peak_growth = result["peak_bytes"] - base.get("peak_bytes", 0)
+        if base.get("peak_bytes") and peak_growth > max(base["peak_bytes"] * tolerance, 1024**2):
+            regressions.append((name, "peak_bytes", base["peak_bytes"], result["peak_bytes"]))
+    return regressions
+
+
+def print_table(results, baseline):
+    print(f"{'基准':<32} {'吞吐量/s':>12} {'相对基线':>9} {'峰值内存':>12} {'耗时(s)':>10}")
+    for name, result in results.items():
+        base = baseline.get(name, {})
+        ratio = ""
+        if base.get("throughput") and result.get("throughput"):
+            ratio = f"{result['throughput'] / base['throughput']:.2f}x"
+        print(
+            f"{name:<32} {result['throughput'] or 0:>12,.1f} {ratio:>9} "
+            f"{result['peak_bytes'] / 1024**2:>10.1f}MB {result['seconds']:>10.4f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="字幕排版、分句与编码流程基准测试")
+    parser.add_argument("--only", help=f"逗号分隔的基准名称，可选: {','.join(BENCHMARKS)}")
+    parser.add_argument(
+        "--sizes",
+        default=",".join(map(str, DEFAULT_SIZES)),
+        help="合成转录的段数，逗号分隔 (默认: 10,1000,10000,100000)",
+    )
+    parser.add_argument("--repeat", type=int, default=3, help="每项重复次数，取最快一次 (默认: 3)")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="基线文件路径")
+    parser.add_argument("--save-baseline", action="store_true", help="把本次结果写入基线文件")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="允许的退化比例 (默认: 0.2)")
+    parser.add_argument("--output", help="本次结果另存为 JSON")
+    parser.add_argument(
+        "--work-dir",
+        default=os.path.join(".", "cache", "bench"),
+        help="测试视频与临时文件目录 (默认: ./cache/bench)",
+    )
+    parser.add_argument("--encode-once", nargs=3, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.encode_once:
+        encode_once(*args.encode_once)
+        return 0
+
+    names = args.only.split(",") if args.only else list(BENCHMARKS)
+    unknown = [n for n in names if n not in BENCHMARKS]
+    if unknown:
+        parser.error(f"未知的基准: {','.join(unknown)}")
+    sizes = [int(s) for s in args.sizes.split(",") if s]
+    os.makedirs(args.work_dir, exist_ok=True)
+
+    results = {}
+    for name in names:
+        print(f"运行基准: {name}")
+        results.update(BENCHMARKS[name](sizes, args.repeat, args.work_dir))
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f).get("results", {})
+    print_table(results, baseline)
+
+    report = {
+        "created_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "python": platform.python_version(),
+        "machine": platform.platform(),
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    if args.save_baseline:
+        # 只更新本次运行的项，保留其余基线
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(
+                dict(report, results={**baseline, **results}), f, ensure_ascii=False, indent=2
+            )
+        print(f"基线已保存: {args.baseline}")
+        return 0
+
+    regressions = compare(results, baseline, args.tolerance)
+    for name, metric, base, current in regressions:
+        print(f"性能退化: {name} {metric} 基线 {base} -> 本次 {current}")
+    if not baseline:
+        print("没有基线，使用 --save-baseline 生成")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    # 编码基准不写入服务使用的缓存与速度统计
+    os.environ.setdefault("SEGMENT_CACHE_ENABLED", "0")
+    os.environ.setdefault(
+        "ENCODE_STATS_PATH", os.path.join(tempfile.gettempdir(), "bench_encode_stats.json")
+    )
+    sys.exit(main())
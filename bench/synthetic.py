@@ -0,0 +1,140 @@
+"""
+生成基准测试用的合成数据：
+- 转录结果：与 AssemblyAI json_response 中 utterance 结构相同（text/start/end/speaker/words）；
+- 测试视频：ffmpeg lavfi testsrc 画面 + 正弦波音轨。
+"""
+import os
+import random
+import subprocess
+
+LATIN_WORDS = (
+    "the quick brown fox jumps over a lazy dog while seven wizards quietly "
+    "brew potions in the old castle kitchen and nobody notices anything unusual "
+    "because everyone is busy reading version 3.5 of the manual"
+).split()
+
+# 常用汉字，按 1~3 字组成词，模拟中文转录逐词返回、词间无空格
+CJK_CHARS = (
+    "的一是在不了有和人这中大为上个国我以要他时来用们生到作地于出就分对成会可主发年动同工也能下过子说产种面而方后多定行学法所民得经"
+    "十三之进着等部度家电力里如水化高自二理起小物现实加量都两体制机当使点从业本去把性好应开它合还因由其些然前外天政四日那社义事平形相全表间样与关各重新线内数正心反你明看原又么利比或但质气第向道命此变条只没结解问意建月公无系军很情者最立代想已通并提直题党程展五果料象员革位入常文总次品式活设及管特件长求老头基资边流路级少图山统接知较将组见计别她手角期根论运农指几九区强放决西被干做必战先回则任取据处队南给色光门即保治北造百规热领七海口东导器压志世金增争济阶油思术极交受联什认六共权收证改清己美再采转更单风切打白教速花带安场身车例真务具万每目至达走积示议声报斗完类八离华名确才科张信马节话米整空元况今集温传土许步群广石记需段研界拉林律叫且究观越织装影算低持音众书布复容儿须际商非验连断深难近矿千周委素技备半办青省列习响约支般史感劳便团往酸历市克何除消构府称太准精值号率族维划选标写存候毛亲快效斯院查江型眼王按格养易置派层片始却专状育厂京识适属圆包火住调满县局照参红细引听该铁价严"
+)
+
+
+def latin_utterance(rng, start, speaker, sentences=3):
+    words = []
+    texts = []
+    t = start
+    for _ in range(sentences):
+        count = rng.randint(4, 18)
+        for i in range(count):
+            text = rng.choice(LATIN_WORDS)
+            if i == 0:
+                text = text.capitalize()
+            if i == count - 1:
+                text += rng.choice(".!?.")
+            elif rng.random() < 0.08:
+                text += ","
+            duration = rng.randint(120, 480)
+            words.append(
+                {
+                    "text": text,
+                    "start": t,
+                    "end": t + duration,
+                    "confidence": round(rng.uniform(0.7, 1.0), 4),
+                    "speaker": speaker,
+                }
+            )
+            texts.append(text)
+            t += duration + rng.randint(0, 120)
+    return _utterance(" ".join(texts), start, t, speaker, words)
+
+
+def cjk_utterance(rng, start, speaker, sentences=3):
+    words = []
+    texts = []
+    t = start
+    for _ in range(sentences):
+        count = rng.randint(4, 14)
+        for i in range(count):
+            text = "".join(rng.choice(CJK_CHARS) for _ in range(rng.randint(1, 3)))
+            if i == count - 1:
+                text += rng.choice("。！？。")
+            elif rng.random() < 0.15:
+                text += "，"
+            duration = rng.randint(150, 600)
+            words.append(
+                {
+                    "text": text,
+                    "start": t,
+                    "end": t + duration,
+                    "confidence": round(rng.uniform(0.7, 1.0), 4),
+                    "speaker": speaker,
+                }
+            )
+            texts.append(text)
+            t += duration + rng.randint(0, 80)
+    return _utterance("".join(texts), start, t, speaker, words)
+
+
+def _utterance(text, start, end, speaker, words):
+    return {
+        "text": text,
+        "start": start,
+        "end": end,
+        "confidence": round(sum(w["confidence"] for w in words) / len(words), 4),
+        "speaker": speaker,
+        "words": words,
+    }
+
+
+def make_utterances(count, language="latin", seed=0):
+    """生成 count 段话，language: latin / cjk / mixed（两者交替）"""
+    rng = random.Random(seed)
+    utterances = []
+    t = 0
+    for i in range(count):
+        speaker = "AB"[i % 2]
+        if language == "cjk" or (language == "mixed" and i % 2):
+            utterance = cjk_utterance(rng, t, speaker)
+        else:
+            utterance = latin_utterance(rng, t, speaker)
+        utterances.append(utterance)
+        t = utterance["end"] + rng.randint(200, 1500)
+    return utterances
+
+
+def make_subtitle_data(utterances, font_color="#FF0000", font_size=10):
+    """转换为 /embed_subtitle 的字幕数据格式"""
+    return [
+        {
+            "text": u["text"],
+            "start": u["start"],
+            "end": u["end"],
+            "font_color": font_color,
+            "font_size": font_size,
+        }
+        for u in utterances
+    ]
+
+
+def make_video(output_dir, width, height, duration, fps=30):
+    """用 lavfi 生成测试视频，已存在时直接复用"""
+    os.makedirs(output_dir, exist_ok=True)
+    path = os.path.join(output_dir, f"testsrc_{width}x{height}_{duration}s.mp4")
+    if os.path.exists(path):
+        return path
+    tmp_path = f"{path}.tmp.mp4"
+    cmd = [
+        "ffmpeg",
+        "-v", "error",
+        "-y",
+        "-f", "lavfi", "-i", f"testsrc=size={width}x{height}:rate={fps}:duration={duration}",
+        "-f", "lavfi", "-i", f"sine=frequency=440:duration={duration}",
+        "-c:v", "libx264", "-preset", "ultrafast", "-pix_fmt", "yuv420p",
+        "-c:a", "aac",
+        "-shortest",
+        tmp_path,
+    ]
+    subprocess.run(cmd, check=True)
+    os.replace(tmp_path, path)
+    return path
@@ -0,0 +1,191 @@
+import asyncio
+import itertools
+
+
+class AssemblyAIClient:
+    """AssemblyAI 的提交/查询接口，submit 不等待转录完成"""
+
+    def submit(self, upload_path, transcription_config):
+        # 使用时才导入，调度逻辑与桩客户端不依赖 assemblyai
+        import assemblyai as aai
+
+        transcript = aai.Transcriber(config=transcription_config).submit(upload_path)
+        if transcript.status == "error":
+            raise RuntimeError(f"Transcription failed: {transcript.error}")
+        return transcript.id
+
+    def poll(self, transcript_id):
+        """返回 (状态, json_response, 错误信息)"""
+        import assemblyai as aai
+
+        transcript = aai.Transcript.get_by_id(transcript_id)
+        # TranscriptStatus 是 str 枚举，可直接与字符串比较
+        return transcript.status, transcript.json_response, transcript.error
+
+
+class StubTranscriptionClient:
+    """
+    离线桩客户端：不访问网络，查询若干次后返回预设结果，
+    用于在没有 AssemblyAI 的环境中测试调度逻辑。
+    """
+
+    def __init__(self, responses=None, polls_until_done=1, errors=None):
+        self.responses = responses or {}
+        self.errors = errors or {}
+        self.polls_until_done = polls_until_done
+        self._ids = itertools.count(1)
+        self._jobs = {}
+
+    def submit(self, upload_path, transcription_config=None):
+        transcript_id = f"stub-{next(self._ids)}"
+        self._jobs[transcript_id] = {"path": upload_path, "polls": 0}
+        return transcript_id
+
+    def poll(self, transcript_id):
+        job = self._jobs[transcript_id]
+        job["polls"] += 1
+        if job["polls"] < self.polls_until_done:
+            return "processing", None, None
+        if job["path"] in self.errors:
+            return "error", None, self.errors[job["path"]]
+        response = self.responses.get(
+            job["path"], {"id": transcript_id, "text": "", "utterances": [], "words": []}
+        )
+        return "completed", response, None
+
+
+class WebhookRegistry:
+    """保存等待中的转录ID，收到回调时唤醒对应的轮询协程"""
+
+    def __init__(self):
+        self._events = {}
+
+    def register(self, transcript_id):
+        event = asyncio.Event()
+        self._events[transcript_id] = event
+        return event
+
+    def unregister(self, transcript_id):
+        self._events.pop(transcript_id, None)
+
+    def notify(self, transcript_id):
+        event = self._events.get(transcript_id)
+        if event is None:
+            return False
+        event.set()
+        return True
+
+
+webhook_registry = WebhookRegistry()
+
+
+class BatchTranscriber:
+    """
+    批量转录调度：并发提交、并发查询，同时处理的文件数受 concurrency 限制，
+    每个文件完成后立即产出结果。
+    配置了回调地址时，轮询协程等待回调唤醒，只以较长间隔兜底查询。
+    """
+
+    def __init__(
+        self,
+        client,
+        transcriber=None,
+        concurrency=8,
+        poll_interval=3.0,
+        webhook_url=None,
+        webhook_poll_interval=60.0,
+        registry=webhook_registry,
+    ):
+        self.client = client
+        self.transcriber = transcriber
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.webhook_url = webhook_url
+        self.webhook_poll_interval = webhook_poll_interval
+        self.registry = registry
+
+    async def run(self, video_paths):
+        """异步生成器，按完成顺序产出 {"index", "video_path", "status", ...}"""
+        semaphore = asyncio.Semaphore(self.concurrency)
+        results = asyncio.Queue()
+
+        async def worker(index, video_path):
+            async with semaphore:
+                try:
+                    result = await self._transcribe_one(video_path)
+                except Exception as e:
+                    result = {
+                        "status": "error",
+                        "error_type": type(e).__name__,
+                        "error_message": str(e),
+                    }
+            await results.put({"index": index, "video_path": video_path, **result})
+
+        tasks = [
+            asyncio.create_task(worker(i, path)) for i, path in enumerate(video_paths)
+        ]
+        try:
+            for _ in range(len(tasks)):
+                yield await results.get()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _transcribe_one(self, video_path):
+        transcription_config = None
+        cache_key = None
+        upload_path = video_path
+        if self.transcriber is not None:
+            # 下载、哈希、音频提取都是阻塞操作，放到线程中执行
+            transcription_config = self.transcriber.make_config(self.webhook_url)
+            cache_key, cached, upload_path, temp_dir = await asyncio.to_thread(
+                self.transcriber.prepare, video_path, transcription_config
+            )
+            try:
+                if cached is not None:
+                    return {
+                        "status": "success",
+                        "transcript_id": cached.id,
+                        "cached": True,
+                        "data": cached.json_response,
+                    }
+                transcript_id = await asyncio.to_thread(
+                    self.client.submit, upload_path, transcription_config
+                )
+            finally:
+                # 提交即完成上传，本地副本不再需要
+                await asyncio.to_thread(self.transcriber.cleanup, temp_dir)
+        else:
+            transcript_id = await asyncio.to_thread(
+                self.client.submit, upload_path, transcription_config
+            )
+        event = self.registry.register(transcript_id) if self.webhook_url else None
+        try:
+            while True:
+                status, json_response, error = await asyncio.to_thread(
+                    self.client.poll, transcript_id
+                )
+                if status == "completed":
+                    break
+                if status == "error":
+                    raise RuntimeError(f"Transcription failed: {error}")
+                if event is None:
+                    await asyncio.sleep(self.poll_interval)
+                    continue
+                try:
+                    await asyncio.wait_for(event.wait(), self.webhook_poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                event.clear()
+        finally:
+            if event is not None:
+                self.registry.unregister(transcript_id)
+
+        if self.transcriber is not None:
+            self.transcriber.store(cache_key, transcript_id, json_response)
+        return {
+            "status": "success",
+            "transcript_id": transcript_id,
+            "cached": False,
+            "data": json_response,
+        }
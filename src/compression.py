@@ -0,0 +1,76 @@
+import zlib
+
+try:
+    import zstandard
+except ImportError:  # 未安装 zstandard 时只支持 gzip
+    zstandard = None
+
+# 流式压缩时累计到该大小就刷新一次，客户端可以尽早解压出已完成的行
+FLUSH_BYTES = 64 * 1024
+
+
+def negotiate(accept_encoding):
+    """根据 Accept-Encoding 选择压缩方式：优先 zstd（已安装时），其次 gzip，否则 None"""
+    accepted = {}
+    for item in (accept_encoding or "").split(","):
+        name, _, params = item.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if name:
+            accepted[name.lower()] = quality
+    if zstandard is not None and accepted.get("zstd", 0) > 0:
+        return "zstd"
+    if accepted.get("gzip", 0) > 0:
+        return "gzip"
+    return None
+
+
+def _compressor(encoding, level=None):
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=level or 3).compressobj()
+    # wbits=31 输出 gzip 格式
+    return zlib.compressobj(level if level is not None else 6, zlib.DEFLATED, 31)
+
+
+def compress_stream(chunks, encoding, flush_bytes=FLUSH_BYTES):
+    """
+    流式压缩 str/bytes 块：累计到 flush_bytes 后做一次同步刷新并输出，
+    结尾输出完整的压缩流。encoding 为 None 时按同样的大小合并后原样输出。
+    """
+    if encoding is None:
+        # 不压缩时也合并小块，减少逐句发送的开销
+        buffer = []
+        pending = 0
+        for chunk in chunks:
+            data = chunk.encode("utf-8") if isinstance(chunk, str) else chunk
+            buffer.append(data)
+            pending += len(data)
+            if pending >= flush_bytes:
+                yield b"".join(buffer)
+                buffer = []
+                pending = 0
+        if buffer:
+            yield b"".join(buffer)
+        return
+
+    compressor = _compressor(encoding)
+    if encoding == "zstd":
+        sync_flush = zstandard.COMPRESSOBJ_FLUSH_BLOCK
+    else:
+        sync_flush = zlib.Z_SYNC_FLUSH
+    pending = 0
+    for chunk in chunks:
+        data = chunk.encode("utf-8") if isinstance(chunk, str) else chunk
+        out = compressor.compress(data)
+        pending += len(data)
+        if pending >= flush_bytes:
+            out += compressor.flush(sync_flush)
+            pending = 0
+        if out:
+            yield out
+    yield compressor.flush()
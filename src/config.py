@@ -0,0 +1,83 @@
+import os
+
+# AssemblyAI 密钥（优先读取环境变量）
+ASSEMBLYAI_API_KEY = os.environ.get(
+    "ASSEMBLYAI_API_KEY", "442e2d408ee948a8bd078066a493ac05"
+)
+
+# 对象存储配置
+S3_CONFIG = {
+    "endpoint": os.environ.get("S3_ENDPOINT", "https://cn-nb1.rains3.com"),
+    "access_key": os.environ.get("S3_ACCESS_KEY", "6PZZwXqeL1dCdtqh"),
+    "secret_key": os.environ.get("S3_SECRET_KEY", "uun5qw9oSmwkc1OhLfcBV2f3DhNseD"),
+    "bucket": os.environ.get("S3_BUCKET", "coze-project"),
+}
+
+# 后台任务配置
+EMBED_WORKERS = int(os.environ.get("EMBED_WORKERS", "2"))  # 编码工作进程数
+EMBED_MAX_PENDING = int(os.environ.get("EMBED_MAX_PENDING", "32"))  # 最大排队任务数
+JOB_TTL = int(os.environ.get("JOB_TTL", "3600"))  # 已结束任务的保留时间（秒）
+
+# 下载缓存配置
+DOWNLOAD_CACHE_ENABLED = os.environ.get("DOWNLOAD_CACHE_ENABLED", "1") == "1"
+DOWNLOAD_CACHE_DIR = os.environ.get("DOWNLOAD_CACHE_DIR", os.path.join(".", "cache", "downloads"))
+DOWNLOAD_CACHE_MAX_BYTES = int(os.environ.get("DOWNLOAD_CACHE_MAX_BYTES", str(20 * 1024**3)))
+
+# 转录结果缓存目录
+TRANSCRIPT_CACHE_DIR = os.environ.get("TRANSCRIPT_CACHE_DIR", os.path.join(".", "cache", "transcripts"))
+
+# HTTP 连接池配置
+HTTP_POOL_SIZE = int(os.environ.get("HTTP_POOL_SIZE", "16"))
+HTTP_RETRIES = int(os.environ.get("HTTP_RETRIES", "3"))
+HTTP_BACKOFF = float(os.environ.get("HTTP_BACKOFF", "0.5"))
+HTTP_CONNECT_TIMEOUT = float(os.environ.get("HTTP_CONNECT_TIMEOUT", "10"))
+HTTP_READ_TIMEOUT = float(os.environ.get("HTTP_READ_TIMEOUT", "300"))
+
+# 分段并行编码：时长超过该值（秒）的视频自动分段
+PARALLEL_MIN_DURATION = float(os.environ.get("PARALLEL_MIN_DURATION", "600"))
+
+# 片段缓存：字幕小改动时只重新编码受影响的片段
+SEGMENT_CACHE_ENABLED = os.environ.get("SEGMENT_CACHE_ENABLED", "1") == "1"
+SEGMENT_CACHE_DIR = os.environ.get("SEGMENT_CACHE_DIR", os.path.join(".", "cache", "segments"))
+SEGMENT_CACHE_MAX_BYTES = int(os.environ.get("SEGMENT_CACHE_MAX_BYTES", str(50 * 1024**3)))
+SEGMENT_CACHE_MIN_DURATION = float(os.environ.get("SEGMENT_CACHE_MIN_DURATION", "120"))
+SEGMENT_SECONDS = float(os.environ.get("SEGMENT_SECONDS", "30"))
+
+# 编码速度统计文件（自动选择预设使用）
+ENCODE_STATS_PATH = os.environ.get("ENCODE_STATS_PATH", os.path.join(".", "cache", "encode_stats.json"))
+
+# 转录前提取的音频：编码格式（opus/flac）与缓存目录
+AUDIO_CODEC = os.environ.get("AUDIO_CODEC", "opus")
+AUDIO_CACHE_DIR = os.environ.get("AUDIO_CACHE_DIR", os.path.join(".", "cache", "audio"))
+# 提取音频缓存的总大小上限，超出时按最近使用时间淘汰
+AUDIO_CACHE_MAX_BYTES = int(os.environ.get("AUDIO_CACHE_MAX_BYTES", str(5 * 1024**3)))
+
+# 批量转录默认并发数
+BATCH_TRANSCRIBE_CONCURRENCY = int(os.environ.get("BATCH_TRANSCRIBE_CONCURRENCY", "8"))
+
+# 临时目录管理：闲置保留时间（秒）、总大小预算、最低保留磁盘空间
+WORKSPACE_TTL = int(os.environ.get("WORKSPACE_TTL", "3600"))
+WORKSPACE_MAX_BYTES = int(os.environ.get("WORKSPACE_MAX_BYTES", str(50 * 1024**3)))
+WORKSPACE_MIN_FREE_BYTES = int(os.environ.get("WORKSPACE_MIN_FREE_BYTES", str(5 * 1024**3)))
+WORKSPACE_DEFAULT_JOB_BYTES = int(os.environ.get("WORKSPACE_DEFAULT_JOB_BYTES", str(1024**3)))
+WORKSPACE_ADMISSION_WAIT = int(os.environ.get("WORKSPACE_ADMISSION_WAIT", "600"))
+WORKSPACE_SWEEP_INTERVAL = int(os.environ.get("WORKSPACE_SWEEP_INTERVAL", "300"))
+
+# 分块并行下载：块大小、并发连接数、单块重试次数
+DOWNLOAD_CHUNK_SIZE = int(os.environ.get("DOWNLOAD_CHUNK_SIZE", str(8 * 1024**2)))
+DOWNLOAD_PARALLELISM = int(os.environ.get("DOWNLOAD_PARALLELISM", "4"))
+DOWNLOAD_RETRIES = int(os.environ.get("DOWNLOAD_RETRIES", "3"))
+# 不使用缓存的下载先写入该目录下以 URL 哈希命名的 .part 文件，中断后再次下载同一 URL 可续传
+DOWNLOAD_PART_DIR = os.environ.get("DOWNLOAD_PART_DIR", os.path.join(".", "cache", "parts"))
+
+# 嵌入结果索引：相同请求在有效期内直接返回已上传的链接
+RESULT_INDEX_PATH = os.environ.get("RESULT_INDEX_PATH", os.path.join(".", "cache", "results.json"))
+RESULT_TTL = int(os.environ.get("RESULT_TTL", "3600"))
+
+# 任务进度事件流：推送检查间隔与空闲保活间隔（秒）
+PROGRESS_POLL_INTERVAL = float(os.environ.get("PROGRESS_POLL_INTERVAL", "0.5"))
+PROGRESS_KEEPALIVE = float(os.environ.get("PROGRESS_KEEPALIVE", "15"))
+
+# 字幕排版：样式字体（fc-match 查找字体文件）与字宽表缓存目录（从字体构建一次后复用）
+SUBTITLE_FONT = os.environ.get("SUBTITLE_FONT", "Arial")
+FONT_METRICS_CACHE_DIR = os.environ.get("FONT_METRICS_CACHE_DIR", os.path.join(".", "cache", "fonts"))
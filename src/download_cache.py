@@ -0,0 +1,176 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import threading
+from contextlib import contextmanager
+
+from http_client import get_session
+from ranged_download import verify_checksum
+
+try:
+    import fcntl
+except ImportError:  # Windows 下仅做进程内加锁
+    fcntl = None
+
+
+class DownloadCache:
+    """
+    共享的磁盘下载缓存：以 URL 为键，记录 ETag/Last-Modified，
+    命中时通过条件请求重新验证，总大小超限时按最近访问时间淘汰。
+    """
+
+    def __init__(self, cache_dir, max_bytes, downloader):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.downloader = downloader
+        self.index_path = os.path.join(cache_dir, "index.json")
+        self._thread_lock = threading.Lock()
+        self._key_locks = {}
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @contextmanager
+    def _locked(self):
+        # 进程内与进程间（多个工作进程）共享同一份索引，需要双重加锁
+        with self._thread_lock:
+            with open(os.path.join(self.cache_dir, "index.lock"), "a") as lock_file:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @contextmanager
+    def _key_locked(self, key):
+        # 同一 URL 同一时间只允许一个下载写入 .part 并移动到缓存路径
+        with self._thread_lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            with open(os.path.join(self.cache_dir, f"{key}.lock"), "a") as lock_file:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _load_index(self):
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _save_index(self, index):
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(index, f)
+        os.replace(tmp_path, self.index_path)
+
+    def _entry_path(self, key, entry):
+        return os.path.join(self.cache_dir, key, entry["filename"])
+
+    def fetch(self, url, fallback_path, checksum=None):
+        """
+        获取 URL 对应的本地文件
+        - 缓存有效（304）时直接返回缓存路径，不传输内容；
+        - 服务端未提供 ETag/Last-Modified 时不缓存，下载到 fallback_path；
+        - checksum 形如 "sha256:<hex>"，命中缓存或下载完成后校验。
+
+        Returns:
+            tuple[str, bool]: (本地路径, 是否来自缓存目录)
+        """
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        filename = os.path.basename(url.split("?")[0]) or "download"
+
+        with self._locked():
+            entry = self._load_index().get(key)
+        headers = {}
+        if entry and os.path.exists(self._entry_path(key, entry)):
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+        else:
+            entry = None
+
+        response = get_session().get(url, headers=headers, stream=True)
+        if response.status_code == 304 and entry is not None:
+            response.close()
+            with self._locked():
+                index = self._load_index()
+                if key in index:
+                    index[key]["last_access"] = time.time()
+                    self._save_index(index)
+            print(f"命中下载缓存: {url}")
+            path = self._entry_path(key, entry)
+            if checksum:
+                verify_checksum(path, checksum)
+            return path, True
+        response.raise_for_status()
+
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        if not etag and not last_modified:
+            # 无法重新验证的资源不进入缓存
+            self.downloader.download(url, fallback_path, response, checksum)
+            return fallback_path, False
+
+        entry_dir = os.path.join(self.cache_dir, key)
+        final_path = os.path.join(entry_dir, filename)
+        with self._key_locked(key):
+            # 等待期间其他线程或进程可能已下载了同一版本
+            with self._locked():
+                entry = self._load_index().get(key)
+            if (
+                entry
+                and entry.get("etag") == etag
+                and entry.get("last_modified") == last_modified
+                and os.path.exists(self._entry_path(key, entry))
+            ):
+                response.close()
+                print(f"命中下载缓存: {url}")
+                path = self._entry_path(key, entry)
+                if checksum:
+                    verify_checksum(path, checksum)
+                return path, True
+
+            os.makedirs(entry_dir, exist_ok=True)
+            # 固定的 .part 路径，下载中断后可续传
+            part_path = f"{final_path}.part"
+            size = self.downloader.download(url, part_path, response, checksum)
+            os.replace(part_path, final_path)
+
+            with self._locked():
+                index = self._load_index()
+                index[key] = {
+                    "url": url,
+                    "filename": filename,
+                    "etag": etag,
+                    "last_modified": last_modified,
+                    "size": size,
+                    "last_access": time.time(),
+                }
+                self._evict(index, keep=key)
+                self._save_index(index)
+        return final_path, True
+
+    def _evict(self, index, keep=None):
+        # 按最近访问时间淘汰，直到总大小不超过上限
+        total = sum(e.get("size", 0) for e in index.values())
+        for key, entry in sorted(index.items(), key=lambda kv: kv[1].get("last_access", 0)):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            try:
+                shutil.rmtree(os.path.join(self.cache_dir, key))
+            except OSError:
+                pass
+            total -= entry.get("size", 0)
+            del index[key]
+            print(f"淘汰下载缓存: {entry.get('url')}")
@@ -1,28 +1,112 @@
 import ffmpeg
-from utils import download_file, create_tempdir
+from utils import download_file, create_tempdir, supports_range_requests
 import os
 from subtitle import create_ssa_subtitles
-from utils import modify_separator
+from font_metrics import get_measurer
+from utils import modify_separator, hash_file
+from parallel_encode import parallel_burn, probe_keyframes
+from segment_cache import SegmentCache
+from encode_profile import EncodeStats, resolve_encoding, ffmpeg_video_kwargs
+from probe import probe_video, get_start_time
+from progress import run_ffmpeg
+import metrics
+from concurrent.futures import ThreadPoolExecutor
+import config
+import time
+
+
+# 直接读取远程源时的 ffmpeg 输入参数：连接中断后自动重连
+STREAM_INPUT_OPTIONS = {
+    "reconnect": 1,
+    "reconnect_streamed": 1,
+    "reconnect_on_network_error": 1,
+    "reconnect_delay_max": 30,
+}
+
+_segment_cache = None
+_encode_stats = None
+
+
+def get_encode_stats():
+    global _encode_stats
+    if _encode_stats is None:
+        _encode_stats = EncodeStats(config.ENCODE_STATS_PATH)
+    return _encode_stats
+
+
+def get_segment_cache():
+    global _segment_cache
+    if _segment_cache is None:
+        _segment_cache = SegmentCache(config.SEGMENT_CACHE_DIR, config.SEGMENT_CACHE_MAX_BYTES)
+    return _segment_cache
 
 
 class SubtitleEmbed:
     def __init__(self):
         pass
 
-    def embed(self, video_path, subtitle_data):
+    def embed(
+        self,
+        video_path,
+        subtitle_data,
+        mode="burn",
+        container="mp4",
+        segments=None,
+        encoding=None,
+        temp_dir=None,
+        ingest="download",
+    ):
+        """
+        嵌入字幕
+        mode:
+            burn: 重新编码，将字幕烧录进画面
+            soft: 视频、音频直接复制，字幕作为独立字幕轨封装（mp4 用 mov_text，mkv 用 ass）
+        segments: 烧录时的并行分段数；为 None 时长视频按 CPU 核数自动分段，1 表示单进程编码；
+            分段编码的长视频使用片段缓存
+        encoding: 编码选项（profile/preset/crf/tune/threads/x264_params/deadline_seconds），
+            见 encode_profile.resolve_encoding
+        temp_dir: 工作目录，不传时新建
+        ingest: 远程视频的读取方式
+            download: 先完整下载到本地（可复用下载缓存与片段缓存）
+            stream: ffmpeg 直接通过 HTTP 读取源文件，探测与编码在传输开始后即进行，
+                不分段、不使用片段缓存；服务端不支持 Range 请求时退回 download
+        """
+        if mode not in ("burn", "soft"):
+            raise ValueError(f"不支持的嵌入模式: {mode}")
+        if container not in ("mp4", "mkv"):
+            raise ValueError(f"不支持的封装格式: {container}")
+
         # 创建临时目录并生成字幕文件
-        temp_dir = create_tempdir()
+        if temp_dir is None:
+            temp_dir = create_tempdir()
         subtitle_path = os.path.join(temp_dir, "styled_subtitles.ssa")
-        output_path = os.path.join(temp_dir, "output.mp4")
-        # 如果是URL则下载
-        if video_path.startswith("http"):
-            video_path = download_file(video_path, temp_dir)
-
-        video_width, video_height = self.get_video_dimensions(video_path)
+        output_path = os.path.join(temp_dir, f"output.{container}")
+        input_options = {}
+        streaming = (
+            ingest == "stream"
+            and video_path.startswith("http")
+            and supports_range_requests(video_path)
+        )
+        if streaming:
+            # 探测只读取文件头，编码时 ffmpeg 边下载边处理
+            video_info = self.get_video_info(video_path)
+            input_options = STREAM_INPUT_OPTIONS
+        # 如果是URL则下载；下载的同时通过 Range 请求读取文件头完成探测
+        elif video_path.startswith("http"):
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                probe_future = executor.submit(self.get_video_info, video_path)
+                video_path = download_file(video_path, temp_dir)
+                video_info = probe_future.result()
+        else:
+            video_info = self.get_video_info(video_path)
+        video_width, video_height = video_info["width"], video_info["height"]
         
 
         # 转换字幕数据
-        subtitle_path = create_ssa_subtitles(subtitle_data, subtitle_path, video_width, video_height)
+        with metrics.stage("ssa"):
+            subtitle_path = create_ssa_subtitles(
+                subtitle_data, subtitle_path, video_width, video_height
+            )
 
         # 嵌入字幕
         subtitle_path = modify_separator(subtitle_path)
@@ -30,33 +114,281 @@ class SubtitleEmbed:
 
         print("开始处理...")
 
-        ffmpeg.input(video_path).output(
-            output_path,
-            vf=f"ass={subtitle_path},scale={video_width}:{video_height}",  # 使用ass滤镜添加字幕
-            vcodec="libx264",  # 重新编码视频以嵌入字幕
-            acodec="aac",
-        ).run(overwrite_output=True)
+        if segments is None:
+            segments = self.auto_segments(video_info["duration"])
+        use_segment_cache = not streaming and self.use_segment_cache(
+            video_info["duration"], segments
+        )
+
+        # 本次编码的执行方式，自动选择预设与速度统计都按执行方式区分
+        if streaming:
+            exec_mode = "stream"
+        elif segments > 1:
+            exec_mode = "parallel"
+        else:
+            exec_mode = "single"
+        encode_params = None
+        if mode == "burn":
+            encode_params = resolve_encoding(
+                encoding,
+                get_encode_stats(),
+                video_info["duration"],
+                video_width,
+                video_height,
+                mode=exec_mode,
+            )
+        start = time.time()
+        measured = True
+
+        with metrics.stage("mux" if mode == "soft" else "encode"):
+            if mode == "soft":
+                measured = False
+                self.mux_subtitles(
+                    video_path,
+                    subtitle_path,
+                    output_path,
+                    container,
+                    input_options,
+                    duration=video_info["duration"],
+                )
+            elif exec_mode == "parallel":
+                # 片段缓存命中时耗时不代表编码速度，不计入统计
+                measured = not use_segment_cache
+                parallel_burn(
+                    video_path,
+                    subtitle_path,
+                    output_path,
+                    temp_dir,
+                    video_info["duration"],
+                    segments,
+                    self._start_time(video_path, video_info),
+                    segment_cache=get_segment_cache() if use_segment_cache else None,
+                    segment_seconds=config.SEGMENT_SECONDS,
+                    encoding=encode_params,
+                )
+            else:
+                # 边下载边编码的耗时受网络影响，不计入速度统计
+                measured = exec_mode != "stream"
+                stream = ffmpeg.input(video_path, **input_options).output(
+                    output_path,
+                    vf=f"ass={subtitle_path}",  # 使用ass滤镜添加字幕（尺寸不变，无需缩放）
+                    acodec="aac",
+                    **ffmpeg_video_kwargs(encode_params),  # 重新编码视频以嵌入字幕
+                )
+                run_ffmpeg(stream, "encode", video_info["duration"])
+
+        if measured:
+            elapsed = time.time() - start
+            get_encode_stats().record(
+                encode_params["preset"],
+                video_info["duration"],
+                video_width,
+                video_height,
+                elapsed,
+                mode=exec_mode,
+            )
+            if elapsed > 0:
+                metrics.observe(
+                    "encode_speed_ratio",
+                    video_info["duration"] / elapsed,
+                    preset=encode_params["preset"],
+                    mode=exec_mode,
+                )
 
         print(f"完成！输出文件: {output_path}")
         return output_path
+
+    def embed_renditions(
+        self,
+        video_path,
+        subtitle_data,
+        renditions,
+        encoding=None,
+        temp_dir=None,
+        ingest="download",
+    ):
+        """
+        一次解码输出多个分辨率：split 后每个分支分别 scale 并烧录按该分辨率生成的字幕。
+        renditions: [{"height": 720, "width": 可选, "name": 可选}, ...]
+        返回 [{"name", "width", "height", "output_path"}, ...]
+        """
+        if temp_dir is None:
+            temp_dir = create_tempdir()
+
+        input_options = {}
+        streaming = (
+            ingest == "stream"
+            and video_path.startswith("http")
+            and supports_range_requests(video_path)
+        )
+        if streaming:
+            video_info = self.get_video_info(video_path)
+            input_options = STREAM_INPUT_OPTIONS
+        elif video_path.startswith("http"):
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                probe_future = executor.submit(self.get_video_info, video_path)
+                video_path = download_file(video_path, temp_dir)
+                video_info = probe_future.result()
+        else:
+            video_info = self.get_video_info(video_path)
+
+        targets = []
+        for i, rendition in enumerate(renditions):
+            width, height = self._rendition_size(video_info, rendition)
+            name = rendition.get("name") or f"{height}p"
+            subtitle_path = os.path.join(temp_dir, f"styled_subtitles_{i}.ssa")
+            # 每个分辨率单独生成字幕，字号与换行按目标尺寸计算
+            subtitle_path = create_ssa_subtitles(
+                [dict(item) for item in subtitle_data], subtitle_path, width, height
+            )
+            targets.append(
+                {
+                    "name": name,
+                    "width": width,
+                    "height": height,
+                    "subtitle_path": modify_separator(subtitle_path),
+                    # 加上序号，高度取偶数后相同的分辨率也不会写入同一文件
+                    "output_path": os.path.join(temp_dir, f"output_{i}_{name}.mp4"),
+                }
+            )
+
+        largest = max(targets, key=lambda t: t["width"] * t["height"])
+        encode_params = resolve_encoding(
+            encoding,
+            get_encode_stats(),
+            video_info["duration"],
+            largest["width"],
+            largest["height"],
+            mode="renditions",
+        )
+
+        print(f"开始处理: {len(targets)} 个分辨率")
+        source = ffmpeg.input(video_path, **input_options)
+        branches = source.video.filter_multi_output("split", len(targets))
+        outputs = []
+        for i, target in enumerate(targets):
+            video = (
+                branches.stream(i)
+                .filter("scale", target["width"], target["height"])
+                .filter("ass", target["subtitle_path"])
+            )
+            outputs.append(
+                ffmpeg.output(
+                    video,
+                    source["a?"],
+                    target["output_path"],
+                    acodec="aac",
+                    **ffmpeg_video_kwargs(encode_params),
+                )
+            )
+        start = time.time()
+        with metrics.stage("encode"):
+            run_ffmpeg(ffmpeg.merge_outputs(*outputs), "encode", video_info["duration"])
+        # 边下载边编码的耗时受网络影响，不计入速度统计
+        elapsed = time.time() - start
+        if not streaming:
+            get_encode_stats().record(
+                encode_params["preset"],
+                video_info["duration"],
+                largest["width"],
+                largest["height"],
+                elapsed,
+                mode="renditions",
+            )
+            if elapsed > 0:
+                metrics.observe(
+                    "encode_speed_ratio",
+                    video_info["duration"] / elapsed,
+                    preset=encode_params["preset"],
+                    mode="renditions",
+                )
+
+        print(f"完成！输出文件: {[t['output_path'] for t in targets]}")
+        return [
+            {k: t[k] for k in ("name", "width", "height", "output_path")} for t in targets
+        ]
+
+    def _rendition_size(self, video_info, rendition):
+        # 只给高度时按原视频宽高比计算宽度，宽高取偶数（libx264 要求）
+        height = int(rendition["height"])
+        width = rendition.get("width")
+        if not width:
+            width = video_info["width"] * height / max(video_info["height"], 1)
+        return int(width) // 2 * 2, height // 2 * 2
+
+    def mux_subtitles(
+        self,
+        video_path,
+        subtitle_path,
+        output_path,
+        container="mp4",
+        input_options=None,
+        duration=None,
+    ):
+        """软字幕封装：不重新编码，只把字幕作为字幕轨写入容器"""
+        video_in = ffmpeg.input(video_path, **(input_options or {}))
+        subtitle_in = ffmpeg.input(subtitle_path)
+        stream = ffmpeg.output(
+            video_in["v"],
+            video_in["a?"],  # 源视频可能没有音轨
+            subtitle_in,
+            output_path,
+            vcodec="copy",
+            acodec="copy",
+            scodec="mov_text" if container == "mp4" else "ass",
+        )
+        run_ffmpeg(stream, "mux", duration)
+        return output_path
     
+    def warm_up(self, video_path, segments=None):
+        """
+        预先完成探测并加载字幕字体的字宽表，之后会走片段缓存的长视频再预读关键帧写入片段缓存，
+        可与转录等耗时步骤并行，之后的 embed 直接命中缓存。
+        segments: 与之后 embed 的 segments 参数相同
+        """
+        get_measurer()
+        video_info = self.get_video_info(video_path)
+        if segments is None:
+            segments = self.auto_segments(video_info["duration"])
+        if self.use_segment_cache(video_info["duration"], segments):
+            segment_cache = get_segment_cache()
+            video_hash = hash_file(video_path)
+            if segment_cache.get_keyframes(video_hash) is None:
+                keyframes = probe_keyframes(video_path, self._start_time(video_path, video_info))
+                segment_cache.put_keyframes(video_hash, keyframes)
+        return video_info
+
+    def use_segment_cache(self, duration, segments):
+        """
+        分段编码的长视频才走片段缓存，重新提交时只编码字幕有变化的片段；
+        segments 为 1（单进程编码）时不做整文件哈希与关键帧探测
+        """
+        return (
+            config.SEGMENT_CACHE_ENABLED
+            and segments > 1
+            and duration >= config.SEGMENT_CACHE_MIN_DURATION
+        )
+
+    def auto_segments(self, duration):
+        # 短视频分段收益不大；长视频按每个任务可用的核数分段
+        if duration < config.PARALLEL_MIN_DURATION:
+            return 1
+        return max(1, (os.cpu_count() or 1) // max(config.EMBED_WORKERS, 1))
+
     def get_video_dimensions(self, video_path):
-        # 使用ffprobe获取视频信息
-        probe = ffmpeg.probe(video_path)
-        # 查找视频流
-        video_stream = None
-        for stream in probe['streams']:
-            if stream['codec_type'] == 'video':
-                video_stream = stream
-                break
-        if not video_stream:
-            raise ValueError("未找到视频流")
-        
-        # 获取宽度和高度
-        width = int(video_stream.get('width', 0))
-        height = int(video_stream.get('height', 0))
-        return width, height
-        
+        info = self.get_video_info(video_path)
+        return info["width"], info["height"]
+
+    def get_video_info(self, video_path):
+        """返回 {width, height, rotation, duration, fps, start_time}，见 probe.probe_video"""
+        with metrics.stage("probe"):
+            return probe_video(video_path)
+
+    def _start_time(self, video_path, video_info):
+        # 快速探测无法确定起始时间（如存在编辑列表）时用 ffprobe 补充
+        if video_info.get("start_time") is None:
+            video_info["start_time"] = get_start_time(video_path)
+        return video_info["start_time"]
 
 
 if __name__ == "__main__":
@@ -0,0 +1,184 @@
+import os
+import re
+import json
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows 下仅做进程内加锁
+    fcntl = None
+
+# x264 预设，按速度从快到慢排列
+PRESETS = [
+    "ultrafast",
+    "superfast",
+    "veryfast",
+    "faster",
+    "fast",
+    "medium",
+    "slow",
+    "slower",
+    "veryslow",
+]
+
+# x264 支持的 tune
+TUNES = (
+    "film",
+    "animation",
+    "grain",
+    "stillimage",
+    "psnr",
+    "ssim",
+    "fastdecode",
+    "zerolatency",
+)
+# x264-params：以 ':' 分隔的 key=value
+X264_PARAMS_PATTERN = r"^[A-Za-z0-9_-]+=[A-Za-z0-9_.,+/-]+(?::[A-Za-z0-9_-]+=[A-Za-z0-9_.,+/-]+)*$"
+
+# 编码执行方式：single 单进程编码；parallel 分段并行编码（含片段缓存）；
+# renditions 一次解码输出多个分辨率（按其中最大的分辨率计算速度）。
+# 各方式速度差异大，分别统计；stream 边下载边编码，速度受网络影响，不计入统计，按 single 估计
+EXEC_MODES = ("single", "parallel", "renditions")
+
+# 内置编码档位
+PROFILES = {
+    "fast": {"preset": "veryfast", "crf": 23},
+    "balanced": {"preset": "medium", "crf": 23},
+    "quality": {"preset": "slow", "crf": 20},
+}
+
+# 没有历史数据时的速度估计：1080p 下编码速度相对实时的倍数
+DEFAULT_SPEED_1080P = {
+    "ultrafast": 8.0,
+    "superfast": 6.0,
+    "veryfast": 4.0,
+    "faster": 2.5,
+    "fast": 2.0,
+    "medium": 1.5,
+    "slow": 0.8,
+    "slower": 0.4,
+    "veryslow": 0.2,
+}
+PIXELS_1080P = 1920 * 1080
+
+
+class EncodeStats:
+    """
+    按执行方式记录各预设的实测编码速度（每秒墙钟时间处理的 视频秒数×像素数），
+    使用指数滑动平均，持久化到 JSON 文件（键为 "<执行方式>/<预设>"），供自动选择预设使用。
+    """
+
+    def __init__(self, path, alpha=0.3):
+        self.path = path
+        self.alpha = alpha
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def _locked(self):
+        # 多个工作进程更新同一份统计文件，读取-合并-写入需要进程内与进程间双重加锁
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with self._lock:
+            with open(f"{self.path}.lock", "a") as lock_file:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def speed(self, preset, mode="single"):
+        key = f"{mode if mode in EXEC_MODES else 'single'}/{preset}"
+        stats = self._load()
+        if key in stats:
+            return stats[key]
+        return DEFAULT_SPEED_1080P[preset] * PIXELS_1080P
+
+    def record(self, preset, duration, width, height, elapsed, mode="single"):
+        if preset not in PRESETS or mode not in EXEC_MODES or elapsed <= 0 or duration <= 0:
+            return
+        measured = duration * width * height / elapsed
+        key = f"{mode}/{preset}"
+        with self._locked():
+            stats = self._load()
+            old = stats.get(key)
+            stats[key] = measured if old is None else old + self.alpha * (measured - old)
+            tmp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(stats, f)
+            os.replace(tmp_path, self.path)
+
+    def estimate(self, preset, duration, width, height, mode="single"):
+        """估计编码耗时（秒）"""
+        return duration * width * height / self.speed(preset, mode)
+
+
+def choose_preset(stats, duration, width, height, deadline_seconds, safety=0.8, mode="single"):
+    """
+    在截止时间内选择画质最好的预设：从最慢的预设开始，
+    取第一个估计耗时不超过 deadline × safety 的；都不满足时用最快的预设。
+    mode: 本次的执行方式，按该方式的历史速度估计
+    """
+    budget = deadline_seconds * safety
+    for preset in reversed(PRESETS):
+        if stats.estimate(preset, duration, width, height, mode) <= budget:
+            return preset
+    return PRESETS[0]
+
+
+def resolve_encoding(options, stats=None, duration=0, width=0, height=0, mode="single"):
+    """
+    合并档位与单项参数，返回最终编码参数：
+    preset / crf / tune / threads / x264_params。
+    options["profile"] 为 "auto" 时根据 deadline_seconds 和该执行方式的历史速度选择预设。
+    """
+    options = options or {}
+    profile = options.get("profile") or "balanced"
+    if profile == "auto":
+        deadline = options.get("deadline_seconds")
+        if not deadline:
+            raise ValueError("profile=auto 时必须提供 deadline_seconds")
+        preset = choose_preset(stats, duration, width, height, deadline, mode=mode)
+        params = {"preset": preset, "crf": 23}
+        print(f"自动选择预设: {params['preset']} (截止时间 {deadline}s)")
+    elif profile in PROFILES:
+        params = dict(PROFILES[profile])
+    else:
+        raise ValueError(f"不支持的编码档位: {profile}")
+
+    for key in ("preset", "crf", "tune", "threads", "x264_params"):
+        if options.get(key) is not None:
+            params[key] = options[key]
+    if params["preset"] not in PRESETS:
+        raise ValueError(f"不支持的预设: {params['preset']}")
+    if params.get("tune") and params["tune"] not in TUNES:
+        raise ValueError(f"不支持的 tune: {params['tune']}")
+    if params.get("x264_params") and not re.match(X264_PARAMS_PATTERN, params["x264_params"]):
+        raise ValueError(f"x264_params 格式错误: {params['x264_params']}")
+    return params
+
+
+def ffmpeg_video_kwargs(params, threads=None):
+    """转换为 ffmpeg-python 的输出参数"""
+    kwargs = {"vcodec": "libx264", "preset": params["preset"], "crf": params["crf"]}
+    if params.get("tune"):
+        kwargs["tune"] = params["tune"]
+    if params.get("x264_params"):
+        kwargs["x264-params"] = params["x264_params"]
+    threads = params.get("threads") or threads
+    if threads:
+        kwargs["threads"] = threads
+    return kwargs
+
+
+def cache_params(params):
+    """影响编码结果的参数（线程数不影响画面内容，不参与缓存键）"""
+    return {k: v for k, v in params.items() if k != "threads"}
@@ -0,0 +1,197 @@
+import os
+import json
+import shutil
+import hashlib
+import threading
+import subprocess
+import unicodedata
+
+import config
+
+try:
+    from fontTools.ttLib import TTFont
+except ImportError:  # 未安装 fontTools 时按内置的 Arial 字宽与东亚宽度估算
+    TTFont = None
+
+# Arial（与 Helvetica 度量相同）ASCII 可打印字符 0x20~0x7E 的字宽，单位 1/1000 em
+_ARIAL_WIDTHS = (
+    278, 278, 355, 556, 556, 889, 667, 191, 333, 333, 389, 584, 278, 333, 278, 278,
+    556, 556, 556, 556, 556, 556, 556, 556, 556, 556,
+    278, 278, 584, 584, 584, 556, 1015,
+    667, 667, 722, 722, 667, 611, 778, 722, 278, 500, 667, 556, 833,
+    722, 778, 667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611,
+    278, 278, 278, 469, 556, 333,
+    556, 556, 500, 556, 556, 278, 556, 556, 222, 222, 500, 222, 833,
+    556, 556, 556, 556, 333, 500, 278, 556, 500, 722, 500, 500, 500,
+    334, 260, 334, 584,
+)
+# libass 把 winAscent + winDescent 缩放为字号，因此 1 em = 字号 * unitsPerEm / (winAscent + winDescent)；
+# Arial 为 2048 / (1854 + 434)
+DEFAULT_SIZE_SCALE = 2048 / (1854 + 434)
+# 估算时非 ASCII 的拉丁等窄字符按 Arial 小写字母的平均字宽
+DEFAULT_NARROW_WIDTH = 0.53
+
+
+def estimate_advance(char):
+    """没有字体文件可读时估算字号为 1 时的字宽：ASCII 用 Arial 字宽，其余按东亚宽度"""
+    cp = ord(char)
+    if 0x20 <= cp < 0x7F:
+        return _ARIAL_WIDTHS[cp - 0x20] / 1000 * DEFAULT_SIZE_SCALE
+    if unicodedata.combining(char) or unicodedata.category(char) in ("Mn", "Me", "Cf"):
+        return 0.0
+    if unicodedata.east_asian_width(char) in ("W", "F"):
+        return DEFAULT_SIZE_SCALE
+    return DEFAULT_NARROW_WIDTH * DEFAULT_SIZE_SCALE
+
+
+def _fc_match(pattern):
+    """用 fontconfig 查找字体，返回 (文件路径, 集合字体中的序号)，与 libass 选择字体的方式一致"""
+    if shutil.which("fc-match") is None:
+        return None
+    try:
+        result = subprocess.run(
+            ["fc-match", "-f", "%{file}\t%{index}", pattern],
+            capture_output=True,
+            text=True,
+            timeout=10,
+        )
+    except (OSError, subprocess.SubprocessError):
+        return None
+    path, _, index = result.stdout.strip().partition("\t")
+    if result.returncode != 0 or not path or not os.path.exists(path):
+        return None
+    return path, int(index or 0)
+
+
+class FontMetrics:
+    """
+    单个字体文件的字宽表：码位 -> 字号为 1 时的像素字宽。
+    从字体的 cmap/hmtx 读取一次后以 JSON 缓存到磁盘，以文件路径、大小与修改时间为键，
+    字体更新后自动重建。
+    """
+
+    def __init__(self, path, advances):
+        self.path = path
+        self.advances = advances
+
+    def get(self, cp):
+        return self.advances.get(cp)
+
+    @classmethod
+    def load(cls, path, index=0, cache_dir=None):
+        cache_dir = cache_dir or config.FONT_METRICS_CACHE_DIR
+        stat = os.stat(path)
+        key = hashlib.sha1(
+            f"{os.path.abspath(path)}:{index}:{stat.st_size}:{stat.st_mtime_ns}".encode("utf-8")
+        ).hexdigest()
+        cache_path = os.path.join(cache_dir, f"{key}.json")
+        try:
+            with open(cache_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = cls._build(path, index)
+            os.makedirs(cache_dir, exist_ok=True)
+            tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, separators=(",", ":"))
+            os.replace(tmp_path, cache_path)
+
+        scale = data["size_scale"] / data["units_per_em"]
+        advances = {int(cp): width * scale for cp, width in data["advances"].items()}
+        return cls(path, advances)
+
+    @staticmethod
+    def _build(path, index):
+        # 只读取需要的表，大型中文字体也只需一两秒
+        font = TTFont(path, fontNumber=index, lazy=True)
+        try:
+            units_per_em = font["head"].unitsPerEm
+            if "OS/2" in font and font["OS/2"].usWinAscent + font["OS/2"].usWinDescent > 0:
+                height = font["OS/2"].usWinAscent + font["OS/2"].usWinDescent
+            else:
+                height = font["hhea"].ascent - font["hhea"].descent
+            metrics = font["hmtx"].metrics
+            advances = {
+                cp: metrics[name][0]
+                for cp, name in (font.getBestCmap() or {}).items()
+                if name in metrics
+            }
+        finally:
+            font.close()
+        return {
+            "path": path,
+            "units_per_em": units_per_em,
+            "size_scale": units_per_em / height if height > 0 else DEFAULT_SIZE_SCALE,
+            "advances": advances,
+        }
+
+
+class AdvanceTable(dict):
+    """字符 -> 字号为 1 时的字宽（像素），首次查询某字符时从字体表查找并缓存"""
+
+    def __init__(self, fonts):
+        super().__init__()
+        self.fonts = fonts
+
+    def __missing__(self, char):
+        cp = ord(char)
+        for font in self.fonts:
+            width = font.get(cp)
+            if width is not None:
+                break
+        else:
+            width = estimate_advance(char)
+        self[char] = width
+        return width
+
+
+class TextMeasurer:
+    """
+    按样式字体及其中文回退字体测量文本宽度：字体中没有的字符依次查回退字体，
+    都没有时估算。逐字符结果缓存在 advances 中。
+    """
+
+    def __init__(self, fonts=()):
+        self.fonts = list(fonts)
+        self.advances = AdvanceTable(self.fonts)
+
+    def advance(self, char):
+        """字号为 1 时单个字符的宽度（像素）"""
+        return self.advances[char]
+
+    def width(self, text, font_size=1):
+        return sum(map(self.advances.__getitem__, text)) * font_size
+
+
+_measurers = {}
+_measurers_lock = threading.Lock()
+
+
+def get_measurer(font_name=None):
+    """
+    获取字体的测量器（每个进程每种字体只加载一次）。
+    通过 fc-match 找到样式字体与中文回退字体；未安装 fontTools 或找不到字体时使用估算字宽。
+    """
+    font_name = font_name or config.SUBTITLE_FONT
+    with _measurers_lock:
+        measurer = _measurers.get(font_name)
+        if measurer is None:
+            measurer = _measurers[font_name] = TextMeasurer(_load_fonts(font_name))
+    return measurer
+
+
+def _load_fonts(font_name):
+    if TTFont is None:
+        return []
+    fonts = []
+    seen = set()
+    for pattern in (font_name, f"{font_name}:lang=zh-cn"):
+        found = _fc_match(pattern)
+        if found is None or found in seen:
+            continue
+        seen.add(found)
+        try:
+            fonts.append(FontMetrics.load(*found))
+        except Exception as e:
+            print(f"读取字体字宽失败，使用估算字宽: {found[0]} ({e})")
+    return fonts
@@ -0,0 +1,72 @@
+import os
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import config
+
+
+class _TimeoutAdapter(HTTPAdapter):
+    """未显式指定超时的请求使用默认超时"""
+
+    def __init__(self, timeout, *args, **kwargs):
+        self.timeout = timeout
+        super().__init__(*args, **kwargs)
+
+    def send(self, request, **kwargs):
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = self.timeout
+        return super().send(request, **kwargs)
+
+
+def create_session(
+    pool_size=None, retries=None, backoff_factor=None, timeout=None
+):
+    """
+    创建带连接池的会话：复用 TCP/TLS 连接，并对连接错误和幂等请求做退避重试。
+    PUT/POST 的请求体可能是只能读一次的文件流，只重试连接阶段的错误。
+    """
+    pool_size = pool_size or config.HTTP_POOL_SIZE
+    retries = config.HTTP_RETRIES if retries is None else retries
+    backoff_factor = config.HTTP_BACKOFF if backoff_factor is None else backoff_factor
+    timeout = timeout or (config.HTTP_CONNECT_TIMEOUT, config.HTTP_READ_TIMEOUT)
+
+    retry = Retry(
+        total=retries,
+        connect=retries,
+        read=retries,
+        status=retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset({"GET", "HEAD", "DELETE"}),
+        raise_on_status=False,
+    )
+    adapter = _TimeoutAdapter(
+        timeout,
+        pool_connections=pool_size,
+        pool_maxsize=pool_size,
+        max_retries=retry,
+    )
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """返回进程内共享的会话（工作进程各自创建，不跨进程复用连接）"""
+    global _session, _session_pid
+    pid = os.getpid()
+    if _session is None or _session_pid != pid:
+        with _session_lock:
+            if _session is None or _session_pid != pid:
+                _session = create_session()
+                _session_pid = pid
+    return _session
@@ -0,0 +1,428 @@
+import os
+import json
+import time
+import uuid
+import hashlib
+import threading
+import traceback
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import config
+import metrics
+import progress
+from embed import SubtitleEmbed
+from s3 import get_default_operator
+from trans import Transcriber
+from word_table import TranscriptTable
+from utils import (
+    modify_separator,
+    create_tempdir,
+    download_file,
+    estimate_job_bytes,
+    workspace_manager,
+)
+
+
+def run_embed_job(video_path, subtitle_data, embed_options=None):
+    """在工作进程中执行完整流程：下载、探测、生成字幕、编码、上传"""
+    embed_options = dict(embed_options or {})
+    renditions = embed_options.pop("renditions", None)
+    # 磁盘空间不足时先清理并等待，超时则任务失败
+    workspace_manager.admit(
+        estimate_job_bytes(video_path, factor=3 + len(renditions or [])),
+        wait_seconds=config.WORKSPACE_ADMISSION_WAIT,
+    )
+    temp_dir = create_tempdir()
+    try:
+        embeder = SubtitleEmbed()
+        if renditions:
+            result = _embed_renditions(embeder, video_path, subtitle_data, renditions, temp_dir, embed_options)
+            for output in result["outputs"]:
+                _check_upload(output["output"], output["name"])
+        else:
+            output_path = embeder.embed(
+                video_path, subtitle_data, temp_dir=temp_dir, **embed_options
+            )
+
+            # 上传输出视频到对象存储
+            s3_oper = get_default_operator()
+            object_key = modify_separator(output_path[2:])
+            result = s3_oper.upload(object_key, output_path)
+            _check_upload(result)
+    except Exception:
+        # 失败时保留目录便于排查，由清理线程按 TTL 删除
+        workspace_manager.deactivate(temp_dir)
+        raise
+    workspace_manager.release(temp_dir)
+    return result
+
+
+def _check_upload(link, name=None):
+    """上传失败时 upload 返回错误信息而不是链接，转为异常使任务状态为 error"""
+    if not link.startswith("http"):
+        target = f" ({name})" if name else ""
+        raise RuntimeError(f"上传失败{target}: {link}")
+
+
+def _embed_renditions(embeder, video_path, subtitle_data, renditions, temp_dir, embed_options):
+    # 一次编码输出多个分辨率，再并行上传
+    targets = embeder.embed_renditions(
+        video_path,
+        subtitle_data,
+        renditions,
+        encoding=embed_options.get("encoding"),
+        temp_dir=temp_dir,
+        ingest=embed_options.get("ingest", "download"),
+    )
+    s3_oper = get_default_operator()
+
+    def upload(target):
+        object_key = modify_separator(target["output_path"][2:])
+        return {
+            "name": target["name"],
+            "width": target["width"],
+            "height": target["height"],
+            "output": s3_oper.upload(object_key, target["output_path"]),
+        }
+
+    with ThreadPoolExecutor(max_workers=len(targets)) as executor:
+        outputs = list(executor.map(upload, targets))
+    return {"outputs": outputs}
+
+
+def run_pipeline_job(video_path, embed_options=None, font_color="#FF0000", font_size=10):
+    """
+    转录并烧录字幕的完整流程，源文件只下载一次：
+    下载完成后，转录（提取音频、上传、等待结果）与视频探测、关键帧预读并行，
+    转录结果按句切分后直接生成字幕并编码、上传。
+    """
+    workspace_manager.admit(
+        estimate_job_bytes(video_path), wait_seconds=config.WORKSPACE_ADMISSION_WAIT
+    )
+    temp_dir = create_tempdir()
+    try:
+        embeder = SubtitleEmbed()
+        if video_path.startswith("http"):
+            video_path = download_file(video_path, temp_dir)
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            progress.report("transcribe", final=True, status="running")
+            transcript_future = executor.submit(
+                Transcriber(config.ASSEMBLYAI_API_KEY).exec, video_path
+            )
+            executor.submit(
+                embeder.warm_up, video_path, (embed_options or {}).get("segments")
+            ).result()
+            transcript = transcript_future.result()
+            progress.report("transcribe", final=True, status="done")
+
+        # 分句基于列式单词表的下标区间，字幕只取每句的文本与起止时间
+        table = TranscriptTable.from_json_response(transcript.json_response)
+        subtitle_data = [
+            {
+                "text": s.text,
+                "start": s.start,
+                "end": s.end,
+                "font_color": font_color,
+                "font_size": font_size,
+            }
+            for s in table.iter_sentences()
+        ]
+
+        output_path = embeder.embed(
+            video_path, subtitle_data, temp_dir=temp_dir, **(embed_options or {})
+        )
+        s3_oper = get_default_operator()
+        object_key = modify_separator(output_path[2:])
+        output_link = s3_oper.upload(object_key, output_path)
+        _check_upload(output_link)
+    except Exception:
+        workspace_manager.deactivate(temp_dir)
+        raise
+    workspace_manager.release(temp_dir)
+    return {
+        "output": output_link,
+        "transcript_id": transcript.id,
+        "subtitle_count": len(subtitle_data),
+    }
+
+
+def _run_job(job_id, trace_id, func, *args):
+    """工作进程中的任务入口：绑定任务ID与追踪ID，使各阶段的进度事件与日志归属该任务"""
+    progress.bind(job_id)
+    metrics.set_trace_id(trace_id, process_wide=True)
+    progress.report("job", final=True, status="running")
+    try:
+        return func(*args)
+    except Exception as e:
+        # 部分异常（如 ffmpeg.Error）在主进程中无法反序列化，会使整个进程池损坏；
+        # 统一转换为 RuntimeError，消息中保留原异常类型、ffmpeg 输出与堆栈
+        raise RuntimeError(_describe_error(e)) from None
+    finally:
+        progress.bind(None)
+        metrics.set_trace_id(None, process_wide=True)
+
+
+# 错误信息中保留的 ffmpeg stderr 末尾长度
+STDERR_TAIL = 4000
+
+
+def _describe_error(exc):
+    message = f"{type(exc).__name__}: {exc}"
+    stderr = getattr(exc, "stderr", None)
+    if isinstance(stderr, bytes):
+        stderr = stderr.decode("utf-8", errors="replace")
+    if stderr:
+        message += f"\n--- stderr ---\n{stderr[-STDERR_TAIL:]}"
+    return message + f"\n--- traceback ---\n{traceback.format_exc()}"
+
+
+class JobQueueFullError(RuntimeError):
+    pass
+
+
+def request_key(payload):
+    """请求的规范化哈希：字段排序后序列化，相同内容得到相同的键"""
+    canonical = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class ResultIndex:
+    """请求哈希 -> 已上传结果 的持久化索引，带过期时间"""
+
+    def __init__(self, path, ttl):
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def get(self, key):
+        with self._lock:
+            entry = self._load().get(key)
+        if entry is None or entry["expires_at"] < time.time():
+            return None
+        return entry["result"]
+
+    def put(self, key, result):
+        with self._lock:
+            now = time.time()
+            index = {k: v for k, v in self._load().items() if v["expires_at"] >= now}
+            index[key] = {"result": result, "expires_at": now + self.ttl}
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(index, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+
+
+def _is_uploaded(result):
+    if isinstance(result, dict):
+        if "output" in result:
+            return _is_uploaded(result["output"])
+        return all(o["output"].startswith("http") for o in result.get("outputs", []))
+    return isinstance(result, str) and result.startswith("http")
+
+
+class JobManager:
+    """
+    后台任务管理：任务在有界进程池中执行，主进程只记录状态，
+    因此接口耗时不再受其他任务编码时长的影响。
+    """
+
+    def __init__(self, max_workers=2, max_pending=32, job_ttl=3600, result_index=None):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.job_ttl = job_ttl
+        self.result_index = result_index
+        self._executor = None
+        self._jobs = {}
+        self._inflight = {}  # 请求哈希 -> 执行中的任务ID
+        self._lock = threading.Lock()
+        # 工作进程通过队列上报进度，主进程线程汇总到 progress
+        self.progress = progress.ProgressHub()
+        self._progress_queue = None
+
+    def _get_executor(self):
+        if self._executor is None:
+            # 使用 spawn，避免在多线程的服务进程中 fork
+            mp_context = multiprocessing.get_context("spawn")
+            if self._progress_queue is None:
+                self._progress_queue = mp_context.Queue()
+                self.progress.listen(self._progress_queue, handlers={"metric": metrics.apply})
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=mp_context,
+                initializer=progress.init_worker,
+                initargs=(self._progress_queue,),
+            )
+        return self._executor
+
+    def _discard_executor(self, executor):
+        # 工作进程异常退出后进程池不可再用，丢弃后下次提交时重建
+        if executor is not None and self._executor is executor:
+            print("进程池已损坏，重建进程池")
+            self._executor = None
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def submit(self, func, *args, dedup_key=None):
+        """
+        提交任务，立即返回任务ID。
+        传入 dedup_key 时：相同请求正在执行则返回已有任务ID；
+        结果索引中有未过期的结果则直接生成已完成的任务，不再编码。
+        """
+        with self._lock:
+            self._purge_expired()
+            if dedup_key is not None:
+                job_id = self._inflight.get(dedup_key)
+                if job_id is not None:
+                    print(f"合并重复请求到任务: {job_id}")
+                    return job_id
+                result = self.result_index.get(dedup_key) if self.result_index else None
+                if result is not None:
+                    return self._add_finished(result)
+            pending = sum(
+                1 for job in self._jobs.values() if job["status"] in ("queued", "running")
+            )
+            if pending >= self.max_pending:
+                raise JobQueueFullError(f"任务队列已满 ({pending}/{self.max_pending})")
+
+            job_id = uuid.uuid4().hex
+            trace_id = metrics.current_trace_id()
+            job = {
+                "job_id": job_id,
+                "trace_id": trace_id,
+                "status": "queued",
+                "created_at": time.time(),
+                "started_at": None,
+                "finished_at": None,
+                "result": None,
+                "error": None,
+                "_dedup_key": dedup_key,
+            }
+            self._jobs[job_id] = job
+            executor = self._get_executor()
+            try:
+                future = executor.submit(_run_job, job_id, trace_id, func, *args)
+            except BrokenProcessPool:
+                self._discard_executor(executor)
+                executor = self._get_executor()
+                future = executor.submit(_run_job, job_id, trace_id, func, *args)
+            job["_future"] = future
+            job["_executor"] = executor
+            if dedup_key is not None:
+                self._inflight[dedup_key] = job_id
+
+        future.add_done_callback(lambda f: self._on_done(job_id, f))
+        return job_id
+
+    def _add_finished(self, result):
+        # 命中结果索引：直接生成一个已完成的任务
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        self._jobs[job_id] = {
+            "job_id": job_id,
+            "trace_id": metrics.current_trace_id(),
+            "status": "success",
+            "created_at": now,
+            "started_at": now,
+            "finished_at": now,
+            "result": result,
+            "error": None,
+            "cached": True,
+        }
+        print(f"命中结果索引: {job_id}")
+        return job_id
+
+    def _on_done(self, job_id, future):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            dedup_key = job.get("_dedup_key")
+            if dedup_key is not None and self._inflight.get(dedup_key) == job_id:
+                del self._inflight[dedup_key]
+            job["finished_at"] = time.time()
+            if future.cancelled():
+                job["status"] = "cancelled"
+                return
+            exc = future.exception()
+            if isinstance(exc, BrokenProcessPool):
+                self._discard_executor(job.get("_executor"))
+            if exc is None:
+                job["status"] = "success"
+                job["result"] = future.result()
+                if dedup_key is not None and self.result_index and _is_uploaded(job["result"]):
+                    self.result_index.put(dedup_key, job["result"])
+            else:
+                job["status"] = "error"
+                job["error"] = {
+                    "error_type": type(exc).__name__,
+                    "error_message": str(exc),
+                    # 子进程的原始堆栈保存在 __cause__ 中
+                    "traceback": "".join(
+                        traceback.format_exception(type(exc), exc, exc.__traceback__)
+                    ),
+                }
+
+    def get(self, job_id):
+        """返回任务状态快照，不存在时返回 None"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            future = job.get("_future")
+            if job["status"] == "queued" and future is not None and future.running():
+                job["status"] = "running"
+                job["started_at"] = time.time()
+            snapshot = {k: v for k, v in job.items() if not k.startswith("_")}
+        # 各阶段的最新进度，time 字段可用于判断任务是否停滞
+        snapshot["progress"] = self.progress.latest(job_id)
+        return snapshot
+
+    def counts(self):
+        """各状态的任务数"""
+        with self._lock:
+            counts = {status: 0 for status in ("queued", "running", "success", "error", "cancelled")}
+            for job in self._jobs.values():
+                status = job["status"]
+                future = job.get("_future")
+                if status == "queued" and future is not None and future.running():
+                    status = "running"
+                counts[status] = counts.get(status, 0) + 1
+            return counts
+
+    def _purge_expired(self):
+        # 清理超过保留时间的已结束任务，避免状态表无限增长
+        now = time.time()
+        expired = [
+            job_id
+            for job_id, job in self._jobs.items()
+            if job["finished_at"] and now - job["finished_at"] > self.job_ttl
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+            self.progress.discard(job_id)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        if self._progress_queue is not None:
+            self.progress.stop(self._progress_queue)
+            self._progress_queue = None
+
+
+job_manager = JobManager(
+    max_workers=config.EMBED_WORKERS,
+    max_pending=config.EMBED_MAX_PENDING,
+    job_ttl=config.JOB_TTL,
+    result_index=ResultIndex(config.RESULT_INDEX_PATH, config.RESULT_TTL),
+)
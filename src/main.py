@@ -1,20 +1,97 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-from typing import List, Optional
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field, model_validator
+from typing import List, Literal, Optional
 import traceback
+import asyncio
+import itertools
 import json
+import time
+import uuid
 from trans import Transcriber
-from utils import create_tempdir, modify_separator, split_sentence_by_dot, download_file
+from batch_trans import BatchTranscriber, AssemblyAIClient, webhook_registry
+from utils import workspace_manager
 import os
-from embed import SubtitleEmbed
-from s3 import S3Operator
+import config
+import metrics
+import compression
+from encode_profile import X264_PARAMS_PATTERN
+from jobs import job_manager, run_embed_job, run_pipeline_job, request_key, JobQueueFullError
+from workspace import InsufficientSpaceError
+from word_table import TranscriptTable
 
 app = FastAPI(title="音频转录与字幕嵌入API")
 
 
+@app.middleware("http")
+async def trace_middleware(request: Request, call_next):
+    """
+    请求级追踪ID：沿用请求头 X-Trace-Id，没有时生成，
+    各阶段的日志与提交的任务都带上该ID，并在响应头中返回。
+    """
+    trace_id = request.headers.get("x-trace-id") or uuid.uuid4().hex[:16]
+    token = metrics.set_trace_id(trace_id)
+    start = time.time()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+    finally:
+        metrics.reset_trace_id(token)
+        # 使用路由模板而非实际路径，避免任务ID等产生大量标签
+        route = request.scope.get("route")
+        metrics.observe(
+            "http_request_duration_seconds",
+            time.time() - start,
+            method=request.method,
+            path=getattr(route, "path", "other"),
+            status=str(status_code),
+        )
+    response.headers["X-Trace-Id"] = trace_id
+    return response
+
+
+def _check_auto_profile(request):
+    # 在接口处校验，避免任务已受理后才在工作进程中失败
+    if request.profile == "auto" and not request.deadline_seconds:
+        raise ValueError("profile=auto 时必须提供 deadline_seconds")
+    return request
+
+
 # 数据模型定义
 class TranscribeRequest(BaseModel):
     video_path: str
+    # 只返回这些顶层字段，如 ["text", "utterances"]；不传时返回全部
+    fields: Optional[List[str]] = None
+    # 是否返回逐词数据（顶层 words 与每句的 words）
+    words: Optional[bool] = True
+    # json: 完整 JSON；ndjson: 首行为转录信息，之后每句一行
+    format: Optional[Literal["json", "ndjson"]] = "json"
+
+
+class TranscribeEmbedRequest(BaseModel):
+    video_path: str
+    font_color: Optional[str] = "#FF0000"
+    font_size: Optional[int] = 10
+    mode: Optional[Literal["burn", "soft"]] = "burn"
+    container: Optional[Literal["mp4", "mkv"]] = "mp4"
+    profile: Optional[Literal["fast", "balanced", "quality", "auto"]] = None
+    deadline_seconds: Optional[float] = Field(default=None, gt=0)
+
+    @model_validator(mode="after")
+    def check_deadline(self):
+        return _check_auto_profile(self)
+
+
+class BatchTranscribeRequest(BaseModel):
+    video_paths: List[str]
+    # 同时处理的文件数
+    concurrency: Optional[int] = Field(default=None, ge=1, le=64)
+    # 本服务对外可访问的地址，提供时由 AssemblyAI 回调 /transcribe/webhook 通知完成
+    webhook_base_url: Optional[str] = None
+    # 同 /transcribe
+    fields: Optional[List[str]] = None
+    words: Optional[bool] = True
 
 
 class SubtitleData(BaseModel):
@@ -25,31 +102,88 @@ class SubtitleData(BaseModel):
     font_size: Optional[int] = 10
 
 
+class Rendition(BaseModel):
+    height: int = Field(gt=0)
+    # 不传时按原视频宽高比计算
+    width: Optional[int] = Field(default=None, gt=0)
+    # 用于输出文件名与对象存储路径，不传时为 "<高度>p"
+    name: Optional[str] = Field(default=None, pattern=r"^[A-Za-z0-9_-]{1,64}$")
+
+
 class EmbedSubtitleRequest(BaseModel):
     subtitle_data: List[SubtitleData]
     video_path: str
+    # burn: 烧录字幕（重新编码）；soft: 封装为字幕轨（不重新编码）
+    mode: Optional[Literal["burn", "soft"]] = "burn"
+    container: Optional[Literal["mp4", "mkv"]] = "mp4"
+    # 烧录时的并行分段数，不传则长视频自动分段
+    segments: Optional[int] = Field(default=None, ge=1)
+    # 编码档位：fast/balanced/quality，auto 表示按 deadline_seconds 自动选择预设
+    profile: Optional[Literal["fast", "balanced", "quality", "auto"]] = None
+    preset: Optional[
+        Literal[
+            "ultrafast", "superfast", "veryfast", "faster", "fast",
+            "medium", "slow", "slower", "veryslow",
+        ]
+    ] = None
+    crf: Optional[int] = Field(default=None, ge=0, le=51)
+    tune: Optional[
+        Literal[
+            "film", "animation", "grain", "stillimage",
+            "psnr", "ssim", "fastdecode", "zerolatency",
+        ]
+    ] = None
+    threads: Optional[int] = Field(default=None, ge=1)
+    # 以 ':' 分隔的 key=value，如 "keyint=60:min-keyint=60"
+    x264_params: Optional[str] = Field(default=None, pattern=X264_PARAMS_PATTERN)
+    deadline_seconds: Optional[float] = Field(default=None, gt=0)
+    # 远程视频读取方式：download 先下载；stream 由 ffmpeg 边下载边编码
+    ingest: Optional[Literal["download", "stream"]] = "download"
+    # 多分辨率输出（仅烧录模式），一次解码同时生成全部分辨率
+    renditions: Optional[List[Rendition]] = None
+
+    @model_validator(mode="after")
+    def check_deadline(self):
+        return _check_auto_profile(self)
+
+    @model_validator(mode="after")
+    def check_rendition_names(self):
+        # 结果按名称列出各分辨率（本地文件与对象存储路径带序号，不会互相覆盖），名称重复时无法区分
+        names = [r.name or f"{r.height}p" for r in self.renditions or []]
+        duplicated = sorted({n for n in names if names.count(n) > 1})
+        if duplicated:
+            raise ValueError(f"renditions 名称重复: {', '.join(duplicated)}，请通过 name 区分")
+        return self
+
+
+def transcript_json(json_response, fields=None, include_words=True):
+    """
+    按句号等标点把每段话切分为句子，返回 JSON 文本。
+    转录结果先转为列式的 TranscriptTable，分句与序列化都基于单词下标区间，
+    不再为每个单词复制 dict。
+    """
+    table = TranscriptTable.from_json_response(json_response)
+    return "".join(table.iter_json(fields, include_words))
 
 
 @app.post("/transcribe")
-async def transcribe_api(request: TranscribeRequest):
+def transcribe_api(request: TranscribeRequest, http_request: Request):
     """
     音频转录API
     参数:
         video_path: 音频文件路径或URL
+        fields: 只返回的顶层字段（可选）
+        words: 是否返回逐词数据，默认返回
+        format: json 或 ndjson（每句一行，边分句边输出）
+    响应按 Accept-Encoding 使用 zstd（已安装 zstandard 时）或 gzip 压缩
+    转录过程（下载、提取音频、上传、轮询）是阻塞调用，接口定义为普通函数，
+    由 FastAPI 在线程池中执行，不阻塞事件循环（进度事件流等接口）
     """
     try:
-        # 这里应该从环境变量或配置中获取API密钥
-        api_key = "442e2d408ee948a8bd078066a493ac05"  # 建议改为环境变量
-        trans = Transcriber(api_key)
+        trans = Transcriber(config.ASSEMBLYAI_API_KEY)
         transcript = trans.exec(request.video_path)
-
-        # 确保返回的是可序列化的数据
-        result = transcript.json_response
-        utterances = result.get("utterances", [])
-        utterances = [s for u in utterances for s in split_sentence_by_dot(u)]
-        result["utterances"] = utterances
-
-        return {"status": "success", "data": result}
+        table = TranscriptTable.from_json_response(transcript.json_response)
+        del transcript
     except Exception as e:
         # 返回详细的错误信息
         error_info = {
@@ -60,14 +194,88 @@ async def transcribe_api(request: TranscribeRequest):
         }
         raise HTTPException(status_code=500, detail=error_info)
 
+    # 直接从单词表生成 JSON 文本并流式输出，跳过对大量单词 dict 的逐个编码
+    include_words = request.words is not False
+    if request.format == "ndjson":
+        chunks = table.iter_ndjson(request.fields, include_words)
+        media_type = "application/x-ndjson"
+    else:
+        chunks = itertools.chain(
+            ['{"status":"success","data":'],
+            table.iter_json(request.fields, include_words),
+            ["}"],
+        )
+        media_type = "application/json"
+
+    encoding = compression.negotiate(http_request.headers.get("accept-encoding"))
+    headers = {"Vary": "Accept-Encoding"}
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return StreamingResponse(
+        compression.compress_stream(chunks, encoding), media_type=media_type, headers=headers
+    )
+
+
+@app.post("/transcribe/batch")
+async def transcribe_batch_api(request: BatchTranscribeRequest):
+    """
+    批量转录API
+    参数:
+        video_paths: 文件路径或URL列表
+        concurrency: 并发数
+        webhook_base_url: 回调地址前缀（可选）
+    以 NDJSON 流式返回，每个文件完成后输出一行
+    """
+    webhook_url = None
+    if request.webhook_base_url:
+        webhook_url = request.webhook_base_url.rstrip("/") + "/transcribe/webhook"
+    batch = BatchTranscriber(
+        AssemblyAIClient(),
+        transcriber=Transcriber(config.ASSEMBLYAI_API_KEY),
+        concurrency=request.concurrency or config.BATCH_TRANSCRIBE_CONCURRENCY,
+        webhook_url=webhook_url,
+    )
+
+    async def stream():
+        async for item in batch.run(request.video_paths):
+            if item["status"] == "success":
+                # 长转录的分句与序列化较耗时，放到线程中执行，不阻塞事件循环
+                data = await asyncio.to_thread(
+                    transcript_json, item.pop("data"), request.fields, request.words is not False
+                )
+                head = json.dumps(item, ensure_ascii=False)
+                yield f'{head[:-1]}, "data": {data}}}\n'
+                continue
+            yield json.dumps(item, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+
+@app.post("/transcribe/webhook")
+async def transcribe_webhook_api(payload: dict):
+    """AssemblyAI 转录完成回调"""
+    transcript_id = payload.get("transcript_id")
+    if not transcript_id:
+        raise HTTPException(status_code=400, detail={"status": "error", "error_message": "缺少 transcript_id"})
+    matched = webhook_registry.notify(transcript_id)
+    return {"status": "success", "matched": matched}
+
 
 @app.post("/embed_subtitle")
 async def embed_subtitle_api(request: EmbedSubtitleRequest):
     """
-    字幕嵌入API
+    字幕嵌入API（异步任务）
     参数:
         subtitle_data: 字幕数据列表
         video_path: 视频文件路径或URL
+        mode: burn（烧录）或 soft（字幕轨）
+        container: 输出封装格式 mp4/mkv
+        segments: 并行分段数
+        profile/preset/crf/tune/threads/x264_params: 编码参数
+        deadline_seconds: profile=auto 时的目标完成时间
+        ingest: 远程视频读取方式 download/stream
+        renditions: 多分辨率输出列表
+    返回任务ID，通过 /jobs/{job_id} 查询状态
     """
     try:
         # 将Pydantic模型转换为字典列表
@@ -76,20 +284,100 @@ async def embed_subtitle_api(request: EmbedSubtitleRequest):
             item_dict = item.model_dump(by_alias=True)  # 使用别名转换
             subtitle_data.append(item_dict)
 
-        embeder = SubtitleEmbed()
-        output_path = embeder.embed(request.video_path, subtitle_data)
+        embed_options = {
+            "mode": request.mode,
+            "container": request.container,
+            "segments": request.segments,
+            "ingest": request.ingest,
+            "encoding": {
+                "profile": request.profile,
+                "preset": request.preset,
+                "crf": request.crf,
+                "tune": request.tune,
+                "threads": request.threads,
+                "x264_params": request.x264_params,
+                "deadline_seconds": request.deadline_seconds,
+            },
+        }
+        if request.renditions:
+            if request.mode == "soft":
+                raise HTTPException(
+                    status_code=400,
+                    detail={"status": "error", "error_message": "多分辨率输出仅支持烧录模式"},
+                )
+            embed_options = {
+                "renditions": [r.model_dump() for r in request.renditions],
+                "encoding": embed_options["encoding"],
+                "ingest": request.ingest,
+            }
 
-        # 上传输出视频到对象存储
-        s3_oper = S3Operator(
-            endpoint="https://cn-nb1.rains3.com",
-            access_key="6PZZwXqeL1dCdtqh",
-            secret_key="uun5qw9oSmwkc1OhLfcBV2f3DhNseD",
-            bucket="coze-project",
+        # 剩余空间已低于保留线时直接拒绝，避免任务排队后才失败
+        if workspace_manager.free_bytes() < config.WORKSPACE_MIN_FREE_BYTES:
+            # 清理需要遍历并删除目录，放到线程中执行，不阻塞事件循环
+            await asyncio.to_thread(workspace_manager.sweep)
+            if workspace_manager.free_bytes() < config.WORKSPACE_MIN_FREE_BYTES:
+                raise InsufficientSpaceError("磁盘空间不足，请稍后重试")
+        # 相同请求合并为同一任务；本地文件把大小与修改时间计入键，内容变化后不会误用旧结果
+        dedup_payload = request.model_dump()
+        if not request.video_path.startswith("http") and os.path.exists(request.video_path):
+            st = os.stat(request.video_path)
+            dedup_payload["_source_stat"] = [st.st_size, st.st_mtime_ns]
+        job_id = job_manager.submit(
+            run_embed_job,
+            request.video_path,
+            subtitle_data,
+            embed_options,
+            dedup_key=request_key(dedup_payload),
         )
-        object_key = modify_separator(output_path[2:])
-        output_link = s3_oper.upload(object_key, output_path)
+        return {"status": "success", "message": "任务已提交", "job_id": job_id}
+    except HTTPException:
+        raise
+    except (JobQueueFullError, InsufficientSpaceError) as e:
+        raise HTTPException(
+            status_code=503, detail={"status": "error", "error_message": str(e)}
+        )
+    except Exception as e:
+        # 返回详细的错误信息
+        error_info = {
+            "status": "error",
+            "error_type": type(e).__name__,
+            "error_message": str(e),
+            "traceback": traceback.format_exc(),
+        }
+        raise HTTPException(status_code=500, detail=error_info)
 
-        return {"status": "success", "message": "字幕嵌入完成", "output": output_link}
+
+@app.post("/transcribe_embed")
+async def transcribe_embed_api(request: TranscribeEmbedRequest):
+    """
+    转录并嵌入字幕API（异步任务）：源文件只下载一次，转录结果直接生成字幕
+    参数:
+        video_path: 视频文件路径或URL
+        font_color/font_size: 字幕样式
+        mode/container/profile/deadline_seconds: 同 /embed_subtitle
+    返回任务ID，通过 /jobs/{job_id} 查询状态
+    """
+    try:
+        embed_options = {
+            "mode": request.mode,
+            "container": request.container,
+            "encoding": {
+                "profile": request.profile,
+                "deadline_seconds": request.deadline_seconds,
+            },
+        }
+        job_id = job_manager.submit(
+            run_pipeline_job,
+            request.video_path,
+            embed_options,
+            request.font_color,
+            request.font_size,
+        )
+        return {"status": "success", "message": "任务已提交", "job_id": job_id}
+    except JobQueueFullError as e:
+        raise HTTPException(
+            status_code=503, detail={"status": "error", "error_message": str(e)}
+        )
     except Exception as e:
         # 返回详细的错误信息
         error_info = {
@@ -101,6 +389,113 @@ async def embed_subtitle_api(request: EmbedSubtitleRequest):
         raise HTTPException(status_code=500, detail=error_info)
 
 
+@app.get("/jobs/{job_id}")
+async def job_status_api(job_id: str):
+    """查询任务状态"""
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail={"status": "error", "error_message": "任务不存在"})
+    return {"status": "success", "data": job}
+
+
+def _sse(event, data, event_id=None):
+    lines = [f"event: {event}"]
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"data: {json.dumps(data, ensure_ascii=False)}")
+    return "\n".join(lines) + "\n\n"
+
+
+@app.get("/jobs/{job_id}/events")
+async def job_events_api(job_id: str, request: Request):
+    """
+    任务进度事件流（Server-Sent Events）
+    event: progress  各阶段进度（download/encode/concat/mux/upload 等），id 为事件序号
+    event: status    任务状态变化，任务结束后连接关闭
+    断线重连时携带 Last-Event-ID，从该序号之后继续推送
+    """
+    if job_manager.get(job_id) is None:
+        raise HTTPException(status_code=404, detail={"status": "error", "error_message": "任务不存在"})
+    try:
+        cursor = int(request.headers.get("last-event-id") or 0)
+    except ValueError:
+        cursor = 0
+
+    async def stream():
+        nonlocal cursor
+        status = None
+        last_sent = time.time()
+        while True:
+            job = job_manager.get(job_id)
+            for seq, event in job_manager.progress.since(job_id, cursor):
+                cursor = seq
+                last_sent = time.time()
+                yield _sse("progress", event, seq)
+            if job is None:
+                break
+            if job["status"] != status:
+                status = job["status"]
+                last_sent = time.time()
+                yield _sse("status", {"job_id": job_id, "status": status, "error": job["error"]})
+            if status not in ("queued", "running"):
+                # 工作进程最后的事件可能晚于结束状态到达，结束前再补发一次
+                await asyncio.sleep(config.PROGRESS_POLL_INTERVAL)
+                for seq, event in job_manager.progress.since(job_id, cursor):
+                    yield _sse("progress", event, seq)
+                break
+            # 长时间没有事件时发送注释行，避免负载均衡器断开空闲连接
+            if time.time() - last_sent >= config.PROGRESS_KEEPALIVE:
+                last_sent = time.time()
+                yield ": keepalive\n\n"
+            if await request.is_disconnected():
+                break
+            await asyncio.sleep(config.PROGRESS_POLL_INTERVAL)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/jobs/{job_id}/result")
+async def job_result_api(job_id: str):
+    """获取任务结果：未完成返回202，失败返回500"""
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail={"status": "error", "error_message": "任务不存在"})
+    if job["status"] == "success":
+        if isinstance(job["result"], dict):
+            return {"status": "success", "message": "字幕嵌入完成", **job["result"]}
+        return {"status": "success", "message": "字幕嵌入完成", "output": job["result"]}
+    if job["status"] in ("queued", "running"):
+        return JSONResponse(
+            status_code=202,
+            content={"status": job["status"], "message": "任务处理中", "job_id": job_id},
+        )
+    error_info = {"status": "error", **(job["error"] or {"error_message": job["status"]})}
+    raise HTTPException(status_code=500, detail=error_info)
+
+
+@app.get("/metrics")
+async def metrics_api():
+    """Prometheus 文本格式的指标：各阶段耗时/字节数/失败次数、编码速度、任务数"""
+    for status, count in job_manager.counts().items():
+        metrics.set_gauge("jobs", count, status=status)
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.on_event("startup")
+def start_workspace_sweeper():
+    workspace_manager.start_sweeper(config.WORKSPACE_SWEEP_INTERVAL)
+
+
+@app.on_event("shutdown")
+def shutdown_jobs():
+    job_manager.shutdown()
+    workspace_manager.stop_sweeper()
+
+
 if __name__ == "__main__":
     import uvicorn
     import argparse
@@ -0,0 +1,185 @@
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+
+import progress
+
+# 耗时（秒）、字节数、编码速度（视频时长 / 墙钟时间）的直方图分桶
+DURATION_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+BYTES_BUCKETS = tuple(1024**2 * 4**i for i in range(8))  # 1 MiB ~ 16 GiB
+SPEED_BUCKETS = (0.1, 0.25, 0.5, 1, 1.5, 2, 3, 4, 6, 8, 12, 16)
+
+# 指标定义：名称 -> (类型, 说明, 分桶)
+METRICS = {
+    "stage_duration_seconds": ("histogram", "各处理阶段耗时", DURATION_BUCKETS),
+    "stage_bytes": ("histogram", "各处理阶段传输/处理的字节数", BYTES_BUCKETS),
+    "encode_speed_ratio": ("histogram", "编码速度（视频时长/耗时）", SPEED_BUCKETS),
+    "stage_in_flight": ("gauge", "正在执行的阶段数", None),
+    "stage_errors_total": ("counter", "各阶段失败次数", None),
+    "http_request_duration_seconds": ("histogram", "接口耗时", DURATION_BUCKETS),
+    "jobs": ("gauge", "各状态的任务数", None),
+}
+
+
+class Registry:
+    """进程内的指标存储，按 (名称, 标签) 聚合，输出 Prometheus 文本格式"""
+
+    def __init__(self, definitions):
+        self.definitions = definitions
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def apply(self, kind, name, labels, value):
+        """
+        kind: observe（直方图）、inc（计数/仪表加减）、set（仪表赋值）
+        labels: ((键, 值), ...)，需可哈希
+        """
+        key = (name, tuple(labels))
+        with self._lock:
+            if kind == "observe":
+                buckets = self.definitions[name][2]
+                state = self._values.get(key)
+                if state is None:
+                    state = self._values[key] = {"buckets": [0] * len(buckets), "sum": 0.0, "count": 0}
+                for i, bound in enumerate(buckets):
+                    if value <= bound:
+                        state["buckets"][i] += 1
+                state["sum"] += value
+                state["count"] += 1
+            elif kind == "inc":
+                self._values[key] = self._values.get(key, 0) + value
+            elif kind == "set":
+                self._values[key] = value
+
+    def render(self):
+        with self._lock:
+            values = dict(self._values)
+        by_name = {}
+        for (name, labels), value in values.items():
+            by_name.setdefault(name, []).append((labels, value))
+
+        lines = []
+        for name, (kind, help_text, buckets) in self.definitions.items():
+            if name not in by_name:
+                continue
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in sorted(by_name[name]):
+                if kind != "histogram":
+                    lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+                    continue
+                for bound, count in zip(buckets, value["buckets"]):
+                    bucket_labels = labels + (("le", _format_value(bound)),)
+                    lines.append(f"{name}_bucket{_format_labels(bucket_labels)} {count}")
+                inf_labels = labels + (("le", "+Inf"),)
+                lines.append(f"{name}_bucket{_format_labels(inf_labels)} {value['count']}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(value['sum'])}")
+                lines.append(f"{name}_count{_format_labels(labels)} {value['count']}")
+        return "\n".join(lines) + "\n"
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (
+        (k, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for k, v in labels
+    )
+    return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+
+def _format_value(value):
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+registry = Registry(METRICS)
+
+
+def apply(message):
+    """主进程：应用工作进程通过进度队列发来的指标"""
+    registry.apply(message["kind"], message["name"], tuple(map(tuple, message["labels"])), message["value"])
+
+
+def _record(kind, name, value, **labels):
+    # 在任务进程中时发送到主进程汇总，否则直接记录
+    labels = tuple(sorted(labels.items()))
+    message = {"type": "metric", "kind": kind, "name": name, "labels": labels, "value": value}
+    if not progress.send(message):
+        registry.apply(kind, name, labels, value)
+
+
+def observe(name, value, **labels):
+    _record("observe", name, value, **labels)
+
+
+def inc(name, value=1, **labels):
+    _record("inc", name, value, **labels)
+
+
+def set_gauge(name, value, **labels):
+    registry.apply("set", name, tuple(sorted(labels.items())), value)
+
+
+# 请求级追踪ID：接口进程中按请求（contextvar），任务进程中按任务（进程级）
+_trace_id = contextvars.ContextVar("trace_id", default=None)
+_process_trace_id = None
+
+
+def set_trace_id(trace_id, process_wide=False):
+    global _process_trace_id
+    if process_wide:
+        _process_trace_id = trace_id
+        return None
+    return _trace_id.set(trace_id)
+
+
+def reset_trace_id(token):
+    _trace_id.reset(token)
+
+
+def current_trace_id():
+    return _trace_id.get() or _process_trace_id
+
+
+class Span:
+    """stage() 产出的对象，可在阶段内补充字节数、标记失败"""
+
+    def __init__(self, stage):
+        self.stage = stage
+        self.bytes = None
+        self.error_type = None
+
+    def fail(self, error_type):
+        # 没有抛出异常的失败（如上传接口返回错误信息）
+        self.error_type = error_type
+
+
+@contextmanager
+def stage(name):
+    """
+    记录一个处理阶段：耗时直方图、执行中仪表、失败计数，
+    阶段内设置 span.bytes 时同时记录字节数直方图。
+    """
+    span = Span(name)
+    inc("stage_in_flight", 1, stage=name)
+    start = time.time()
+    try:
+        yield span
+    except BaseException as e:
+        span.fail(type(e).__name__)
+        raise
+    finally:
+        elapsed = time.time() - start
+        inc("stage_in_flight", -1, stage=name)
+        observe("stage_duration_seconds", elapsed, stage=name)
+        if span.bytes:
+            observe("stage_bytes", span.bytes, stage=name)
+        if span.error_type:
+            inc("stage_errors_total", 1, stage=name, error_type=span.error_type)
+        trace_id = current_trace_id()
+        if trace_id:
+            status = f"失败 {span.error_type}" if span.error_type else "完成"
+            print(f"[trace {trace_id}] 阶段 {name} {status}，耗时 {elapsed:.2f}s")
@@ -0,0 +1,213 @@
+import os
+import time
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+import ffmpeg
+
+from subtitle import slice_ssa_subtitles
+from utils import modify_separator, hash_file
+from encode_profile import resolve_encoding, ffmpeg_video_kwargs, cache_params
+from progress import report, run_ffmpeg
+
+
+def probe_keyframes(video_path, start_time=0.0):
+    """
+    读取视频流所有关键帧的时间（秒），只解析数据包，不解码画面。
+    返回值减去容器起始时间，与 ffmpeg 输入端 -ss 的时间基准一致。
+    """
+    cmd = [
+        "ffprobe",
+        "-v", "error",
+        "-select_streams", "v:0",
+        "-show_entries", "packet=pts_time,flags",
+        "-of", "csv=p=0",
+        video_path,
+    ]
+    output = subprocess.run(cmd, capture_output=True, check=True, text=True).stdout
+    keyframes = []
+    for line in output.splitlines():
+        parts = line.strip().split(",")
+        if len(parts) >= 2 and "K" in parts[1] and parts[0] not in ("", "N/A"):
+            keyframes.append(float(parts[0]) - start_time)
+    return sorted(set(keyframes))
+
+
+def plan_segments_by_length(keyframes, duration, segment_seconds):
+    """
+    以固定时长为目标在关键帧处切分。切点只取决于视频本身，
+    同一视频多次提交得到相同的片段边界，便于复用已编码片段。
+    """
+    count = max(1, int(duration // segment_seconds))
+    return plan_segments(keyframes, duration, count)
+
+
+def plan_segments(keyframes, duration, count):
+    """
+    在关键帧处把 [0, duration] 切分为最多 count 段，返回 [(start, end), ...]。
+    每个切点取目标位置之后的第一个关键帧，保证每段都能从关键帧开始独立解码。
+    """
+    boundaries = [0.0]
+    idx = 0
+    for i in range(1, count):
+        target = duration * i / count
+        while idx < len(keyframes) and keyframes[idx] < target:
+            idx += 1
+        if idx >= len(keyframes):
+            break
+        if keyframes[idx] > boundaries[-1]:
+            boundaries.append(keyframes[idx])
+    boundaries.append(duration)
+    return [(boundaries[i], boundaries[i + 1]) for i in range(len(boundaries) - 1)]
+
+
+def encode_segment(
+    video_path,
+    subtitle_path,
+    output_path,
+    start,
+    end,
+    encoding,
+    threads,
+    last=False,
+    on_progress=None,
+):
+    """编码单个片段：输入端定位到关键帧，烧录该段的字幕"""
+    input_kwargs = {"ss": f"{start:.6f}"}
+    if not last:
+        input_kwargs["t"] = f"{end - start:.6f}"
+    stream = ffmpeg.input(video_path, **input_kwargs).output(
+        output_path,
+        vf=f"ass={modify_separator(subtitle_path)}",
+        an=None,
+        **ffmpeg_video_kwargs(encoding, threads),
+    )
+    run_ffmpeg(stream, "encode", end - start, quiet=True, on_progress=on_progress)
+    return output_path
+
+
+def concat_segments(segment_paths, audio_source, output_path, work_dir, duration=None):
+    """无损拼接视频片段，并从原视频取音轨"""
+    list_path = os.path.join(work_dir, "segments.txt")
+    with open(list_path, "w", encoding="utf-8") as f:
+        for path in segment_paths:
+            f.write(f"file '{os.path.abspath(path)}'\n")
+
+    video_in = ffmpeg.input(list_path, f="concat", safe=0)
+    audio_in = ffmpeg.input(audio_source)
+    stream = ffmpeg.output(
+        video_in["v"],
+        audio_in["a?"],
+        output_path,
+        vcodec="copy",
+        acodec="aac",
+    )
+    run_ffmpeg(stream, "concat", duration)
+    return output_path
+
+
+def parallel_burn(
+    video_path,
+    subtitle_path,
+    output_path,
+    work_dir,
+    duration,
+    segments,
+    start_time=0.0,
+    segment_cache=None,
+    segment_seconds=30,
+    encoding=None,
+):
+    """
+    分段并行烧录字幕：在关键帧处切分，每段使用重新计算时间的字幕切片，
+    多个 ffmpeg 进程并行编码后无损拼接。
+    传入 segment_cache 时按固定时长切分，字幕未变化的片段直接复用缓存。
+    """
+    video_hash = None
+    keyframes = None
+    if segment_cache is not None:
+        video_hash = hash_file(video_path)
+        keyframes = segment_cache.get_keyframes(video_hash)
+    if keyframes is None:
+        keyframes = probe_keyframes(video_path, start_time)
+        if segment_cache is not None:
+            segment_cache.put_keyframes(video_hash, keyframes)
+
+    if segment_cache is not None:
+        plan = plan_segments_by_length(keyframes, duration, segment_seconds)
+    else:
+        plan = plan_segments(keyframes, duration, segments)
+    workers = max(1, min(segments, len(plan)))
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    encoding = encoding or resolve_encoding(None)
+    encode_params = {"vcodec": "libx264", "vf": "ass", **cache_params(encoding)}
+
+    jobs = []
+    segment_paths = []
+    for i, (start, end) in enumerate(plan):
+        slice_path = os.path.join(work_dir, f"segment_{i:03d}.ssa")
+        slice_ssa_subtitles(subtitle_path, int(start * 1000), int(end * 1000), slice_path)
+        segment_path = os.path.join(work_dir, f"segment_{i:03d}.mp4")
+        segment_paths.append(segment_path)
+        last = i == len(plan) - 1
+
+        cache_key = None
+        if segment_cache is not None:
+            cache_key = segment_cache.make_key(video_hash, start, end, slice_path, encode_params)
+            if segment_cache.get(cache_key, segment_path):
+                continue
+        jobs.append((slice_path, segment_path, start, end, last, cache_key))
+
+    print(f"分段编码: 共 {len(plan)} 段，需编码 {len(jobs)} 段，并行 {workers}，每段 {threads} 线程")
+
+    # 汇总各段进度：已编码时长之和相对需编码总时长
+    encode_total = sum(end - start for _, _, start, end, _, _ in jobs)
+    encoded = {}
+    finished = []
+    progress_lock = threading.Lock()
+    started = time.time()
+
+    def segment_progress(index):
+        def on_progress(snapshot, final=False):
+            with progress_lock:
+                encoded[index] = snapshot.get("out_time", encoded.get(index, 0))
+                if final:
+                    finished.append(index)
+                done = sum(encoded.values())
+                event = {
+                    "segments": len(jobs),
+                    "segments_done": len(finished),
+                    "out_time": round(done, 3),
+                    "speed": round(done / max(time.time() - started, 1e-6), 3),
+                }
+            if encode_total:
+                event["percent"] = round(min(done / encode_total, 1.0) * 100, 1)
+                if event["speed"]:
+                    event["eta"] = round(max(encode_total - done, 0) / event["speed"], 1)
+            report("encode", final=final and len(finished) == len(jobs), **event)
+
+        return on_progress
+
+    def run(item):
+        index, (slice_path, segment_path, start, end, last, cache_key) = item
+        encode_segment(
+            video_path,
+            slice_path,
+            segment_path,
+            start,
+            end,
+            encoding,
+            threads,
+            last=last,
+            on_progress=segment_progress(index),
+        )
+        if cache_key is not None:
+            segment_cache.put(cache_key, segment_path)
+
+    # 每个任务都是独立的 ffmpeg 子进程，线程池只负责调度
+    if jobs:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(run, enumerate(jobs)))
+
+    return concat_segments(segment_paths, video_path, output_path, work_dir, duration)
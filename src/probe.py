@@ -0,0 +1,465 @@
+import os
+import math
+import struct
+import threading
+from collections import OrderedDict
+
+from http_client import get_session
+
+
+class ProbeError(ValueError):
+    pass
+
+
+class FileReader:
+    """本地文件的随机读取"""
+
+    def __init__(self, path):
+        self.path = path
+        self.size = os.path.getsize(path)
+
+    def read_at(self, offset, size):
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            return f.read(size)
+
+
+class HttpRangeReader:
+    """通过 HTTP Range 请求随机读取远程文件，按块缓存减少请求次数"""
+
+    def __init__(self, url, block_size=64 * 1024):
+        self.url = url
+        self.block_size = block_size
+        self._blocks = {}
+        self.size = None
+        # 先读取第一块，同时从 Content-Range 得到文件总大小
+        self._fetch_block(0)
+        if self.size is None:
+            raise ProbeError("服务端不支持 Range 请求")
+
+    def _fetch_block(self, index):
+        if index in self._blocks:
+            return self._blocks[index]
+        start = index * self.block_size
+        end = start + self.block_size - 1
+        response = get_session().get(self.url, headers={"Range": f"bytes={start}-{end}"})
+        if response.status_code != 206:
+            response.close()
+            raise ProbeError(f"Range 请求失败: {response.status_code}")
+        content_range = response.headers.get("Content-Range", "")
+        if "/" in content_range and content_range.rsplit("/", 1)[1] != "*":
+            self.size = int(content_range.rsplit("/", 1)[1])
+        self._blocks[index] = response.content
+        return response.content
+
+    def read_at(self, offset, size):
+        if size > self.block_size * 4:
+            # 大块数据（如 moov）直接一次请求
+            end = min(offset + size, self.size) - 1
+            response = get_session().get(self.url, headers={"Range": f"bytes={offset}-{end}"})
+            if response.status_code != 206:
+                raise ProbeError(f"Range 请求失败: {response.status_code}")
+            return response.content
+        data = b""
+        offset_end = min(offset + size, self.size)
+        pos = offset
+        while pos < offset_end:
+            index = pos // self.block_size
+            block = self._fetch_block(index)
+            block_start = index * self.block_size
+            chunk = block[pos - block_start: offset_end - block_start]
+            if not chunk:
+                break
+            data += chunk
+            pos += len(chunk)
+        return data
+
+
+# ---------------- MP4 / MOV ----------------
+
+MP4_CONTAINERS = {b"moov", b"trak", b"mdia", b"minf", b"stbl", b"edts"}
+MAX_MOOV_SIZE = 64 * 1024 * 1024
+
+
+def _iter_boxes(data, start=0, end=None):
+    """遍历内存中的 box，产出 (类型, 数据起点, 数据终点)"""
+    end = len(data) if end is None else end
+    pos = start
+    while pos + 8 <= end:
+        size, box_type = struct.unpack(">I4s", data[pos:pos + 8])
+        header = 8
+        if size == 1:
+            size = struct.unpack(">Q", data[pos + 8:pos + 16])[0]
+            header = 16
+        elif size == 0:
+            size = end - pos
+        if size < header or pos + size > end:
+            break
+        yield box_type, pos + header, pos + size
+        pos += size
+
+
+def _find_moov(reader):
+    # 只读取顶层 box 头，moov 可能在文件开头或结尾
+    pos = 0
+    while pos + 8 <= reader.size:
+        head = reader.read_at(pos, 16)
+        if len(head) < 8:
+            break
+        size, box_type = struct.unpack(">I4s", head[:8])
+        header = 8
+        if size == 1:
+            size = struct.unpack(">Q", head[8:16])[0]
+            header = 16
+        elif size == 0:
+            size = reader.size - pos
+        if size < header:
+            break
+        if box_type == b"moov":
+            if size > MAX_MOOV_SIZE:
+                raise ProbeError("moov 过大")
+            return reader.read_at(pos, size), header
+        pos += size
+    raise ProbeError("未找到 moov")
+
+
+def _parse_mvhd(data, start):
+    version = data[start]
+    if version == 1:
+        timescale, duration = struct.unpack(">IQ", data[start + 20:start + 32])
+    else:
+        timescale, duration = struct.unpack(">II", data[start + 12:start + 20])
+    return timescale, duration
+
+
+def _parse_tkhd(data, start):
+    version = data[start]
+    base = start + (36 if version == 1 else 24)  # 跳过时间、track_id、duration
+    matrix_start = base + 16  # reserved(8) layer(2) alternate_group(2) volume(2) reserved(2)
+    a, b = struct.unpack(">ii", data[matrix_start:matrix_start + 8])
+    rotation = int(round(math.degrees(math.atan2(b / 65536, a / 65536)))) % 360
+    return rotation
+
+
+def _parse_trak(data, start, end):
+    info = {}
+    for box_type, s, e in _iter_boxes(data, start, end):
+        if box_type == b"tkhd":
+            info["rotation"] = _parse_tkhd(data, s)
+        elif box_type == b"edts":
+            for t, es, ee in _iter_boxes(data, s, e):
+                if t == b"elst":
+                    info["edit_list"] = True
+        elif box_type == b"mdia":
+            for t, ms, me in _iter_boxes(data, s, e):
+                if t == b"hdlr":
+                    info["handler"] = data[ms + 8:ms + 12]
+                elif t == b"mdhd":
+                    info["timescale"], info["media_duration"] = _parse_mvhd(data, ms)
+                elif t == b"minf":
+                    _parse_minf(data, ms, me, info)
+    return info
+
+
+def _parse_minf(data, start, end, info):
+    for t, s, e in _iter_boxes(data, start, end):
+        if t != b"stbl":
+            continue
+        for st, ss, se in _iter_boxes(data, s, e):
+            if st == b"stsd":
+                # version/flags(4) entry_count(4)，随后是第一个样本描述 box
+                entry = ss + 8
+                # size(4) type(4) reserved(6) data_ref(2) pre_defined(2) reserved(2) pre_defined(12)
+                width, height = struct.unpack(">HH", data[entry + 32:entry + 36])
+                info["width"], info["height"] = width, height
+            elif st == b"stts":
+                count = struct.unpack(">I", data[ss + 4:ss + 8])[0]
+                samples = 0
+                total = 0
+                for i in range(count):
+                    n, delta = struct.unpack(">II", data[ss + 8 + i * 8:ss + 16 + i * 8])
+                    samples += n
+                    total += n * delta
+                info["samples"], info["sample_time"] = samples, total
+
+
+def probe_mp4(reader):
+    moov, header = _find_moov(reader)
+    result = {}
+    movie_timescale = movie_duration = 0
+    video = None
+    has_edit_list = False
+    for box_type, s, e in _iter_boxes(moov, header):
+        if box_type == b"mvhd":
+            movie_timescale, movie_duration = _parse_mvhd(moov, s)
+        elif box_type == b"trak":
+            trak = _parse_trak(moov, s, e)
+            has_edit_list = has_edit_list or trak.get("edit_list", False)
+            if video is None and trak.get("handler") == b"vide":
+                video = trak
+    if video is None or not video.get("width"):
+        raise ProbeError("未找到视频流")
+
+    result["width"] = video["width"]
+    result["height"] = video["height"]
+    result["rotation"] = video.get("rotation", 0)
+    if movie_timescale:
+        result["duration"] = movie_duration / movie_timescale
+    elif video.get("timescale"):
+        result["duration"] = video["media_duration"] / video["timescale"]
+    else:
+        result["duration"] = 0.0
+    if video.get("sample_time") and video.get("timescale"):
+        result["fps"] = video["samples"] * video["timescale"] / video["sample_time"]
+    else:
+        result["fps"] = None
+    # 存在编辑列表时起始时间可能不为0，交给 ffprobe 计算
+    result["start_time"] = None if has_edit_list else 0.0
+    return result
+
+
+# ---------------- Matroska / WebM ----------------
+
+EBML_HEADER = 0x1A45DFA3
+MKV_SEGMENT = 0x18538067
+MKV_INFO = 0x1549A966
+MKV_TRACKS = 0x1654AE6B
+MKV_CLUSTER = 0x1F43B675
+MKV_TIMECODE_SCALE = 0x2AD7B1
+MKV_DURATION = 0x4489
+MKV_TRACK_ENTRY = 0xAE
+MKV_TRACK_TYPE = 0x83
+MKV_DEFAULT_DURATION = 0x23E383
+MKV_VIDEO = 0xE0
+MKV_PIXEL_WIDTH = 0xB0
+MKV_PIXEL_HEIGHT = 0xBA
+
+
+def _read_vint(data, pos, keep_marker=False):
+    first = data[pos]
+    length = 1
+    mask = 0x80
+    while length <= 8 and not first & mask:
+        mask >>= 1
+        length += 1
+    if length > 8:
+        raise ProbeError("无效的 EBML 变长整数")
+    value = first if keep_marker else first & (mask - 1)
+    for b in data[pos + 1:pos + length]:
+        value = (value << 8) | b
+    unknown = not keep_marker and value == (1 << (7 * length)) - 1
+    return value, length, unknown
+
+
+def _iter_elements(data, start, end):
+    pos = start
+    while pos < end:
+        element_id, id_len, _ = _read_vint(data, pos, keep_marker=True)
+        size, size_len, unknown = _read_vint(data, pos + id_len)
+        data_start = pos + id_len + size_len
+        data_end = end if unknown else min(data_start + size, end)
+        yield element_id, data_start, data_end
+        pos = data_end
+
+
+def _uint(data, s, e):
+    return int.from_bytes(data[s:e], "big")
+
+
+def _float(data, s, e):
+    return struct.unpack(">f" if e - s == 4 else ">d", data[s:e])[0]
+
+
+def probe_mkv(reader):
+    head = reader.read_at(0, 64)
+    if _read_vint(head, 0, keep_marker=True)[0] != EBML_HEADER:
+        raise ProbeError("不是 EBML 文件")
+    _, id_len, _ = _read_vint(head, 0, keep_marker=True)
+    size, size_len, _ = _read_vint(head, id_len)
+    pos = id_len + size_len + size
+
+    head = reader.read_at(pos, 16)
+    element_id, id_len, _ = _read_vint(head, 0, keep_marker=True)
+    if element_id != MKV_SEGMENT:
+        raise ProbeError("未找到 Segment")
+    _, size_len, _ = _read_vint(head, id_len)
+    pos += id_len + size_len
+
+    # 顺序读取 Segment 的一级子元素头，读到 Info 与 Tracks 为止，遇到 Cluster 停止
+    timecode_scale = 1000000
+    duration = None
+    video = None
+    while pos < reader.size and (duration is None or video is None):
+        head = reader.read_at(pos, 16)
+        if len(head) < 2:
+            break
+        element_id, id_len, _ = _read_vint(head, 0, keep_marker=True)
+        size, size_len, unknown = _read_vint(head, id_len)
+        if element_id == MKV_CLUSTER or unknown:
+            break
+        data_start = pos + id_len + size_len
+        if element_id in (MKV_INFO, MKV_TRACKS):
+            data = reader.read_at(data_start, size)
+            if element_id == MKV_INFO:
+                for eid, s, e in _iter_elements(data, 0, len(data)):
+                    if eid == MKV_TIMECODE_SCALE:
+                        timecode_scale = _uint(data, s, e)
+                    elif eid == MKV_DURATION:
+                        duration = _float(data, s, e)
+            else:
+                video = _parse_mkv_tracks(data)
+        pos = data_start + size
+
+    if video is None or not video.get("width"):
+        raise ProbeError("未找到视频流")
+    default_duration = video.get("default_duration")
+    return {
+        "width": video["width"],
+        "height": video["height"],
+        "rotation": 0,
+        "duration": (duration or 0) * timecode_scale / 1e9,
+        "fps": 1e9 / default_duration if default_duration else None,
+        "start_time": None,
+    }
+
+
+def _parse_mkv_tracks(data):
+    for eid, s, e in _iter_elements(data, 0, len(data)):
+        if eid != MKV_TRACK_ENTRY:
+            continue
+        track = {}
+        for tid, ts, te in _iter_elements(data, s, e):
+            if tid == MKV_TRACK_TYPE:
+                track["type"] = _uint(data, ts, te)
+            elif tid == MKV_DEFAULT_DURATION:
+                track["default_duration"] = _uint(data, ts, te)
+            elif tid == MKV_VIDEO:
+                for vid, vs, ve in _iter_elements(data, ts, te):
+                    if vid == MKV_PIXEL_WIDTH:
+                        track["width"] = _uint(data, vs, ve)
+                    elif vid == MKV_PIXEL_HEIGHT:
+                        track["height"] = _uint(data, vs, ve)
+        if track.get("type") == 1:
+            return track
+    return None
+
+
+# ---------------- 对外接口 ----------------
+
+def ffprobe_video(video_path):
+    import ffmpeg
+
+    # 使用ffprobe获取视频信息
+    probe = ffmpeg.probe(video_path)
+    # 查找视频流
+    video_stream = None
+    for stream in probe['streams']:
+        if stream['codec_type'] == 'video':
+            video_stream = stream
+            break
+    if not video_stream:
+        raise ValueError("未找到视频流")
+
+    # 获取宽度和高度
+    width = int(video_stream.get('width', 0))
+    height = int(video_stream.get('height', 0))
+    fmt = probe.get('format', {})
+    duration = float(fmt.get('duration') or video_stream.get('duration') or 0)
+    start_time = float(fmt.get('start_time') or 0)
+    fps = None
+    rate = video_stream.get('avg_frame_rate') or video_stream.get('r_frame_rate')
+    if rate and rate != "0/0":
+        num, _, den = rate.partition("/")
+        fps = float(num) / float(den or 1)
+    rotation = int(video_stream.get('tags', {}).get('rotate', 0))
+    for side_data in video_stream.get('side_data_list', []):
+        # 新版 ffmpeg 以显示矩阵给出旋转角度（逆时针为正）
+        if 'rotation' in side_data:
+            rotation = -int(side_data['rotation'])
+    rotation %= 360
+    return {
+        "width": width,
+        "height": height,
+        "rotation": rotation,
+        "duration": duration,
+        "fps": fps,
+        "start_time": start_time,
+    }
+
+
+_probe_cache = OrderedDict()
+_probe_cache_lock = threading.Lock()
+_PROBE_CACHE_SIZE = 256
+
+
+def _remote_validator(url):
+    # 只请求第一个字节取 ETag/Last-Modified（预签名链接通常不允许 HEAD）
+    try:
+        response = get_session().get(url, headers={"Range": "bytes=0-0"}, stream=True)
+    except Exception:
+        return None
+    response.close()
+    if response.status_code not in (200, 206):
+        return None
+    return response.headers.get("ETag") or response.headers.get("Last-Modified")
+
+
+def _cache_key(video_path):
+    """本地文件以 inode、大小与修改时间为键；远程文件以 URL 与 ETag/Last-Modified 为键，无法验证时不缓存"""
+    if video_path.startswith("http"):
+        validator = _remote_validator(video_path)
+        return (video_path, validator) if validator else None
+    st = os.stat(video_path)
+    return (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+
+
+def display_size(info):
+    """旋转 90/270 度的视频（如竖拍的手机视频）由 ffmpeg 自动旋转后输出，宽高需要交换"""
+    if info.get("rotation", 0) % 180 == 90:
+        return info["height"], info["width"]
+    return info["width"], info["height"]
+
+
+def probe_video(video_path):
+    """
+    获取视频信息 {width, height, rotation, duration, fps, start_time}。
+    width/height 为按 rotation 旋转后的显示尺寸，与 ffmpeg 自动旋转后的输出一致。
+    优先解析 MP4/MOV 的 moov 或 MKV 的 EBML 头部（远程文件使用 Range 请求），
+    解析失败时回退到 ffprobe。结果按文件（远程文件按 ETag/Last-Modified）缓存。
+    """
+    key = _cache_key(video_path)
+    if key is not None:
+        with _probe_cache_lock:
+            if key in _probe_cache:
+                _probe_cache.move_to_end(key)
+                return dict(_probe_cache[key])
+
+    try:
+        if video_path.startswith("http"):
+            reader = HttpRangeReader(video_path)
+        else:
+            reader = FileReader(video_path)
+        magic = reader.read_at(0, 12)
+        if magic[:4] == b"\x1a\x45\xdf\xa3":
+            info = probe_mkv(reader)
+        else:
+            info = probe_mp4(reader)
+    except Exception as e:
+        print(f"快速探测失败，使用 ffprobe: {e}")
+        info = ffprobe_video(video_path)
+    info["width"], info["height"] = display_size(info)
+
+    if key is not None:
+        with _probe_cache_lock:
+            _probe_cache[key] = info
+            while len(_probe_cache) > _PROBE_CACHE_SIZE:
+                _probe_cache.popitem(last=False)
+    return dict(info)
+
+
+def get_start_time(video_path):
+    """快速探测无法确定起始时间时，用 ffprobe 读取"""
+    import ffmpeg
+
+    fmt = ffmpeg.probe(video_path).get("format", {})
+    return float(fmt.get("start_time") or 0)
@@ -0,0 +1,206 @@
+import time
+import itertools
+import threading
+import subprocess
+from collections import deque
+
+# 工作进程内的上报通道与当前任务ID，由 init_worker / bind 设置
+_queue = None
+_job_id = None
+_last_sent = {}
+_send_lock = threading.Lock()
+
+# 同一阶段两次上报的最小间隔（秒），避免高频事件挤满队列
+MIN_INTERVAL = 0.5
+
+
+def init_worker(queue):
+    """进程池初始化函数：记录主进程传入的事件队列"""
+    global _queue
+    _queue = queue
+
+
+def bind(job_id):
+    """设置当前进程正在执行的任务，之后的 report 都归属该任务"""
+    global _job_id
+    _job_id = job_id
+    _last_sent.clear()
+
+
+def send(message):
+    """发送任意消息到主进程，不在任务进程中时返回 False"""
+    if _queue is None:
+        return False
+    try:
+        _queue.put(message)
+    except (OSError, ValueError):
+        # 主进程已关闭队列，消息丢失不影响任务本身
+        pass
+    return True
+
+
+def report(stage, final=False, **fields):
+    """
+    上报阶段进度，如 report("download", bytes=..., total=...)。
+    不在任务进程中（未绑定任务）时什么也不做；final=True 的事件不受频率限制。
+    """
+    if _queue is None or _job_id is None:
+        return
+    now = time.time()
+    with _send_lock:
+        if not final and now - _last_sent.get(stage, 0) < MIN_INTERVAL:
+            return
+        _last_sent[stage] = now
+    send({"job_id": _job_id, "stage": stage, "time": now, **fields})
+
+
+def _parse_progress(values, duration):
+    """把 -progress 输出的一组键值转换为进度快照"""
+    snapshot = {}
+    for key in ("frame", "fps"):
+        try:
+            snapshot[key] = float(values[key])
+        except (KeyError, ValueError):
+            pass
+    speed = values.get("speed", "").rstrip("x").strip()
+    try:
+        snapshot["speed"] = float(speed)
+    except ValueError:
+        pass
+    # out_time_ms 实际单位也是微秒，优先使用 out_time_us
+    out_time = values.get("out_time_us") or values.get("out_time_ms")
+    try:
+        snapshot["out_time"] = max(int(out_time), 0) / 1_000_000
+    except (TypeError, ValueError):
+        pass
+    if duration and "out_time" in snapshot:
+        snapshot["percent"] = round(min(snapshot["out_time"] / duration, 1.0) * 100, 1)
+        if snapshot.get("speed"):
+            snapshot["eta"] = round(
+                max(duration - snapshot["out_time"], 0) / snapshot["speed"], 1
+            )
+    return snapshot
+
+
+def run_ffmpeg(stream, stage="encode", duration=None, quiet=False, on_progress=None):
+    """
+    代替 ffmpeg-python 的 .run(overwrite_output=True)：附加 -progress pipe:1，
+    逐块解析 frame/fps/speed/out_time 并上报；失败时抛出 ffmpeg.Error。
+    on_progress: 自定义进度回调（如分段编码时汇总各段进度），不传时直接 report。
+    """
+    # 下载、上传模块也会导入本模块上报进度，ffmpeg 只在这里用到
+    import ffmpeg
+
+    args = ffmpeg.compile(stream, overwrite_output=True)
+    args = [args[0], "-progress", "pipe:1", *args[1:]]
+    if on_progress is None:
+        def on_progress(snapshot, final=False):
+            report(stage, final=final, **snapshot)
+
+    process = subprocess.Popen(
+        args,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE if quiet else None,
+        text=True,
+    )
+    stderr_chunks = []
+    stderr_thread = None
+    if quiet:
+        # 单独线程读完 stderr，避免管道写满阻塞 ffmpeg
+        stderr_thread = threading.Thread(
+            target=lambda: stderr_chunks.append(process.stderr.read()), daemon=True
+        )
+        stderr_thread.start()
+
+    values = {}
+    for line in process.stdout:
+        key, sep, value = line.strip().partition("=")
+        if not sep:
+            continue
+        values[key] = value
+        if key == "progress":
+            on_progress(_parse_progress(values, duration), final=value == "end")
+            values = {}
+    process.wait()
+    if stderr_thread is not None:
+        stderr_thread.join()
+    if process.returncode != 0:
+        stderr = "".join(stderr_chunks).encode("utf-8")
+        raise ffmpeg.Error("ffmpeg", b"", stderr)
+
+
+class ProgressHub:
+    """
+    主进程中的进度汇总：按任务保存最近的事件（带递增序号，供 SSE 断线续传）
+    以及每个阶段的最新状态（供状态查询判断任务是否停滞）。
+    """
+
+    def __init__(self, max_events=512):
+        self.max_events = max_events
+        self._events = {}
+        self._latest = {}
+        self._seq = itertools.count(1)
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def publish(self, event):
+        job_id = event.get("job_id")
+        if job_id is None:
+            return
+        with self._lock:
+            seq = next(self._seq)
+            events = self._events.setdefault(job_id, deque(maxlen=self.max_events))
+            events.append((seq, event))
+            self._latest.setdefault(job_id, {})[event["stage"]] = event
+
+    def since(self, job_id, cursor=0):
+        """返回序号大于 cursor 的事件 [(seq, event), ...]"""
+        with self._lock:
+            return [(seq, e) for seq, e in self._events.get(job_id, ()) if seq > cursor]
+
+    def latest(self, job_id):
+        with self._lock:
+            return dict(self._latest.get(job_id, {}))
+
+    def discard(self, job_id):
+        with self._lock:
+            self._events.pop(job_id, None)
+            self._latest.pop(job_id, None)
+
+    def listen(self, queue, handlers=None):
+        """
+        启动后台线程，把工作进程发来的事件写入汇总；收到 None 时退出。
+        handlers: {消息 type: 处理函数}，如指标消息交给 metrics.apply
+        """
+        handlers = handlers or {}
+        if self._thread is not None:
+            return
+
+        def loop():
+            while True:
+                try:
+                    event = queue.get()
+                except (EOFError, OSError):
+                    break
+                if event is None:
+                    break
+                handler = handlers.get(event.get("type"))
+                try:
+                    if handler is not None:
+                        handler(event)
+                    else:
+                        self.publish(event)
+                except Exception as e:
+                    print(f"处理进度消息失败: {e}")
+
+        self._thread = threading.Thread(target=loop, name="progress-listener", daemon=True)
+        self._thread.start()
+
+    def stop(self, queue):
+        if self._thread is None:
+            return
+        try:
+            queue.put(None)
+        except (OSError, ValueError):
+            pass
+        self._thread = None
@@ -0,0 +1,223 @@
+import os
+import json
+import shutil
+import time
+import hashlib
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from http_client import get_session
+from progress import report
+
+try:
+    import fcntl
+except ImportError:  # Windows 下不做进程间加锁
+    fcntl = None
+
+
+class ChecksumMismatchError(RuntimeError):
+    pass
+
+
+class RangedDownloader:
+    """
+    分块并行下载：服务端支持 Accept-Ranges 时，按固定大小的字节区间
+    通过连接池并发下载到预分配的文件中，每个区间独立重试。
+    进度记录在 <目标>.state.json 中，进程崩溃后再次下载同一文件会跳过已完成的区间。
+    """
+
+    def __init__(self, chunk_size, parallelism, retries=3, min_ranged_size=None):
+        self.chunk_size = chunk_size
+        self.parallelism = parallelism
+        self.retries = retries
+        self.min_ranged_size = min_ranged_size or chunk_size * 2
+
+    @contextmanager
+    def _file_lock(self, dest_path):
+        # 同一目标文件同一时间只允许一个进程写入
+        with open(f"{dest_path}.lock", "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def download(self, url, dest_path, response=None, checksum=None, part_path=None):
+        """
+        下载 url 到 dest_path，返回文件大小。
+        response: 已发出的流式 GET 响应（可选），用于复用其响应头判断是否支持分块；
+        checksum: 形如 "sha256:<hex>" 的校验值（可选），下载完成后校验；
+        part_path: 固定的中间文件路径（可选）。先下载到该路径，完成并校验后再移动到 dest_path，
+            移动在文件锁内完成；同一 URL 使用同一 part_path 时中断后可续传。
+        """
+        write_path = part_path or dest_path
+        with self._file_lock(write_path):
+            if response is None:
+                response = get_session().get(url, stream=True)
+                response.raise_for_status()
+            size = int(response.headers.get("Content-Length") or 0)
+            ranged = (
+                response.headers.get("Accept-Ranges", "").lower() == "bytes"
+                and size >= self.min_ranged_size
+                and "Content-Encoding" not in response.headers
+            )
+            if ranged:
+                validator = response.headers.get("ETag") or response.headers.get("Last-Modified")
+                response.close()
+                self._download_ranges(url, write_path, size, validator)
+            else:
+                size = _write_stream(
+                    response, write_path, int(response.headers.get("Content-Length") or 0)
+                )
+
+            if checksum:
+                try:
+                    verify_checksum(write_path, checksum)
+                except ChecksumMismatchError:
+                    os.remove(write_path)
+                    raise
+            if part_path:
+                # 中间文件与目标可能不在同一文件系统
+                shutil.move(part_path, dest_path)
+        return size
+
+    def _download_ranges(self, url, dest_path, size, validator):
+        state_path = f"{dest_path}.state.json"
+        chunks = [
+            (i, offset, min(offset + self.chunk_size, size) - 1)
+            for i, offset in enumerate(range(0, size, self.chunk_size))
+        ]
+
+        # 读取断点信息：同一 URL、同一版本、同样的分块大小才可续传
+        done = set()
+        state = _load_json(state_path)
+        if (
+            state
+            and os.path.exists(dest_path)
+            and state.get("url") == url
+            and state.get("size") == size
+            and state.get("validator") == validator
+            and state.get("chunk_size") == self.chunk_size
+        ):
+            done = set(state.get("done", []))
+            print(f"续传: 已完成 {len(done)}/{len(chunks)} 块")
+        else:
+            # 预分配文件
+            with open(dest_path, "wb") as f:
+                f.truncate(size)
+
+        state = {
+            "url": url,
+            "size": size,
+            "validator": validator,
+            "chunk_size": self.chunk_size,
+            "done": sorted(done),
+        }
+        state_lock = threading.Lock()
+        # 已写入字节数（含续传时已完成的块），用于上报进度
+        received = [sum(end - start + 1 for i, start, end in chunks if i in done)]
+        fd = os.open(dest_path, os.O_WRONLY | getattr(os, "O_BINARY", 0))
+        write_lock = threading.Lock()
+
+        def write_at(offset, data):
+            if hasattr(os, "pwrite"):
+                os.pwrite(fd, data, offset)
+            else:
+                with write_lock:
+                    os.lseek(fd, offset, os.SEEK_SET)
+                    os.write(fd, data)
+            with state_lock:
+                received[0] += len(data)
+                current = received[0]
+            report("download", bytes=current, total=size)
+
+        def fetch(chunk):
+            index, start, end = chunk
+            self._fetch_range(url, start, end, validator, write_at)
+            with state_lock:
+                done.add(index)
+                state["done"] = sorted(done)
+                _save_json(state_path, state)
+
+        pending = [c for c in chunks if c[0] not in done]
+        try:
+            with ThreadPoolExecutor(max_workers=self.parallelism) as executor:
+                list(executor.map(fetch, pending))
+        finally:
+            os.close(fd)
+        os.remove(state_path)
+        report("download", final=True, bytes=size, total=size)
+
+    def _fetch_range(self, url, start, end, validator, write_at):
+        headers = {"Range": f"bytes={start}-{end}"}
+        if validator and not validator.startswith("W/"):
+            # 文件已变化时服务端返回 200 而非 206，避免拼接出混合版本（弱 ETag 不能用于 If-Range）
+            headers["If-Range"] = validator
+        last_error = None
+        for attempt in range(self.retries + 1):
+            if attempt:
+                time.sleep(min(2 ** attempt, 30))
+            try:
+                response = get_session().get(url, headers=headers, stream=True)
+                if response.status_code == 429 or response.status_code >= 500:
+                    response.close()
+                    raise requests.RequestException(f"区间请求返回 {response.status_code}")
+                if response.status_code != 206:
+                    response.close()
+                    raise RuntimeError(f"区间请求返回 {response.status_code}，文件可能已变化")
+                offset = start
+                for data in response.iter_content(chunk_size=1024 * 1024):
+                    if data:
+                        write_at(offset, data)
+                        offset += len(data)
+                if offset != end + 1:
+                    raise requests.RequestException(f"区间不完整: {offset - start}/{end - start + 1}")
+                return
+            except requests.RequestException as e:
+                last_error = e
+                print(f"区间 {start}-{end} 第 {attempt + 1} 次下载失败: {e}")
+        raise RuntimeError(f"区间 {start}-{end} 下载失败: {last_error}")
+
+
+def _write_stream(response, path, total=0):
+    size = 0
+    with open(path, "wb") as f:
+        for chunk in response.iter_content(chunk_size=1024 * 1024):
+            if chunk:
+                f.write(chunk)
+                size += len(chunk)
+                report("download", bytes=size, total=total or None)
+    report("download", final=True, bytes=size, total=size)
+    return size
+
+
+def verify_checksum(path, checksum):
+    algorithm, _, expected = checksum.partition(":")
+    if not expected:
+        algorithm, expected = "sha256", algorithm
+    digest = hashlib.new(algorithm)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    if digest.hexdigest().lower() != expected.lower():
+        raise ChecksumMismatchError(f"校验失败: {path} {algorithm}={digest.hexdigest()}")
+
+
+def _load_json(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def _save_json(path, data):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
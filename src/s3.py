@@ -5,26 +5,75 @@ import base64
 import datetime
 import urllib.parse
 from email.utils import formatdate
+import os
+import time
+import threading
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
 import requests
+from http_client import get_session
+from progress import report
+import metrics
+
+
+class _FileSlice:
+    """文件的只读片段，requests 会按块读取并流式发送，不把整段读入内存"""
+
+    def __init__(self, file_path, offset, length):
+        self._f = open(file_path, "rb")
+        self._f.seek(offset)
+        self._remaining = length
+        self._length = length
+
+    def __len__(self):
+        return self._length
+
+    def read(self, size=-1):
+        if self._remaining <= 0:
+            return b""
+        if size is None or size < 0 or size > self._remaining:
+            size = self._remaining
+        data = self._f.read(size)
+        self._remaining -= len(data)
+        return data
+
+    def close(self):
+        self._f.close()
+
 
 class S3Operator:
-    def __init__(self, endpoint, access_key, secret_key, bucket):
+    def __init__(
+        self,
+        endpoint,
+        access_key,
+        secret_key,
+        bucket,
+        multipart_threshold=64 * 1024 * 1024,
+        part_size=16 * 1024 * 1024,
+        max_concurrency=4,
+        part_retries=3,
+    ):
         self.endpoint = endpoint.rstrip('/')
         self.access_key = access_key
         self.secret_key = secret_key
         self.bucket = bucket
         self.host = urllib.parse.urlparse(endpoint).netloc
+        # 分片上传参数：超过阈值的文件按固定大小分片并行上传
+        self.multipart_threshold = multipart_threshold
+        self.part_size = part_size
+        self.max_concurrency = max_concurrency
+        self.part_retries = part_retries
         
     def generate_date_header(self):
         """生成日期头"""
         return formatdate(timeval=None, localtime=False, usegmt=True)
     
-    def simple_sign(self, method, content_type="", object_key=""):
-        """生成简化签名（适用于S3兼容服务）"""
+    def simple_sign(self, method, content_type="", object_key="", sub_resource=""):
+        """生成简化签名（适用于S3兼容服务），sub_resource 如 "?uploads" """
         date_header = self.generate_date_header()
         
         # 构建签名字符串
-        string_to_sign = f"{method}\n\n{content_type}\n{date_header}\n/{self.bucket}/{object_key}"
+        string_to_sign = f"{method}\n\n{content_type}\n{date_header}\n/{self.bucket}/{object_key}{sub_resource}"
         
         # 计算签名
         signature = base64.b64encode(
@@ -37,32 +86,149 @@ class S3Operator:
         
         return date_header, signature
     
-    def upload(self, object_key, file_path):
-        date_header, signature = self.simple_sign("PUT", "text/plain", object_key)
-        # 构建请求 URL
-        url = f"{self.endpoint}/{self.bucket}/{object_key}"
-        # 构建请求头
+    def _headers(self, method, object_key, content_type="", sub_resource=""):
+        date_header, signature = self.simple_sign(method, content_type, object_key, sub_resource)
         headers = {
             "Host": self.host,
             "Date": date_header,
-            "Content-Type": "text/plain",
             "Authorization": f"AWS {self.access_key}:{signature}"
         }
-        # 读取文件内容
-        with open(file_path, 'rb') as f:
-            file_content = f.read()
+        if content_type:
+            headers["Content-Type"] = content_type
+        return headers
 
-        # 发送 PUT 请求
-        response = requests.put(
-            url=url,
-            headers=headers,
-            data=file_content
-        )
+    def upload(self, object_key, file_path):
+        with metrics.stage("upload") as span:
+            span.bytes = os.path.getsize(file_path)
+            result = self._upload(object_key, file_path)
+            if not result.startswith("http"):
+                # 上传失败时返回服务端的错误信息而不抛出异常
+                span.fail("UploadError")
+        return result
+
+    def _upload(self, object_key, file_path):
+        file_size = os.path.getsize(file_path)
+        if file_size >= self.multipart_threshold:
+            return self.multipart_upload(object_key, file_path)
+
+        # 构建请求 URL
+        url = f"{self.endpoint}/{self.bucket}/{object_key}"
+        # 构建请求头
+        headers = self._headers("PUT", object_key, "text/plain")
+        headers["Content-Length"] = str(file_size)
+
+        report("upload", final=True, bytes=0, total=file_size)
+        # 以文件对象作为请求体，流式发送而不整体读入内存
+        with open(file_path, 'rb') as f:
+            response = get_session().put(
+                url=url,
+                headers=headers,
+                data=f
+            )
         if response.status_code == 200:  
+            report("upload", final=True, bytes=file_size, total=file_size)
             return f"{self.endpoint}/{self.bucket}/{object_key}"
         else:
             return response.text
-    
+
+    def multipart_upload(self, object_key, file_path):
+        """分片上传：固定大小分片直接从磁盘读取，并行上传，单片独立重试，失败时中止"""
+        url = f"{self.endpoint}/{self.bucket}/{object_key}"
+        file_size = os.path.getsize(file_path)
+
+        # 初始化分片上传
+        response = get_session().post(
+            url=f"{url}?uploads",
+            headers=self._headers("POST", object_key, "text/plain", "?uploads"),
+        )
+        if response.status_code != 200:
+            return response.text
+        upload_id = ET.fromstring(response.content).find(".//{*}UploadId").text
+
+        parts = []
+        offset = 0
+        part_number = 1
+        while offset < file_size:
+            length = min(self.part_size, file_size - offset)
+            parts.append((part_number, offset, length))
+            offset += length
+            part_number += 1
+
+        print(f"开始分片上传: {object_key} ({len(parts)} 片)")
+        uploaded = {"parts": 0, "bytes": 0}
+        uploaded_lock = threading.Lock()
+
+        def upload_part(part):
+            etag = self._upload_part(url, object_key, upload_id, file_path, *part)
+            with uploaded_lock:
+                uploaded["parts"] += 1
+                uploaded["bytes"] += part[2]
+                event = dict(uploaded)
+            report(
+                "upload",
+                final=event["parts"] == len(parts),
+                parts_done=event["parts"],
+                parts=len(parts),
+                bytes=event["bytes"],
+                total=file_size,
+            )
+            return etag
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+                etags = list(executor.map(upload_part, parts))
+        except Exception as e:
+            self._abort_multipart(url, object_key, upload_id)
+            return str(e)
+
+        # 合并分片
+        body = "<CompleteMultipartUpload>" + "".join(
+            f"<Part><PartNumber>{n}</PartNumber><ETag>{etag}</ETag></Part>"
+            for (n, _, _), etag in zip(parts, etags)
+        ) + "</CompleteMultipartUpload>"
+        sub_resource = f"?uploadId={upload_id}"
+        response = get_session().post(
+            url=f"{url}{sub_resource}",
+            headers=self._headers("POST", object_key, "application/xml", sub_resource),
+            data=body.encode("utf-8"),
+        )
+        # 部分服务在 200 响应体中返回错误
+        if response.status_code == 200 and b"<Error>" not in response.content:
+            return f"{self.endpoint}/{self.bucket}/{object_key}"
+        self._abort_multipart(url, object_key, upload_id)
+        return response.text
+
+    def _upload_part(self, url, object_key, upload_id, file_path, part_number, offset, length):
+        sub_resource = f"?partNumber={part_number}&uploadId={upload_id}"
+        last_error = None
+        for attempt in range(self.part_retries + 1):
+            if attempt:
+                time.sleep(min(2 ** attempt, 30))
+            body = _FileSlice(file_path, offset, length)
+            try:
+                headers = self._headers("PUT", object_key, "", sub_resource)
+                headers["Content-Length"] = str(length)
+                response = get_session().put(url=f"{url}{sub_resource}", headers=headers, data=body)
+                if response.status_code == 200:
+                    return response.headers.get("ETag")
+                last_error = response.text
+            except requests.RequestException as e:
+                last_error = str(e)
+            finally:
+                body.close()
+            print(f"分片 {part_number} 第 {attempt + 1} 次上传失败: {last_error}")
+        raise RuntimeError(f"分片 {part_number} 上传失败: {last_error}")
+
+    def _abort_multipart(self, url, object_key, upload_id):
+        sub_resource = f"?uploadId={upload_id}"
+        try:
+            get_session().delete(
+                url=f"{url}{sub_resource}",
+                headers=self._headers("DELETE", object_key, "", sub_resource),
+            )
+        except requests.RequestException as e:
+            print(f"中止分片上传失败: {e}")
+
     def download(self, object_key, output_file):
         date_header, signature = self.simple_sign("GET", "", object_key)
         # 构建请求 URL
@@ -74,12 +240,17 @@ class S3Operator:
             "Authorization": f"AWS {self.access_key}:{signature}"
         }
         # 发送 GET 请求
-        response = requests.get(
+        response = get_session().get(
             url=url,
             headers=headers,
             stream=True  # 启用流式下载
         )
         if response.status_code == 200:  
+            # 读完响应体，连接才能归还连接池
+            with open(output_file, "wb") as f:
+                for chunk in response.iter_content(chunk_size=1024 * 1024):
+                    if chunk:
+                        f.write(chunk)
             return output_file
         else:
             return response.text
@@ -95,7 +266,7 @@ class S3Operator:
             "Authorization": f"AWS {self.access_key}:{signature}"
         }
         # 发送 DELETE 请求
-        response = requests.delete(
+        response = get_session().delete(
             url=url,
             headers=headers
         )
@@ -103,4 +274,16 @@ class S3Operator:
             return "success"
         else:
             return response.text
-    
\ No newline at end of file
+    
+
+_default_operator = None
+
+
+def get_default_operator():
+    """返回进程内共享的 S3Operator（使用 config.S3_CONFIG）"""
+    global _default_operator
+    if _default_operator is None:
+        import config
+
+        _default_operator = S3Operator(**config.S3_CONFIG)
+    return _default_operator
@@ -0,0 +1,103 @@
+import os
+import json
+import shutil
+import hashlib
+import threading
+
+
+class SegmentCache:
+    """
+    已编码片段的持久化缓存。键由源视频哈希、片段时间范围、该段字幕内容哈希
+    以及编码参数组成，字幕未变化的片段在重新提交时可直接复用。
+    """
+
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def make_key(self, video_hash, start, end, subtitle_path, encode_params):
+        sha = hashlib.sha256()
+        sha.update(video_hash.encode("utf-8"))
+        sha.update(f":{start:.6f}:{end:.6f}:".encode("utf-8"))
+        with open(subtitle_path, "rb") as f:
+            sha.update(f.read())
+        sha.update(json.dumps(encode_params, sort_keys=True).encode("utf-8"))
+        return sha.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.mp4")
+
+    def get(self, key, dest_path):
+        """命中时把缓存片段硬链接（失败则复制）到 dest_path，返回是否命中"""
+        path = self._path(key)
+        if not os.path.exists(path):
+            return False
+        try:
+            os.utime(path)  # 更新访问时间，供LRU淘汰使用
+            _link_or_copy(path, dest_path)
+        except OSError:
+            return False
+        return True
+
+    def put(self, key, segment_path):
+        path = self._path(key)
+        tmp_path = _tmp_path(path)
+        try:
+            _link_or_copy(segment_path, tmp_path)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"写入片段缓存失败: {e}")
+            return
+        self._evict()
+
+    def get_keyframes(self, video_hash):
+        try:
+            with open(os.path.join(self.cache_dir, f"{video_hash}.keyframes.json")) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def put_keyframes(self, video_hash, keyframes):
+        path = os.path.join(self.cache_dir, f"{video_hash}.keyframes.json")
+        tmp_path = _tmp_path(path)
+        with open(tmp_path, "w") as f:
+            json.dump(keyframes, f)
+        os.replace(tmp_path, path)
+
+    def _evict(self):
+        # 按修改时间（命中时会刷新）淘汰最旧的片段，直到总大小不超过上限
+        entries = []
+        total = 0
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".mp4"):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+            total += st.st_size
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+
+def _tmp_path(path):
+    # 同一进程内多个线程可能同时写入同一条目，临时文件名按进程与线程区分
+    return f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+
+def _link_or_copy(src, dst):
+    if os.path.exists(dst):
+        os.remove(dst)
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
@@ -0,0 +1,85 @@
+import re
+import unicodedata
+
+# 切分句子的标点，与原 split_sentence_by_dot 一致（逗号也切分，字幕每条更短）
+BOUNDARY_PUNCTUATION = frozenset(",.!?。！？")
+# 句末标点之后可能跟的引号、括号
+CLOSING_PUNCTUATION = frozenset("\"'”’)）」』】》")
+# U.S. / e.g. 这类缩写末尾的句点不作为句子边界
+_ABBREVIATION = re.compile(r"^(?:[A-Za-z]\.){2,}$")
+# 在原文中定位单词时，从上一个单词结尾向后搜索的最大距离
+SEARCH_WINDOW = 64
+
+
+def is_boundary(word_text):
+    """单词是否以句子边界标点结尾（小数点在单词内部，不会被当作边界）"""
+    end = len(word_text)
+    while end and word_text[end - 1] in CLOSING_PUNCTUATION:
+        end -= 1
+    if not end or word_text[end - 1] not in BOUNDARY_PUNCTUATION:
+        return False
+    return not _ABBREVIATION.match(word_text[:end])
+
+
+def _is_wide(char):
+    # 中日韩文字与全角标点之间不加空格
+    return unicodedata.east_asian_width(char) in ("W", "F")
+
+
+def join_words(texts):
+    """没有原文可对齐时拼接单词：拉丁文字间加空格，中日韩文字直接相连"""
+    parts = []
+    prev = ""
+    for text in texts:
+        if not text:
+            continue
+        if prev and not (_is_wide(prev[-1]) or _is_wide(text[0])):
+            parts.append(" ")
+        parts.append(text)
+        prev = text
+    return "".join(parts)
+
+
+def iter_sentence_spans(text, word_texts):
+    """
+    按单词上的标点切分句子，逐句产出 (首个单词下标, 末个单词下标 + 1, 句子文本)。
+    只遍历一次单词：文本按单词在原文中的位置截取（保留原有空格），
+    对不上时按单词拼接，因此大小写、标点或中文无空格都不会造成错位。
+    word_texts: 单词文本序列（list 或 WordTable.texts 等只需顺序遍历的可迭代对象）
+    """
+    cursor = 0
+    first = 0
+    span_start = span_end = None
+    aligned = True
+    pending = []
+    i = -1
+    for i, word_text in enumerate(word_texts):
+        pos = -1
+        if word_text:
+            pos = text.find(word_text, cursor, cursor + len(word_text) + SEARCH_WINDOW)
+        if pos < 0:
+            aligned = False
+        else:
+            if i == first:
+                span_start = pos
+            cursor = span_end = pos + len(word_text)
+        pending.append(word_text)
+        if not is_boundary(word_text):
+            continue
+        yield from _emit(text, first, i + 1, span_start, span_end, aligned, pending)
+        first = i + 1
+        span_start = span_end = None
+        aligned = True
+        pending = []
+    # 最后一个单词没有句末标点时，剩余部分作为一句
+    if pending:
+        yield from _emit(text, first, i + 1, span_start, span_end, aligned, pending)
+
+
+def _emit(text, first, end, span_start, span_end, aligned, word_texts):
+    if aligned and span_start is not None:
+        sentence_text = text[span_start:span_end].strip()
+    else:
+        sentence_text = join_words(word_texts).strip()
+    if sentence_text:
+        yield first, end, sentence_text
@@ -1,3 +1,10 @@
+import re
+import unicodedata
+
+import config
+from font_metrics import get_measurer
+
+
 def format_time(ms):
     """将毫秒转换为SSA时间格式: 0:00:00.00"""
     hours = ms // 3600000
@@ -7,6 +14,18 @@ def format_time(ms):
     return f"{hours}:{minutes:02d}:{seconds:02d}.{centiseconds:02d}"
 
 
+def parse_time(time_str):
+    """将SSA时间格式 0:00:00.00 转换为毫秒"""
+    hours, minutes, rest = time_str.strip().split(":")
+    seconds, centiseconds = rest.split(".")
+    return (
+        int(hours) * 3600000
+        + int(minutes) * 60000
+        + int(seconds) * 1000
+        + int(centiseconds.ljust(2, "0")[:2]) * 10
+    )
+
+
 def escape_ssa_text(text):
     """转义SSA中需要特殊处理的字符"""
     text = text.replace("\n", "\\N")
@@ -28,6 +47,39 @@ def hex_to_ssa_color(hex_color):
     return None
 
 
+# 停顿符号：在其处强制分块并删除（'.' 不是小数点时也算，见 iter_phrases）
+PAUSE_PUNCTUATION = frozenset("，；：。、,;:")
+# 行满时紧跟的问号、感叹号并入当前行，不放到下一行行首
+TRAILING_PUNCTUATION = frozenset("?？!！")
+# 不能出现在行首的标点（并入前一个字）与不能出现在行尾的标点（并入后一个字）
+NO_BREAK_BEFORE = TRAILING_PUNCTUATION | frozenset("\"'”’)）」』】》〉…")
+NO_BREAK_AFTER = frozenset("“‘(（「『【《〈")
+# 字幕左右边距（Dialogue 行中的 MarginL/MarginR）与描边宽度，排版可用宽度需扣除
+SUBTITLE_MARGIN_H = 10
+SUBTITLE_OUTLINE = 1
+# 停顿符号候选（'.' 还需排除小数点）与以空白分隔的词
+_PAUSE = re.compile(r"[，；：。、,;:.]")
+_WORD = re.compile(r"\S+")
+
+
+def iter_phrases(text):
+    """
+    按停顿符号切分文本，产出各短语的下标区间 (start, end)，不含停顿符号。
+    英文句点 '.' 仅在不是小数点（前后均为数字）时才视为停顿符号。
+    """
+    n = len(text)
+    start = 0
+    for match in _PAUSE.finditer(text):
+        i = match.start()
+        if text[i] == "." and 0 < i < n - 1 and text[i - 1].isdigit() and text[i + 1].isdigit():
+            continue
+        if i > start:
+            yield start, i
+        start = i + 1
+    if start < n:
+        yield start, n
+
+
 def split_text_with_punctuation_check(text, chunk_size):
     """
     按最大长度 chunk_size 分割文本，满足：
@@ -46,65 +98,17 @@ def split_text_with_punctuation_check(text, chunk_size):
     if chunk_size <= 0:
         return []
 
-    # 停顿符号集合（不含 '.'，因其需特殊判断）
-    pause_punctuations = set("，；：。、,;:")
-    normal_punctuation = "?？!！"
-
+    # 按下标截取，不逐字符拼接字符串
     chunks = []
-    current_chunk = ""
-    i = 0
-    n = len(text)
-
-    while i < n:
-        char = text[i]
-
-        # 判断当前字符是否为“应触发分割的停顿符”
-        is_pause = False
-
-        if char in pause_punctuations:
-            is_pause = True
-        elif char == '.':
-            # 检查是否为小数点：前后均为数字
-            prev_is_digit = (i > 0 and text[i - 1].isdigit())
-            next_is_digit = (i + 1 < n and text[i + 1].isdigit())
-            if prev_is_digit and next_is_digit:
-                # 是小数点，保留，不视为停顿符
-                is_pause = False
-            else:
-                # 不是小数点（如句尾、缩写等），视为停顿符
-                is_pause = True
-
-        if is_pause:
-            # 遇到停顿符：先提交当前块（如果非空）
-            if current_chunk:
-                chunks.append(current_chunk)
-                current_chunk = ""
-            # 跳过该停顿符（不加入任何块）
-            i += 1
-        else:
-            # 普通字符（包括 ? ! ？！和小数点）
-            if len(current_chunk) >= chunk_size:
-                # 当前块已满
-                # 判断下一个字符是否是普通字符
-                if char in normal_punctuation:
-                    current_chunk += char
-                    chunks.append(current_chunk)
-                    current_chunk = ""
-                    i += 1
-                    continue
-                else:
-                    chunks.append(current_chunk)
-                    current_chunk = ""
-
-
-            # 尝试加入当前字符
-            current_chunk += char
-            i += 1
-
-    # 处理最后一块
-    if current_chunk:
-        chunks.append(current_chunk)
-
+    for start, end in iter_phrases(text):
+        while end - start > chunk_size:
+            cut = start + chunk_size
+            if text[cut] in TRAILING_PUNCTUATION:
+                cut += 1
+            chunks.append(text[start:cut])
+            start = cut
+        if start < end:
+            chunks.append(text[start:end])
     return chunks
 
 
@@ -143,30 +147,188 @@ def split_into_n_segments_int(start, end, n):
     return intervals
 
 
-def handle_oversize_sentences(json_data, video_width, base_font_size):
-    # 处理超长句（添加换行符或切割为两条）
-    chunk_size = video_width // base_font_size
+def _is_wide(char, _cache={}):
+    # 中日韩文字与全角标点：任意两字之间都可以换行
+    wide = _cache.get(char)
+    if wide is None:
+        wide = _cache[char] = unicodedata.east_asian_width(char) in ("W", "F")
+    return wide
+
+
+def _phrase_boxes(text, start, end, measurer, max_width):
+    """
+    把短语切分为不可再分的块 [起, 止, 宽度, 前导空格宽度]，块之间是可换行的位置：
+    拉丁文字按空格分词，中日韩文字每字一块，标点按禁则并入相邻的字。
+    单个块比一行还宽时（超长单词）按字符断开，断开后的各段宽度同样尽量均衡。
+    """
+    advance = measurer.advances.__getitem__
+    boxes = []
+    prev_end = start
+    for match in _WORD.finditer(text, start, end):
+        word_start, word_end = match.span()
+        glue = sum(map(advance, text[prev_end:word_start])) if boxes else 0.0
+        prev_end = word_end
+        word = match.group()
+        if word.isascii():
+            boxes.append([word_start, word_end, sum(map(advance, word)), glue])
+            continue
+        # 含中日韩文字的词逐字切分
+        box = None
+        prev_wide = hold = False
+        for i, char in enumerate(word, word_start):
+            width = advance(char)
+            wide = _is_wide(char)
+            if box is not None and (hold or char in NO_BREAK_BEFORE or not (wide or prev_wide)):
+                box[1] = i + 1
+                box[2] += width
+            else:
+                box = [i, i + 1, width, glue]
+                boxes.append(box)
+                glue = 0.0
+            prev_wide = wide
+            hold = char in NO_BREAK_AFTER
+
+    if all(b[2] <= max_width for b in boxes):
+        return boxes
+    split = []
+    for box in boxes:
+        if box[2] <= max_width:
+            split.append(box)
+            continue
+        # 每个字符作为一块，按与短语相同的方式选择断开位置：段数最少且各段宽度均衡
+        chars = [[i, i + 1, advance(text[i]), 0.0] for i in range(box[0], box[1])]
+        starts = [0] + _balanced_breaks(chars, max_width) + [len(chars)]
+        for a, b in zip(starts, starts[1:]):
+            glue = box[3] if a == 0 else 0.0
+            split.append([chars[a][0], chars[b - 1][1], sum(c[2] for c in chars[a:b]), glue])
+    return split
+
+
+def _balanced_breaks(boxes, max_width):
+    """
+    选择换行位置，返回各行起始块的下标（不含 0）。线性时间：
+    从前往后、从后往前各做一次首次适配，得到最少行数 k 以及第 j 个换行位置可取的区间
+    [backward[j], forward[j]]；再把每个换行位置放在该区间内最接近总宽度 j/k 处，
+    使各行宽度尽量均衡。指针都只向前移动。
+    """
+    n = len(boxes)
+    # prefix[b]：前 b 块的总宽度（含块前空格），行 [a, b) 的宽度为 prefix[b] - prefix[a] - 行首空格
+    prefix = [0.0] * (n + 1)
+    for i, box in enumerate(boxes):
+        prefix[i + 1] = prefix[i] + box[3] + box[2]
+
+    def line_width(a, b):
+        return prefix[b] - prefix[a] - boxes[a][3]
+
+    forward = []
+    a = 0
+    while a < n:
+        b = a + 1
+        while b < n and line_width(a, b + 1) <= max_width:
+            b += 1
+        forward.append(b)
+        a = b
+    k = len(forward)
+    if k <= 1:
+        return []
+
+    backward = []
+    b = n
+    while b > 0:
+        a = b - 1
+        while a > 0 and line_width(a - 1, b) <= max_width:
+            a -= 1
+        backward.append(a)
+        b = a
+    backward.reverse()
+
+    breaks = []
+    prev = 0
+    reach = 1
+    p = 0
+    for j in range(1, k):
+        # 从上一个换行位置出发一行最远能到的位置
+        reach = max(reach, prev + 1)
+        while reach < n and line_width(prev, reach + 1) <= max_width:
+            reach += 1
+        lo, hi = backward[j], min(forward[j - 1], reach)
+        target = prefix[n] * j / k
+        p = max(p, lo)
+        while p < hi and prefix[p + 1] <= target:
+            p += 1
+        best = p
+        if p < hi and prefix[p + 1] - target < target - prefix[p]:
+            best = p + 1
+        breaks.append(best)
+        prev = best
+    return breaks
+
+
+def break_lines(text, max_width, font_size, measurer=None):
+    """
+    按渲染后的像素宽度把文本折成多行，每行宽度不超过 max_width：
+    - 停顿符号处强制换行并删除该符号，规则与 split_text_with_punctuation_check 相同；
+    - 拉丁文字只在空格处换行，中日韩文字任意两字之间可换行，问号、感叹号、右引号等不放在行首；
+    - 每个短语使用最少的行数，并在此行数下让各行宽度尽量均衡。
+
+    Args:
+        text (str): 输入文本
+        max_width (float): 每行最大宽度（像素）
+        font_size (int): 字号
+        measurer: font_metrics.TextMeasurer，默认为样式字体的测量器
+
+    Returns:
+        list[str]: 各行文本
+    """
+    measurer = measurer or get_measurer()
+    unit_width = max_width / font_size
+    lines = []
+    for start, end in iter_phrases(text):
+        phrase = text[start:end].strip()
+        if not phrase:
+            continue
+        # 大多数短语一行放得下，不需要切分
+        if measurer.width(phrase) <= unit_width:
+            lines.append(phrase)
+            continue
+        boxes = _phrase_boxes(text, start, end, measurer, unit_width)
+        if not boxes:
+            continue
+        starts = [0] + _balanced_breaks(boxes, unit_width) + [len(boxes)]
+        for a, b in zip(starts, starts[1:]):
+            lines.append(text[boxes[a][0] : boxes[b - 1][1]])
+    return lines
+
+
+def handle_oversize_sentences(json_data, video_width, base_font_size, measurer=None):
+    """
+    处理超长句：按字体字宽测量渲染宽度，一行放得下时原样保留；
+    否则折行，不超过两行时用硬换行连接，超过两行时每两行切为一条，时间按行数均分。
+    换行位置由这里决定，libass 渲染时不需要再自动折行。
+    """
+    measurer = measurer or get_measurer()
+    max_width = video_width - 2 * (SUBTITLE_MARGIN_H + SUBTITLE_OUTLINE)
+    max_line = 2
     handled_json_data = []
     for item in json_data:
         start = item.get("start", 0)
         end = item.get("end", 0)
         text = item.get("text", "")
-        chunks = split_text_with_punctuation_check(text, chunk_size)
-        if len(chunks) > 2:
-            chunks_steps = split_into_n_segments_int(start, end, len(chunks))
-            max_line = 2
-            for idx in range(0,len(chunks),max_line): 
-                arr = chunks[idx:idx+max_line]
+        if measurer.width(text, base_font_size) <= max_width:
+            handled_json_data.append(item)
+            continue
+        lines = break_lines(text, max_width, base_font_size, measurer)
+        if len(lines) > max_line:
+            lines_steps = split_into_n_segments_int(start, end, len(lines))
+            for idx in range(0, len(lines), max_line):
+                arr = lines[idx : idx + max_line]
                 copied = item.copy()
-                copied["text"] = r"\n".join(arr)
-                copied["start"] = chunks_steps[idx][0]
-                copied["end"] = chunks_steps[idx+len(arr)-1][1]
+                copied["text"] = r"\N".join(arr)
+                copied["start"] = lines_steps[idx][0]
+                copied["end"] = lines_steps[idx + len(arr) - 1][1]
                 handled_json_data.append(copied)
-        elif len(text)<=chunk_size+1:
-            handled_json_data.append(item)
         else:
-            text = r"\n".join(chunks)
-            item["text"] = text
+            item["text"] = r"\N".join(lines)
             handled_json_data.append(item)
     return handled_json_data
 
@@ -198,7 +360,7 @@ ScaledBorderAndShadow: yes
 
 [V4+ Styles]
 Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, TertiaryColour, BackColour, Bold, Italic, BorderStyle, Outline, Shadow, Alignment, MarginL, MarginR, MarginV, AlphaLevel, Encoding
-Style: Default,Arial,{base_font_size},&H00FFFFFF,&H000000FF,&H00000000,&H80000000,0,0,1,1,0,2,20,20,30,0,1
+Style: Default,{config.SUBTITLE_FONT},{base_font_size},&H00FFFFFF,&H000000FF,&H00000000,&H80000000,0,0,1,1,0,2,20,20,30,0,1
 
 [Events]
 Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text
@@ -228,7 +390,10 @@ Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text
 
             override = "{" + "".join(overrides) + "}" if overrides else ""
 
-            f.write(f"Dialogue: 0,{start},{end},Default,,10,10,0,,{override}{text}\n")
+            f.write(
+                f"Dialogue: 0,{start},{end},Default,,{SUBTITLE_MARGIN_H},{SUBTITLE_MARGIN_H},0,,"
+                f"{override}{text}\n"
+            )
 
     print(
         f"SSA字幕文件已生成: {output_file} (适配分辨率: {video_width}x{video_height})"
@@ -236,6 +401,32 @@ Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text
     return output_file
 
 
+def slice_ssa_subtitles(ssa_path, start_ms, end_ms, output_file):
+    """
+    截取 SSA 文件中与 [start_ms, end_ms) 重叠的字幕，时间以 start_ms 为零点重新计算，
+    用于分段编码时每段使用独立的字幕文件。头部（分辨率、样式）保持不变。
+    """
+    with open(ssa_path, "r", encoding="utf-8") as f:
+        lines = f.readlines()
+
+    with open(output_file, "w", encoding="utf-8") as f:
+        for line in lines:
+            if not line.startswith("Dialogue:"):
+                f.write(line)
+                continue
+            # Dialogue: Layer,Start,End,Style,...
+            prefix, rest = line.split(":", 1)
+            fields = rest.split(",", 3)
+            start = parse_time(fields[1])
+            end = parse_time(fields[2])
+            if end <= start_ms or start >= end_ms:
+                continue
+            fields[1] = format_time(max(start - start_ms, 0))
+            fields[2] = format_time(end - start_ms)
+            f.write(f"{prefix}: {fields[0].strip()}," + ",".join(fields[1:]))
+    return output_file
+
+
 # 使用示例
 if __name__ == "__main__":
     sample_data = [
@@ -1,27 +1,216 @@
 # Install the assemblyai package by executing the command "pip install assemblyai"
 
 import assemblyai as aai
+import ffmpeg
 import json
-from utils import download_file
+import os
+import hashlib
+import threading
+import time
+import config
+import metrics
+from utils import download_file, hash_file, create_tempdir, workspace_manager
+
+
+def extract_audio(media_path, output_path, codec="opus"):
+    """
+    从媒体文件中提取音轨并转为单声道低码率音频（opus 或 flac），
+    ffmpeg 流式读取输入，只输出转录需要的音频数据。
+    """
+    if codec == "flac":
+        kwargs = {"acodec": "flac", "f": "flac"}
+    else:
+        kwargs = {"acodec": "libopus", "audio_bitrate": "24k", "f": "ogg"}
+    # 同一批次的多个线程可能同时提取同一文件，临时文件名按进程与线程区分
+    tmp_path = f"{output_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    ffmpeg.input(media_path).output(
+        tmp_path, vn=None, ac=1, ar=16000, **kwargs
+    ).run(overwrite_output=True, quiet=True)
+    os.replace(tmp_path, output_path)
+    return output_path
+
+
+# 最近使用过的音频可能正在上传，淘汰时跳过
+AUDIO_CACHE_MIN_AGE = 600
+
+
+def evict_audio_cache(cache_dir, max_bytes, min_age=AUDIO_CACHE_MIN_AGE):
+    """按修改时间（命中时会刷新）淘汰最旧的音频文件，直到总大小不超过上限"""
+    entries = []
+    total = 0
+    for name in os.listdir(cache_dir):
+        if name.endswith(".tmp"):
+            continue
+        path = os.path.join(cache_dir, name)
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        entries.append((st.st_mtime, st.st_size, path))
+        total += st.st_size
+    now = time.time()
+    for mtime, size, path in sorted(entries):
+        if total <= max_bytes or now - mtime < min_age:
+            break
+        try:
+            os.remove(path)
+            total -= size
+        except OSError:
+            pass
+
+
+class CachedTranscript:
+    """从本地缓存恢复的转录结果，提供与 aai.Transcript 相同的常用属性"""
+
+    def __init__(self, transcript_id, json_response):
+        self.id = transcript_id
+        self.status = "completed"
+        self.json_response = json_response
+
+
+class TranscriptCache:
+    """转录结果持久化缓存：键为媒体内容哈希 + 转录配置"""
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def make_key(self, media_hash, transcription_config):
+        raw = transcription_config.raw
+        raw = raw.model_dump(exclude_none=True) if hasattr(raw, "model_dump") else raw.dict(exclude_none=True)
+        # 回调地址不影响转录结果
+        raw = {k: v for k, v in raw.items() if not k.startswith("webhook")}
+        config_str = json.dumps(raw, sort_keys=True, default=str)
+        return hashlib.sha256(f"{media_hash}:{config_str}".encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, key):
+        try:
+            with open(self._path(key), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def put(self, key, transcript_id, json_response=None):
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"transcript_id": transcript_id, "json_response": json_response}, f)
+        os.replace(tmp_path, path)
 
 
 class Transcriber:
     def __init__(self, api_key: str):
         aai.settings.api_key = api_key
         self._transcriber = aai.Transcriber()
+        self._cache = TranscriptCache(config.TRANSCRIPT_CACHE_DIR)
+        self._audio_dir = config.AUDIO_CACHE_DIR
+        os.makedirs(self._audio_dir, exist_ok=True)
+
+    def make_config(self, webhook_url=None):
+        transcription_config = aai.TranscriptionConfig(
+            speech_models=["universal"], speaker_labels=True
+        )
+        if webhook_url:
+            transcription_config.set_webhook(webhook_url)
+        return transcription_config
+
+    def exec(self, video_path: str, use_cache: bool = True):
+        transcription_config = self.make_config()
+        with metrics.stage("transcribe_prepare"):
+            cache_key, transcript, upload_path, temp_dir = self.prepare(
+                video_path, transcription_config, use_cache
+            )
+        try:
+            if transcript is not None:
+                return transcript
+
+            # 上传音频并等待 AssemblyAI 完成转录
+            with metrics.stage("transcribe_wait") as span:
+                span.bytes = os.path.getsize(upload_path)
+                transcript = aai.Transcriber(config=transcription_config).transcribe(upload_path)
+                if transcript.status == "error":
+                    raise RuntimeError(f"Transcription failed: {transcript.error}")
+            self.store(cache_key, transcript.id, transcript.json_response)
+            return transcript
+        finally:
+            self.cleanup(temp_dir)
+
+    def prepare(self, video_path, transcription_config, use_cache=True):
+        """
+        转录前的准备：下载、计算内容哈希、查询缓存、提取音频
 
-    def exec(self, video_path: str):
+        Returns:
+            tuple: (缓存键, 命中的转录结果或None, 待上传的文件路径, 临时目录或None)
+            上传完成后需调用 cleanup(临时目录)
+        """
         # 如果是URL则下载
-        video_path = video_path
+        temp_dir = None
         if video_path.startswith("http"):
-            video_path = download_file(video_path)
-            
-        config = aai.TranscriptionConfig(
-            speech_models=["universal"], speaker_labels=True
+            temp_dir = create_tempdir()
+            video_path = download_file(video_path, temp_dir)
+
+        media_hash = hash_file(video_path)
+        cache_key = None
+        if use_cache:
+            cache_key = self._cache.make_key(media_hash, transcription_config)
+            transcript = self._lookup_cache(cache_key)
+            if transcript is not None:
+                return cache_key, transcript, None, temp_dir
+
+        # 只上传音频，视频画面对转录没有用处
+        upload_path = self.prepare_audio(video_path, media_hash)
+        return cache_key, None, upload_path, temp_dir
+
+    def cleanup(self, temp_dir):
+        if temp_dir is not None:
+            workspace_manager.release(temp_dir)
+
+    def store(self, cache_key, transcript_id, json_response):
+        if cache_key is not None:
+            self._cache.put(cache_key, transcript_id, json_response)
+
+    def prepare_audio(self, media_path, media_hash):
+        """提取音频并按内容哈希缓存，重试时直接复用；提取失败时退回上传原文件"""
+        ext = "flac" if config.AUDIO_CODEC == "flac" else "ogg"
+        audio_path = os.path.join(self._audio_dir, f"{media_hash}.{ext}")
+        if os.path.exists(audio_path):
+            try:
+                os.utime(audio_path)  # 更新访问时间，供LRU淘汰使用
+                return audio_path
+            except OSError:
+                pass  # 刚被淘汰，重新提取
+        try:
+            with metrics.stage("audio_extract"):
+                extract_audio(media_path, audio_path, config.AUDIO_CODEC)
+        except ffmpeg.Error as e:
+            stderr = e.stderr.decode("utf-8", "ignore") if e.stderr else ""
+            print(f"音频提取失败，改为上传原文件: {stderr[-500:]}")
+            return media_path
+        print(
+            f"音频提取完成: {os.path.getsize(media_path)} -> {os.path.getsize(audio_path)} 字节"
         )
-        transcript = aai.Transcriber(config=config).transcribe(video_path)
-        if transcript.status == "error":
-            raise RuntimeError(f"Transcription failed: {transcript.error}")
+        evict_audio_cache(self._audio_dir, config.AUDIO_CACHE_MAX_BYTES)
+        return audio_path
+
+    def _lookup_cache(self, cache_key):
+        # 命中时优先返回本地保存的结果，否则通过转录ID重新获取
+        cached = self._cache.get(cache_key)
+        if cached is None:
+            return None
+        if cached.get("json_response"):
+            print(f"命中转录缓存: {cached['transcript_id']}")
+            return CachedTranscript(cached["transcript_id"], cached["json_response"])
+        try:
+            transcript = self.search_his(cached["transcript_id"])
+        except Exception as e:
+            print(f"转录缓存失效: {e}")
+            return None
+        if transcript.status != "completed":
+            return None
+        self._cache.put(cache_key, transcript.id, transcript.json_response)
         return transcript
 
     def search_his(self, transcript_id: str):
@@ -30,7 +219,7 @@ class Transcriber:
 
 
 if __name__ == "__main__":
-    api_key = "442e2d408ee948a8bd078066a493ac05"
+    api_key = config.ASSEMBLYAI_API_KEY
     video_path = "./immortality-killed-the-witch-animation-dnd-720-publer.io.mp4"
     transcript_id = "3ca78a55-efd7-41f6-96f1-b0336482a53c"
     trans = Transcriber(api_key)
@@ -1,8 +1,15 @@
 import os
+import shutil
 import requests
-import uuid
-from datetime import datetime
-import re
+from http_client import get_session
+import hashlib
+import threading
+import config
+from download_cache import DownloadCache
+from workspace import WorkspaceManager
+from ranged_download import RangedDownloader
+from progress import report
+import metrics
 
 
 def modify_separator(path, new_sep="/"):
@@ -11,87 +18,142 @@ def modify_separator(path, new_sep="/"):
     return path
 
 
+workspace_manager = WorkspaceManager(
+    os.path.join(".", "temp"),
+    ttl=config.WORKSPACE_TTL,
+    max_bytes=config.WORKSPACE_MAX_BYTES,
+    min_free_bytes=config.WORKSPACE_MIN_FREE_BYTES,
+)
+
+
 def create_tempdir():
-    # 生成带时间戳的文件夹名称
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    uuid_short = uuid.uuid4().hex[:8]
-    temp_dir_name = f"{timestamp}_{uuid_short}"
+    # 在 ./temp 下创建带时间戳的任务目录，由 workspace_manager 负责清理
+    return workspace_manager.create()
+
+
+def probe_remote_size(url):
+    """
+    用只取第一个字节的 GET 请求探测远程文件（预签名链接通常不允许 HEAD），
+    返回 (是否支持 Range 请求, 文件总大小或 None)
+    """
+    try:
+        response = get_session().get(
+            url, headers={"Range": "bytes=0-0"}, stream=True, allow_redirects=True
+        )
+    except requests.RequestException:
+        return False, None
+    response.close()
+    if response.status_code == 206:
+        # Content-Range: bytes 0-0/<总大小>，总大小未知时为 *
+        total = response.headers.get("Content-Range", "").rpartition("/")[2]
+        return True, int(total) if total.isdigit() else None
+    if response.ok and response.headers.get("Content-Length", "").isdigit():
+        return False, int(response.headers["Content-Length"])
+    return False, None
+
+
+def estimate_job_bytes(video_path, factor=3):
+    """预估任务占用的磁盘空间：源文件大小 × factor（源文件、片段与输出）"""
+    size = None
+    if video_path.startswith("http"):
+        size = probe_remote_size(video_path)[1]
+    else:
+        try:
+            size = os.path.getsize(video_path)
+        except OSError:
+            pass
+    if size is None:
+        size = config.WORKSPACE_DEFAULT_JOB_BYTES
+    return size * factor
+
+
+def supports_range_requests(url):
+    """服务端是否支持 Range 请求（ffmpeg 直接读取 MP4 时需要按需定位）"""
+    return probe_remote_size(url)[0]
+
+
+_download_cache = None
+
+
+def _get_download_cache():
+    global _download_cache
+    if _download_cache is None:
+        _download_cache = DownloadCache(
+            config.DOWNLOAD_CACHE_DIR, config.DOWNLOAD_CACHE_MAX_BYTES, get_downloader()
+        )
+    return _download_cache
+
+
+_downloader = None
 
-    # 在当前目录下创建临时文件夹
-    temp_dir = os.path.join(".", "temp", temp_dir_name)
 
-    # 创建临时文件夹
-    os.makedirs(temp_dir, exist_ok=True)
-    return temp_dir
+def get_downloader():
+    global _downloader
+    if _downloader is None:
+        _downloader = RangedDownloader(
+            chunk_size=config.DOWNLOAD_CHUNK_SIZE,
+            parallelism=config.DOWNLOAD_PARALLELISM,
+            retries=config.DOWNLOAD_RETRIES,
+        )
+    return _downloader
+
+
+def _part_path(url):
+    # 任务目录每次都是新的，中间文件放在以 URL 哈希命名的固定位置才能续传
+    os.makedirs(config.DOWNLOAD_PART_DIR, exist_ok=True)
+    key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+    return os.path.join(config.DOWNLOAD_PART_DIR, f"{key}.part")
 
 
-def download_file(url, temp_dir=None):
+def download_file(url, temp_dir=None, use_cache=True, checksum=None):
     if temp_dir is None:
         temp_dir = create_tempdir()
 
     local_path = os.path.join(temp_dir, os.path.basename(url.split("?")[0]))
 
     print(f"正在下载: {url}")
-    response = requests.get(url, stream=True)
-    response.raise_for_status()
-
-    with open(local_path, "wb") as f:
-        for chunk in response.iter_content(chunk_size=8192):
-            if chunk:
-                f.write(chunk)
+    with metrics.stage("download") as span:
+        if use_cache and config.DOWNLOAD_CACHE_ENABLED:
+            path, cached = _get_download_cache().fetch(url, local_path, checksum)
+            if cached:
+                report("download", final=True, cached=True, bytes=os.path.getsize(path))
+                # 硬链接到任务目录：与缓存共享同一份数据，且不受缓存淘汰影响；
+                # 无法硬链接（如跨文件系统）时复制一份，任务不直接读取缓存文件
+                if os.path.exists(local_path):
+                    os.remove(local_path)
+                try:
+                    os.link(path, local_path)
+                except OSError:
+                    shutil.copyfile(path, local_path)
+        else:
+            get_downloader().download(
+                url, local_path, checksum=checksum, part_path=_part_path(url)
+            )
+        span.bytes = os.path.getsize(local_path)
     local_path = modify_separator(local_path)
     print(f"下载完成: {local_path}")
     return local_path
 
 
-
-def split_sentence_by_dot(json_response):
-    text = json_response.get("text", "")
-    speaker = json_response.get("speaker", "")
-    words = json_response.get("words", [])
-    confidence = json_response.get("confidence", 0)
-    # 分割并保留分隔符
-    pattern = r'(?<!\d\.)(?<!\d)(?<![A-Za-z]\.)([,.!?。！？]+)\s*'
-    parts = re.split(pattern, text)
-
-    # 组合句子
-    sentences = []
-    for i in range(0, len(parts) - 1, 2):
-        if parts[i].strip():  # 非空句子
-            sentences.append(parts[i] + parts[i + 1])
-
-    # 处理最后一个部分（如果有）
-    if parts[-1].strip():
-        sentences.append(parts[-1])
-    sentences = [
-        {"text": s.strip(), "words": re.split(r"\s+", s.strip())} for s in sentences
-    ]
-    global_words_idx = 0
-    global_start = 0
-    global_end = 0
-    handled_sentences = []
-    for s in sentences:
-        txt = s.get("text", "")
-        wds = s.get("words", [])
-        handled_wds=[]
-        for idx, w in enumerate(wds):
-            global_word = words[global_words_idx]
-            global_word_text = global_word.get("text", "")
-            if w != global_word_text:
-                break
-            global_words_idx+=1
-            handled_wds.append(global_word)
-            if idx == 0:
-                global_start = global_word.get("start", 0)
-            global_end = global_word.get("end", 0)
-        handled_sentences.append(
-            {
-                "speaker": speaker,
-                "text": txt,
-                "confidence": confidence,
-                "start": global_start,
-                "end": global_end,
-                "words": handled_wds
-            }
-        )
-    return handled_sentences
+_hash_memo = {}
+_hash_memo_lock = threading.Lock()
+
+
+def hash_file(path, chunk_size=1024 * 1024):
+    """计算文件内容的 sha256，按 (inode, 大小, 修改时间) 记忆结果，避免重复读盘"""
+    st = os.stat(path)
+    # 以 inode 为键，硬链接到任务目录的缓存文件可以共享结果
+    memo_key = (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+    with _hash_memo_lock:
+        digest = _hash_memo.get(memo_key)
+    if digest is not None:
+        return digest
+
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            sha.update(chunk)
+    digest = sha.hexdigest()
+    with _hash_memo_lock:
+        _hash_memo[memo_key] = digest
+    return digest
@@ -0,0 +1,289 @@
+import json
+from array import array
+from collections import namedtuple
+from json.encoder import encode_basestring
+
+from sentences import iter_sentence_spans
+
+Utterance = namedtuple("Utterance", "text speaker confidence start end lo hi")
+Sentence = namedtuple("Sentence", "text speaker confidence start end lo hi")
+
+
+_encoder = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"))
+_dumps = _encoder.encode
+
+
+# 按列存储的逐词字段，输出时按此顺序
+WORD_FIELDS = ("text", "start", "end", "confidence", "speaker")
+_WORD_KEYS = frozenset(WORD_FIELDS)
+# 置信度为 null 时在列中的占位值
+_NULL_CONFIDENCE = float("nan")
+
+
+class WordTable:
+    """
+    列式存储的逐词结果：起止时间、置信度为并行的 array 列，说话人去重后按编号存储，
+    所有单词文本拼接为一个字符串并记录偏移。
+    长录音的数百万个单词不再各占一个 dict，句子与字幕只保存下标区间。
+    输出与原结果一致：置信度为 null 时仍输出 null，其他逐词字段（如 channel）按下标另存，
+    缺少上述字段或起止时间不是整数的单词按原 dict 保存并原样输出。
+    """
+
+    def __init__(self):
+        self.starts = array("q")
+        self.ends = array("q")
+        self.confidences = array("d")
+        self.speaker_ids = array("H")
+        self.speakers = []
+        self._speaker_index = {}
+        self.offsets = array("Q", [0])
+        # 下标 -> 列之外的字段；下标 -> 无法按列存储的原始单词
+        self.extras = {}
+        self.raw = {}
+        self.null_confidences = 0
+        self._parts = []
+        self._buffer = ""
+        self._rendered = None
+        self._positions = None
+
+    def __len__(self):
+        return len(self.starts)
+
+    def _speaker_id(self, speaker):
+        speaker_id = self._speaker_index.get(speaker)
+        if speaker_id is None:
+            speaker_id = self._speaker_index[speaker] = len(self.speakers)
+            self.speakers.append(speaker)
+        return speaker_id
+
+    def extend(self, words):
+        """追加单词（dict 列表），返回其下标区间 (lo, hi)"""
+        self._rendered = self._positions = None
+        lo = len(self)
+        offset = self.offsets[-1]
+        for i, word in enumerate(words, lo):
+            text = word.get("text")
+            start, end, confidence = word.get("start"), word.get("end"), word.get("confidence")
+            if word.keys() != _WORD_KEYS:
+                extra = {k: v for k, v in word.items() if k not in _WORD_KEYS}
+                if extra:
+                    self.extras[i] = extra
+                if len(word) - len(extra) != len(WORD_FIELDS):
+                    self.raw[i] = dict(word)
+            if type(start) is not int or type(end) is not int or not isinstance(text, str):
+                self.raw[i] = dict(word)
+                start, end = int(start or 0), int(end or 0)
+                text = text if isinstance(text, str) else ""
+            self.starts.append(start)
+            self.ends.append(end)
+            if confidence is None:
+                confidence = _NULL_CONFIDENCE
+                self.null_confidences += 1
+            self.confidences.append(confidence)
+            self.speaker_ids.append(self._speaker_id(word.get("speaker")))
+            self._parts.append(text)
+            offset += len(text)
+            self.offsets.append(offset)
+        return lo, len(self)
+
+    @property
+    def buffer(self):
+        # 文本在首次读取时才拼接，之后追加的部分再增量拼接
+        if self._parts:
+            self._buffer += "".join(self._parts)
+            self._parts = []
+        return self._buffer
+
+    def text(self, i):
+        return self.buffer[self.offsets[i] : self.offsets[i + 1]]
+
+    def texts(self, lo, hi):
+        buffer = self.buffer
+        offsets = self.offsets
+        for i in range(lo, hi):
+            yield buffer[offsets[i] : offsets[i + 1]]
+
+    def word(self, i):
+        """在接口边界上还原为 dict"""
+        if i in self.raw:
+            return dict(self.raw[i])
+        confidence = self.confidences[i]
+        return {
+            "text": self.text(i),
+            "start": self.starts[i],
+            "end": self.ends[i],
+            "confidence": None if confidence != confidence else confidence,  # nan 表示 null
+            "speaker": self.speakers[self.speaker_ids[i]],
+            **self.extras.get(i, {}),
+        }
+
+    def words(self, lo, hi):
+        return [self.word(i) for i in range(lo, hi)]
+
+    def _fragments(self, lo, hi):
+        speakers = [_dumps(s) for s in self.speakers]
+        buffer = self.buffer
+        template = '{"text":%s,"start":%d,"end":%d,"confidence":%r,"speaker":%s}'
+        fragments = (
+            template % (encode_basestring(buffer[a:b]), start, end, confidence, speakers[k])
+            for a, b, start, end, confidence, k in zip(
+                self.offsets[lo:hi],
+                self.offsets[lo + 1 : hi + 1],
+                self.starts[lo:hi],
+                self.ends[lo:hi],
+                self.confidences[lo:hi],
+                self.speaker_ids[lo:hi],
+            )
+        )
+        if not self.extras and not self.raw and not self.null_confidences:
+            return fragments
+        # 含 null 置信度或额外字段时逐个检查，常规单词仍按模板生成
+        confidences = self.confidences
+        return (
+            _dumps(self.word(i))
+            if i in self.raw or i in self.extras or confidences[i] != confidences[i]
+            else fragment
+            for i, fragment in enumerate(fragments, lo)
+        )
+
+    def json(self, lo, hi):
+        """
+        直接从列生成 [lo, hi) 的 JSON 数组，不创建中间 dict。
+        整表生成过一次后记录每个单词在结果中的位置，之后的区间直接截取。
+        """
+        if self._rendered is not None:
+            if lo >= hi:
+                return "[]"
+            positions = self._positions
+            return "[" + self._rendered[positions[lo] : positions[hi] - 1] + "]"
+        if (lo, hi) != (0, len(self)):
+            return "[" + ",".join(self._fragments(lo, hi)) + "]"
+
+        fragments = list(self._fragments(lo, hi))
+        positions = array("Q", [1])
+        for fragment in fragments:
+            positions.append(positions[-1] + len(fragment) + 1)
+        rendered = "[" + ",".join(fragments) + "]"
+        self._rendered, self._positions = rendered, positions
+        return rendered
+
+
+class TranscriptTable:
+    """
+    转录结果的紧凑表示：逐词数据存于 WordTable，每段话只记录文本、说话人与下标区间，
+    其余顶层字段原样保留；分句、生成字幕都基于下标区间，只在输出时生成 dict/JSON。
+    """
+
+    def __init__(self, fields, words, utterances, word_range):
+        self.fields = fields
+        self.words = words
+        self.utterances = utterances
+        self.word_range = word_range
+
+    @classmethod
+    def from_json_response(cls, json_response):
+        words = WordTable()
+        utterances = []
+        for u in json_response.get("utterances") or []:
+            lo, hi = words.extend(u.get("words") or [])
+            utterances.append(
+                Utterance(
+                    u.get("text") or "",
+                    u.get("speaker", ""),
+                    u.get("confidence", 0),
+                    u.get("start", 0),
+                    u.get("end", 0),
+                    lo,
+                    hi,
+                )
+            )
+        # 顶层 words 与各段话的 words 相同（按顺序拼接），一致时只存一份
+        top_words = json_response.get("words") or []
+        if utterances and len(top_words) == len(words):
+            word_range = (0, len(words))
+        else:
+            word_range = words.extend(top_words)
+        # 保留原有字段顺序，words/utterances 输出时由表生成（只记录原值是否为 null）
+        fields = {
+            k: v if k not in ("words", "utterances") else (v is not None)
+            for k, v in json_response.items()
+        }
+        return cls(fields, words, utterances, word_range)
+
+    def iter_sentences(self):
+        """逐句产出 Sentence（文本、说话人、起止时间、单词下标区间）"""
+        words = self.words
+        for u in self.utterances:
+            if u.lo == u.hi:
+                if u.text.strip():
+                    yield Sentence(u.text.strip(), u.speaker, u.confidence, u.start, u.end, u.lo, u.hi)
+                continue
+            for first, end, text in iter_sentence_spans(u.text, words.texts(u.lo, u.hi)):
+                lo, hi = u.lo + first, u.lo + end
+                yield Sentence(
+                    text, u.speaker, u.confidence, words.starts[lo], words.ends[hi - 1], lo, hi
+                )
+
+    def sentence_dict(self, sentence):
+        """单句除逐词数据外的字段"""
+        return {
+            "speaker": sentence.speaker,
+            "text": sentence.text,
+            "confidence": sentence.confidence,
+            "start": sentence.start,
+            "end": sentence.end,
+        }
+
+    def sentence_json(self, sentence, include_words=True):
+        """单句的 JSON，单词数组直接由列生成"""
+        head = _dumps(self.sentence_dict(sentence))
+        if not include_words:
+            return head
+        return f'{head[:-1]},"words":{self.words.json(sentence.lo, sentence.hi)}}}'
+
+    def _projected(self, fields, include_words):
+        for key, value in self.fields.items():
+            if fields is not None and key not in fields:
+                continue
+            if key == "words" and not include_words:
+                continue
+            yield key, value
+
+    def iter_json(self, fields=None, include_words=True):
+        """
+        逐块生成与原 json_response 相同结构的 JSON（utterances 替换为分句结果），
+        长转录不需要先构造完整的 dict 再序列化。
+        fields: 只输出这些顶层字段（None 为全部）；include_words=False 时不输出任何逐词数据
+        """
+        yield "{"
+        for index, (key, value) in enumerate(self._projected(fields, include_words)):
+            yield ("," if index else "") + _dumps(key) + ":"
+            if key == "words":
+                yield self.words.json(*self.word_range) if value else "null"
+            elif key == "utterances":
+                yield "["
+                for i, sentence in enumerate(self.iter_sentences()):
+                    yield ("," if i else "") + self.sentence_json(sentence, include_words)
+                yield "]"
+            else:
+                yield _dumps(value)
+        yield "}"
+
+    def iter_ndjson(self, fields=None, include_words=True):
+        """
+        按行输出：首行为除 words/utterances 外的顶层字段（type=transcript），
+        之后每句一行（type=utterance，分句一句输出一句），末行 type=end 给出句子数。
+        逐词数据只随每句输出，不单独输出顶层 words。
+        """
+        header = {
+            key: value
+            for key, value in self._projected(fields, include_words)
+            if key not in ("words", "utterances")
+        }
+        yield _dumps({"type": "transcript", **header}) + "\n"
+        count = 0
+        if fields is None or "utterances" in fields:
+            for sentence in self.iter_sentences():
+                yield '{"type":"utterance",' + self.sentence_json(sentence, include_words)[1:] + "\n"
+                count += 1
+        yield _dumps({"type": "end", "utterances": count}) + "\n"
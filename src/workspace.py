@@ -0,0 +1,164 @@
+import os
+import time
+import uuid
+import shutil
+import threading
+from datetime import datetime
+
+ACTIVE_MARKER = ".active"
+
+
+class InsufficientSpaceError(RuntimeError):
+    pass
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, OSError):
+        return True
+    return True
+
+
+def _dir_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+    return total
+
+
+class WorkspaceManager:
+    """
+    任务工作目录的生命周期管理：
+    - create 创建目录并写入占用标记（进程号），release 在任务成功后删除目录；
+    - sweep 删除超过 TTL 的闲置目录，并在总大小超出预算时按最近修改时间淘汰；
+    - admit 在任务开始前检查磁盘剩余空间，不足时先清理，再等待或拒绝。
+    """
+
+    def __init__(self, root, ttl, max_bytes, min_free_bytes, hard_ttl=None):
+        self.root = root
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.min_free_bytes = min_free_bytes
+        # 占用标记超过该时间仍未释放，视为异常残留
+        self.hard_ttl = hard_ttl or ttl * 24
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def create(self):
+        # 生成带时间戳的文件夹名称
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        uuid_short = uuid.uuid4().hex[:8]
+        path = os.path.join(self.root, f"{timestamp}_{uuid_short}")
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, ACTIVE_MARKER), "w") as f:
+            f.write(str(os.getpid()))
+        return path
+
+    def deactivate(self, path):
+        """任务结束但保留目录（如失败后便于排查），交由清理线程按 TTL 删除"""
+        try:
+            os.remove(os.path.join(path, ACTIVE_MARKER))
+        except OSError:
+            pass
+
+    def release(self, path):
+        shutil.rmtree(path, ignore_errors=True)
+
+    def _is_active(self, path, now):
+        marker = os.path.join(path, ACTIVE_MARKER)
+        try:
+            with open(marker) as f:
+                pid = int(f.read().strip() or 0)
+            age = now - os.path.getmtime(marker)
+        except (OSError, ValueError):
+            return False
+        return _pid_alive(pid) and age < self.hard_ttl
+
+    def _last_modified(self, path):
+        latest = os.path.getmtime(path)
+        for entry in os.scandir(path):
+            try:
+                latest = max(latest, entry.stat(follow_symlinks=False).st_mtime)
+            except OSError:
+                pass
+        return latest
+
+    def sweep(self):
+        """清理一次，返回释放的字节数"""
+        if not os.path.isdir(self.root):
+            return 0
+        with self._lock:
+            now = time.time()
+            freed = 0
+            idle = []
+            total = 0
+            for entry in os.scandir(self.root):
+                if not entry.is_dir(follow_symlinks=False):
+                    continue
+                size = _dir_size(entry.path)
+                total += size
+                if self._is_active(entry.path, now):
+                    continue
+                idle.append((self._last_modified(entry.path), size, entry.path))
+
+            for mtime, size, path in sorted(idle):
+                # 过期的闲置目录直接删除；未过期的在超出预算时从最旧的开始删除
+                if now - mtime < self.ttl and total <= self.max_bytes:
+                    continue
+                self.release(path)
+                total -= size
+                freed += size
+                print(f"清理临时目录: {path} ({size} 字节)")
+            return freed
+
+    def free_bytes(self):
+        os.makedirs(self.root, exist_ok=True)
+        return shutil.disk_usage(self.root).free
+
+    def admit(self, estimated_bytes, wait_seconds=0, interval=5):
+        """
+        磁盘剩余空间需满足 预估大小 + 最低保留空间。
+        不足时先清理，仍不足则最多等待 wait_seconds 秒，超时抛出 InsufficientSpaceError。
+        """
+        required = estimated_bytes + self.min_free_bytes
+        deadline = time.time() + wait_seconds
+        swept = False
+        while True:
+            free = self.free_bytes()
+            if free >= required:
+                return
+            if not swept:
+                self.sweep()
+                swept = True
+                continue
+            if time.time() >= deadline:
+                raise InsufficientSpaceError(
+                    f"磁盘空间不足: 需要 {required} 字节，剩余 {free} 字节"
+                )
+            time.sleep(interval)
+
+    def start_sweeper(self, interval=300):
+        if self._thread is not None:
+            return
+
+        def loop():
+            while not self._stop.wait(interval):
+                try:
+                    self.sweep()
+                except Exception as e:
+                    print(f"清理临时目录失败: {e}")
+
+        self._thread = threading.Thread(target=loop, name="workspace-sweeper", daemon=True)
+        self._thread.start()
+
+    def stop_sweeper(self):
+        self._stop.set()
+        self._thread = None
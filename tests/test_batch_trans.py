@@ -0,0 +1,93 @@
+import asyncio
+import threading
+
+from batch_trans import BatchTranscriber, StubTranscriptionClient, WebhookRegistry
+
+
+class TrackingClient(StubTranscriptionClient):
+    """按文件设置完成前的查询次数，并记录同时处理中的文件数"""
+
+    def __init__(self, polls=None, **kwargs):
+        super().__init__(**kwargs)
+        self.polls = polls or {}
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+
+    def submit(self, upload_path, transcription_config=None):
+        with self._lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        return super().submit(upload_path, transcription_config)
+
+    def poll(self, transcript_id):
+        job = self._jobs[transcript_id]
+        job["polls"] += 1
+        if job["polls"] < self.polls.get(job["path"], self.polls_until_done):
+            return "processing", None, None
+        with self._lock:
+            self.active -= 1
+        if job["path"] in self.errors:
+            return "error", None, self.errors[job["path"]]
+        return "completed", {"id": transcript_id, "words": []}, None
+
+
+def collect(transcriber, paths):
+    async def run():
+        return [result async for result in transcriber.run(paths)]
+
+    return asyncio.run(run())
+
+
+def test_results_stream_in_completion_order():
+    client = TrackingClient(polls={"slow.mp4": 5, "fast.mp4": 1})
+    results = collect(BatchTranscriber(client, poll_interval=0.01), ["slow.mp4", "fast.mp4"])
+    assert [(r["index"], r["video_path"]) for r in results] == [(1, "fast.mp4"), (0, "slow.mp4")]
+    assert all(r["status"] == "success" for r in results)
+
+
+def test_concurrency_bound():
+    client = TrackingClient(polls_until_done=3)
+    paths = [f"{i}.mp4" for i in range(6)]
+    results = collect(BatchTranscriber(client, concurrency=2, poll_interval=0.01), paths)
+    assert sorted(r["index"] for r in results) == list(range(6))
+    assert client.max_active == 2
+
+
+def test_item_error_does_not_stop_batch():
+    client = TrackingClient(errors={"bad.mp4": "audio too short"})
+    results = collect(
+        BatchTranscriber(client, poll_interval=0.01), ["a.mp4", "bad.mp4", "b.mp4"]
+    )
+    by_path = {r["video_path"]: r for r in results}
+    assert len(results) == 3
+    assert by_path["bad.mp4"]["status"] == "error"
+    assert "audio too short" in by_path["bad.mp4"]["error_message"]
+    assert by_path["a.mp4"]["status"] == by_path["b.mp4"]["status"] == "success"
+
+
+def test_webhook_wakes_waiting_item():
+    registry = WebhookRegistry()
+    client = TrackingClient(polls_until_done=2)
+    transcriber = BatchTranscriber(
+        client,
+        webhook_url="http://example.com/webhook",
+        webhook_poll_interval=60,
+        registry=registry,
+    )
+
+    async def run():
+        async def deliver():
+            # 等到轮询协程注册后再回调
+            while not registry.notify("stub-1"):
+                await asyncio.sleep(0.01)
+
+        webhook = asyncio.create_task(deliver())
+        results = [r async for r in transcriber.run(["a.mp4"])]
+        await webhook
+        return results
+
+    # 兜底查询间隔为 60 秒，能在超时前完成说明是被回调唤醒的
+    results = asyncio.run(asyncio.wait_for(run(), timeout=5))
+    assert results[0]["status"] == "success"
+    assert results[0]["transcript_id"] == "stub-1"
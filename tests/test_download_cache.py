@@ -0,0 +1,28 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from download_cache import DownloadCache
+from ranged_download import RangedDownloader
+
+from test_ranged_download import CHUNK, DATA, no_backoff, server  # noqa: F401
+
+
+def test_concurrent_fetch_of_same_url(server, tmp_path):
+    cache = DownloadCache(
+        str(tmp_path / "cache"),
+        1024**3,
+        RangedDownloader(chunk_size=CHUNK, parallelism=4),
+    )
+
+    def fetch(i):
+        return cache.fetch(server.url, str(tmp_path / f"fallback{i}"))
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        results = list(executor.map(fetch, range(4)))
+
+    paths = {path for path, cached in results}
+    assert len(paths) == 1
+    assert all(cached for path, cached in results)
+    with open(paths.pop(), "rb") as f:
+        assert f.read() == DATA
+    # 只有一个请求真正分块下载了文件
+    assert len([r for r in server.requests if r]) == len(DATA) // CHUNK + 1
@@ -0,0 +1,94 @@
+import struct
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import probe
+
+
+def _box(box_type, payload):
+    return struct.pack(">I4s", 8 + len(payload), box_type) + payload
+
+
+def make_mp4(width, height, rotation=0):
+    """只含 ftyp 与 moov 的最小 MP4：一条 width x height 的视频轨，tkhd 矩阵按 rotation 旋转"""
+    a, b = {0: (1, 0), 90: (0, 1), 180: (-1, 0), 270: (0, -1)}[rotation]
+    matrix = struct.pack(">9i", a << 16, b << 16, 0, -b << 16, a << 16, 0, 0, 0, 1 << 30)
+    tkhd = _box(b"tkhd", b"\0" * 40 + matrix + struct.pack(">II", width << 16, height << 16))
+    mdhd = _box(b"mdhd", b"\0" * 12 + struct.pack(">II", 30000, 150000) + b"\0" * 4)
+    hdlr = _box(b"hdlr", b"\0" * 8 + b"vide" + b"\0" * 12)
+    sample_entry = struct.pack(">I4s", 86, b"avc1") + b"\0" * 24 + struct.pack(">HH", width, height)
+    sample_entry += b"\0" * (86 - len(sample_entry))
+    stsd = _box(b"stsd", struct.pack(">II", 0, 1) + sample_entry)
+    stts = _box(b"stts", struct.pack(">IIII", 0, 1, 150, 1000))
+    minf = _box(b"minf", _box(b"stbl", stsd + stts))
+    trak = _box(b"trak", tkhd + _box(b"mdia", mdhd + hdlr + minf))
+    mvhd = _box(b"mvhd", b"\0" * 12 + struct.pack(">II", 1000, 5000) + b"\0" * 80)
+    return _box(b"ftyp", b"isom" + b"\0" * 4) + _box(b"moov", mvhd + trak)
+
+
+@pytest.mark.parametrize(
+    "rotation, expected",
+    [(0, (1920, 1080)), (90, (1080, 1920)), (180, (1920, 1080)), (270, (1080, 1920))],
+)
+def test_rotated_video_uses_display_size(tmp_path, rotation, expected):
+    path = tmp_path / f"rotated_{rotation}.mp4"
+    path.write_bytes(make_mp4(1920, 1080, rotation))
+    info = probe.probe_video(str(path))
+    assert (info["width"], info["height"]) == expected
+    assert info["rotation"] == rotation
+    assert info["duration"] == 5.0
+    assert info["fps"] == 30.0
+
+
+class VideoHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        data, etag = self.server.data, self.server.etag
+        start, end = 0, len(data) - 1
+        range_header = self.headers.get("Range")
+        if range_header:
+            first, _, last = range_header.split("=")[1].partition("-")
+            start, end = int(first), min(int(last or end), end)
+        body = data[start : end + 1]
+        self.send_response(206 if range_header else 200)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Content-Range", f"bytes {start}-{end}/{len(data)}")
+        self.send_header("Accept-Ranges", "bytes")
+        if etag:
+            self.send_header("ETag", etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), VideoHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    httpd.url = f"http://127.0.0.1:{httpd.server_address[1]}/video.mp4"
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_remote_probe_cache_follows_etag(server):
+    server.data, server.etag = make_mp4(1280, 720), '"v1"'
+    assert (probe.probe_video(server.url)["width"], probe.probe_video(server.url)["height"]) == (1280, 720)
+
+    # 远程文件替换后 ETag 变化，不再使用旧的探测结果
+    server.data, server.etag = make_mp4(640, 360, rotation=90), '"v2"'
+    info = probe.probe_video(server.url)
+    assert (info["width"], info["height"]) == (360, 640)
+
+
+def test_remote_probe_without_validator_is_not_cached(server):
+    server.data, server.etag = make_mp4(1280, 720), None
+    assert probe.probe_video(server.url)["width"] == 1280
+    server.data = make_mp4(640, 360)
+    assert probe.probe_video(server.url)["width"] == 640
@@ -0,0 +1,170 @@
+import os
+import hashlib
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import ranged_download
+import utils
+from ranged_download import ChecksumMismatchError, RangedDownloader
+
+CHUNK = 64 * 1024
+DATA = os.urandom(CHUNK * 8 + 1234)
+
+
+class FileHandler(BaseHTTPRequestHandler):
+    """按 server 上的配置返回 DATA：可关闭 Range 支持、让指定区间断开连接或失败"""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        range_header = self.headers.get("Range")
+        with server.lock:
+            server.requests.append(range_header)
+        if not range_header or not server.ranges:
+            self._send(200, DATA, accept_ranges=server.ranges)
+            return
+
+        start, end = (int(v) for v in range_header.split("=")[1].split("-"))
+        with server.lock:
+            fail = server.fail_ranges.get(start, 0)
+            if fail:
+                server.fail_ranges[start] = fail - 1
+        if fail:
+            if server.fail_mode == "drop":
+                # 发送完整的响应头与一半内容后断开
+                body = DATA[start : end + 1]
+                self.send_response(206)
+                self.send_header("Content-Length", str(len(body)))
+                self.send_header("Content-Range", f"bytes {start}-{end}/{len(DATA)}")
+                self.end_headers()
+                self.wfile.write(body[: len(body) // 2])
+                self.wfile.flush()
+                self.close_connection = True
+            else:
+                self._send(503, b"unavailable")
+            return
+        self._send(206, DATA[start : end + 1], content_range=f"bytes {start}-{end}/{len(DATA)}")
+
+    def _send(self, status, body, accept_ranges=False, content_range=None):
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", '"v1"')
+        if accept_ranges:
+            self.send_header("Accept-Ranges", "bytes")
+        if content_range:
+            self.send_header("Content-Range", content_range)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), FileHandler)
+    httpd.lock = threading.Lock()
+    httpd.requests = []
+    httpd.ranges = True
+    httpd.fail_ranges = {}
+    httpd.fail_mode = "drop"
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    httpd.url = f"http://127.0.0.1:{httpd.server_address[1]}/video.mp4"
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(ranged_download.time, "sleep", lambda seconds: None)
+
+
+def _downloader(retries=3):
+    return RangedDownloader(chunk_size=CHUNK, parallelism=4, retries=retries)
+
+
+def _read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def _range_requests(server):
+    return [r for r in server.requests if r]
+
+
+def test_chunked_ranged_download(server, tmp_path):
+    dest = tmp_path / "video.mp4"
+    size = _downloader().download(server.url, str(dest))
+    assert size == len(DATA)
+    assert _read(dest) == DATA
+    assert len(_range_requests(server)) == 9
+    assert not os.path.exists(f"{dest}.state.json")
+
+
+def test_download_without_range_support(server, tmp_path):
+    server.ranges = False
+    dest = tmp_path / "video.mp4"
+    size = _downloader().download(server.url, str(dest))
+    assert size == len(DATA)
+    assert _read(dest) == DATA
+    assert _range_requests(server) == []
+
+
+def test_retry_after_dropped_connection(server, tmp_path):
+    server.fail_ranges = {CHUNK * 2: 1, CHUNK * 5: 2}
+    dest = tmp_path / "video.mp4"
+    _downloader().download(server.url, str(dest))
+    assert _read(dest) == DATA
+    ranges = _range_requests(server)
+    assert ranges.count(f"bytes={CHUNK * 2}-{CHUNK * 3 - 1}") == 2
+    assert ranges.count(f"bytes={CHUNK * 5}-{CHUNK * 6 - 1}") == 3
+
+
+def test_resume_from_part_file(server, tmp_path):
+    dest = tmp_path / "video.mp4"
+    part = tmp_path / "parts" / "video.mp4.part"
+    part.parent.mkdir()
+    failed = f"bytes={CHUNK * 3}-{CHUNK * 4 - 1}"
+    server.fail_mode = "error"
+    server.fail_ranges = {CHUNK * 3: 10}
+    with pytest.raises(RuntimeError):
+        _downloader(retries=0).download(server.url, str(dest), part_path=str(part))
+    assert not dest.exists()
+    assert os.path.exists(f"{part}.state.json")
+
+    server.requests.clear()
+    server.fail_ranges = {}
+    _downloader().download(server.url, str(dest), part_path=str(part))
+    assert _read(dest) == DATA
+    assert not part.exists()
+    # 只重新请求失败的区间
+    assert _range_requests(server) == [failed]
+
+
+def test_checksum_mismatch(server, tmp_path):
+    dest = tmp_path / "video.mp4"
+    with pytest.raises(ChecksumMismatchError):
+        _downloader().download(server.url, str(dest), checksum="sha256:" + "0" * 64)
+    assert not dest.exists()
+
+    checksum = "sha256:" + hashlib.sha256(DATA).hexdigest()
+    _downloader().download(server.url, str(dest), checksum=checksum)
+    assert _read(dest) == DATA
+
+
+def test_range_probe_uses_get(server):
+    # 测试服务不处理 HEAD，与不允许 HEAD 的预签名链接相同
+    assert utils.supports_range_requests(server.url)
+    assert utils.estimate_job_bytes(server.url, factor=1) == len(DATA)
+    assert server.requests == ["bytes=0-0", "bytes=0-0"]
+
+
+def test_range_probe_without_range_support(server):
+    server.ranges = False
+    assert not utils.supports_range_requests(server.url)
+    assert utils.estimate_job_bytes(server.url, factor=1) == len(DATA)
@@ -0,0 +1,74 @@
+from sentences import SEARCH_WINDOW, iter_sentence_spans
+from word_table import TranscriptTable
+
+
+def sentences(text, word_texts):
+    """第 i 个单词的时间为 [i*100, i*100+90]，返回 [(文本, 开始, 结束), ...]"""
+    words = [
+        {"text": w, "start": i * 100, "end": i * 100 + 90, "confidence": 0.9, "speaker": "A"}
+        for i, w in enumerate(word_texts)
+    ]
+    table = TranscriptTable.from_json_response(
+        {"text": text, "words": words, "utterances": [{"text": text, "speaker": "A", "words": words}]}
+    )
+    return [(s.text, s.start, s.end) for s in table.iter_sentences()]
+
+
+def test_latin_text():
+    text = "Hello world. How are you? Fine"
+    assert sentences(text, text.split()) == [
+        ("Hello world.", 0, 190),
+        ("How are you?", 200, 490),
+        ("Fine", 500, 590),
+    ]
+
+
+def test_cjk_without_spaces():
+    text = "今天天气很好。我们去公园吧！"
+    words = ["今天", "天气", "很好。", "我们", "去", "公园", "吧！"]
+    assert sentences(text, words) == [
+        ("今天天气很好。", 0, 290),
+        ("我们去公园吧！", 300, 690),
+    ]
+
+
+def test_case_mismatch_falls_back_to_joined_words():
+    # 原文与单词的大小写不一致时按单词拼接，之后能对齐的句子仍从原文截取
+    text = "hello World. It's fine, thanks."
+    words = ["Hello", "world.", "It's", "fine,", "thanks."]
+    assert sentences(text, words) == [
+        ("Hello world.", 0, 190),
+        ("It's fine,", 200, 390),
+        ("thanks.", 400, 490),
+    ]
+
+
+def test_mixed_language_join():
+    # 没有原文可对齐时按单词拼接：拉丁单词之间加空格，与中文相邻处不加
+    assert sentences("", ["我", "用", "Python", "and", "Go", "写。"]) == [("我用Python and Go写。", 0, 590)]
+
+
+def test_abbreviations_and_decimals():
+    text = "The U.S. economy grew 2.5 percent. Prices rose."
+    assert sentences(text, text.split()) == [
+        ("The U.S. economy grew 2.5 percent.", 0, 590),
+        ("Prices rose.", 600, 790),
+    ]
+
+
+def test_word_beyond_search_window():
+    # 单词在原文中的位置超出搜索窗口时不跳到远处，整句按单词拼接
+    filler = "x" * (SEARCH_WINDOW + 10)
+    text = f"Alpha {filler} beta. Gamma."
+    assert sentences(text, ["Alpha", "beta.", "Gamma."]) == [
+        ("Alpha beta.", 0, 190),
+        ("Gamma.", 200, 290),
+    ]
+
+
+def test_spans_preserve_source_spacing():
+    text = "One  two. Three"
+    assert list(iter_sentence_spans(text, ["One", "two.", "Three"])) == [
+        (0, 2, "One  two."),
+        (2, 3, "Three"),
+    ]
@@ -0,0 +1,79 @@
+import pytest
+
+from font_metrics import TextMeasurer
+from subtitle import break_lines, handle_oversize_sentences
+
+# 不读取字体文件，按内置的 Arial 字宽与东亚宽度估算
+measurer = TextMeasurer()
+
+
+def widths(lines):
+    return [measurer.width(line) for line in lines]
+
+
+def test_short_text_is_one_line():
+    text = "Hello there"
+    assert break_lines(text, measurer.width(text), 1, measurer) == [text]
+
+
+def test_balanced_two_lines():
+    text = "A hag coven can only manifest their most powerful spells"
+    max_width = measurer.width(text) * 0.7
+    lines = break_lines(text, max_width, 1, measurer)
+    assert " ".join(lines) == text
+    assert len(lines) == 2
+    first, second = widths(lines)
+    # 首次适配会把第一行填满，均衡后两行宽度差不超过一个单词
+    assert max(first, second) <= max_width
+    assert abs(first - second) <= measurer.width(" powerful")
+
+
+def test_cjk_breaks_between_characters():
+    text = "今天天气很好我们一起去公园散步吧"
+    char = measurer.width("今")
+    lines = break_lines(text, char * 10.5, 1, measurer)
+    assert lines == ["今天天气很好我们", "一起去公园散步吧"]
+
+
+def test_cjk_punctuation_stays_with_previous_character():
+    text = "今天天气很好我们一起去公园散步吗？"
+    lines = break_lines(text, measurer.width("今") * 16.5, 1, measurer)
+    assert "".join(lines) == text
+    assert not any(line.startswith("？") for line in lines)
+
+
+def test_overlong_word_is_split_evenly():
+    word = "Supercalifragilisticexpialidocious"
+    max_width = measurer.width(word) * 0.7
+    lines = break_lines(f"The word {word} is long", max_width, 1, measurer)
+    assert lines == ["The word", "Supercalifragilis", "ticexpialidocious", "is long"]
+    assert all(w <= max_width for w in widths(lines))
+
+
+def test_font_size_scales_width():
+    text = "The quick brown fox jumps over the lazy dog"
+    max_width = measurer.width(text) * 0.6
+    assert break_lines(text, max_width * 20, 20, measurer) == break_lines(text, max_width, 1, measurer)
+
+
+@pytest.mark.parametrize("ratio, count", [(0.7, 1), (0.3, 2)])
+def test_handle_oversize_sentences(ratio, count):
+    text = "What did you do to my sisters and why would you ever come back here"
+    font_size = 20
+    # 可用宽度为视频宽度减去左右边距与描边
+    video_width = measurer.width(text, font_size) * ratio + 22
+    item = {"text": text, "start": 1000, "end": 5000, "font_color": "#FF0000"}
+    result = handle_oversize_sentences([item], video_width, font_size, measurer)
+    assert len(result) == count
+    lines = [line for r in result for line in r["text"].split(r"\N")]
+    assert " ".join(lines) == text
+    assert all(len(r["text"].split(r"\N")) <= 2 for r in result)
+    # 拆分为多条时时间按行数均分、首尾相接
+    assert result[0]["start"] == 1000 and result[-1]["end"] == 5000
+    assert all(a["end"] == b["start"] for a, b in zip(result, result[1:]))
+    assert all(r["font_color"] == "#FF0000" for r in result)
+
+
+def test_fitting_sentence_is_unchanged():
+    item = {"text": "Huh?", "start": 0, "end": 500}
+    assert handle_oversize_sentences([item], 1280, 36, measurer) == [item]
@@ -0,0 +1,98 @@
+import json
+
+from word_table import TranscriptTable
+
+
+def word(text, start, speaker="A", confidence=0.91, **extra):
+    return {"text": text, "start": start, "end": start + 90, "confidence": confidence, "speaker": speaker, **extra}
+
+
+def utterance(words, speaker="A"):
+    # 每段话只有一句，分句后的 utterances 与原结果相同
+    return {
+        "speaker": speaker,
+        "text": " ".join(w["text"] for w in words),
+        "confidence": 0.9,
+        "start": words[0]["start"],
+        "end": words[-1]["end"],
+        "words": words,
+    }
+
+
+def response(utterances):
+    return {
+        "id": "t-1",
+        "status": "completed",
+        "text": " ".join(u["text"] for u in utterances),
+        "words": [w for u in utterances for w in u["words"]],
+        "utterances": utterances,
+        "audio_duration": 12,
+        "confidence": None,
+    }
+
+
+def round_trip(source, **kwargs):
+    table = TranscriptTable.from_json_response(json.loads(json.dumps(source)))
+    return json.loads("".join(table.iter_json(**kwargs)))
+
+
+def test_json_round_trip():
+    source = response(
+        [
+            utterance([word("Hello", 0), word("world.", 100)]),
+            utterance([word("你好", 200, "B"), word("世界。", 300, "B")], speaker="B"),
+        ]
+    )
+    assert round_trip(source) == source
+
+
+def test_null_confidence_and_extra_fields_are_kept():
+    source = response(
+        [
+            utterance(
+                [
+                    word("Hello", 0, confidence=None),
+                    word("there", 100, channel="2"),
+                    {"text": "again.", "start": 200, "end": 290, "confidence": 0.5},
+                ]
+            )
+        ]
+    )
+    assert round_trip(source) == source
+
+
+def test_null_words_and_projection():
+    source = response([utterance([word("Hi.", 0)])])
+    source["words"] = None
+    assert round_trip(source) == source
+    assert round_trip(source, fields={"id", "utterances"}) == {
+        "id": "t-1",
+        "utterances": source["utterances"],
+    }
+    projected = round_trip(source, include_words=False)
+    assert "words" not in projected
+    assert "words" not in projected["utterances"][0]
+
+
+def test_ndjson_matches_source():
+    source = response([utterance([word("One.", 0, confidence=None)]), utterance([word("Two.", 100)])])
+    table = TranscriptTable.from_json_response(source)
+    lines = [json.loads(line) for line in table.iter_ndjson()]
+    assert lines[0] == {
+        "type": "transcript",
+        **{k: v for k, v in source.items() if k not in ("words", "utterances")},
+    }
+    assert [
+        {k: v for k, v in line.items() if k != "type"} for line in lines[1:-1]
+    ] == source["utterances"]
+    assert lines[-1] == {"type": "end", "utterances": 2}
+
+
+def test_sentence_slices_after_full_render():
+    # 整表生成后按句截取的单词数组与原单词一致
+    words = [word("A", 0), word("b.", 100, confidence=None), word("C", 200, channel="1"), word("d.", 300)]
+    source = response([utterance(words)])
+    table = TranscriptTable.from_json_response(source)
+    assert json.loads(table.words.json(0, 4)) == words
+    sentences = list(table.iter_sentences())
+    assert [json.loads(table.words.json(s.lo, s.hi)) for s in sentences] == [words[:2], words[2:]]